@@ -50,6 +50,230 @@ def fitness_calculation(
     return 1/(1 + math.exp(pos_q_age)) * 1/(1 + math.exp(neg_q_weight))
 
 
+def fitness_array(
+        phi_age, age, a_half,
+        phi_weight, weight, w_half
+                  ):
+    """
+    Calculates fitness for many animals of one species in one call, by the
+    same formula as fitness_calculation. Animals with weight <= 0 get
+    fitness 0.
+
+    Parameters
+    ----------
+    phi_age : float
+    age : np.ndarray
+    a_half : float
+    phi_weight : float
+    weight : np.ndarray
+    w_half  : float
+
+    Returns
+    -------
+    np.ndarray
+        Values between 0 and 1 representing fitness
+
+    """
+    age = np.asarray(age, dtype=float)
+    weight = np.asarray(weight, dtype=float)
+    with np.errstate(over='ignore'):
+        pos_q_age = phi_age * (age - a_half)
+        neg_q_weight = - (phi_weight * (weight - w_half))
+        fitness = 1/(1 + np.exp(pos_q_age)) * 1/(1 + np.exp(neg_q_weight))
+
+    return np.where(weight <= 0, 0.0, fitness)
+
+
+def fitness_of(animals, parameters=None):
+    """
+    Fitness of a list of animals of the same species as an array.
+
+    Animals whose fitness is outdated are recomputed together in one call
+    to fitness_array, and the result is stored on each animal like the
+    fitness property does.
+
+    Parameters
+    ----------
+    animals : list
+        Instances of the same subclass of BaseAnimal
+    parameters : AnimalParameters or None
+        Parameters of the species, read from the class if None
+
+    Returns
+    -------
+    np.ndarray
+        Fitness in the same order as animals
+    """
+    if len(animals) == 0:
+        return np.zeros(0)
+
+    outdated = [animal for animal in animals if animal._compute_fitness]
+    if outdated:
+        species = parameters or type(outdated[0])
+        new_fitness = fitness_array(
+            species.phi_age, [animal._age for animal in outdated],
+            species.a_half, species.phi_weight,
+            [animal._weight for animal in outdated], species.w_half)
+        for animal, fitness in zip(outdated, new_fitness.tolist()):
+            animal._fitness = fitness
+            animal._compute_fitness = False
+
+    return np.array([animal._fitness for animal in animals])
+
+
+def death_mask(fitness, omega, rng=None):
+    """
+    Decides which of many animals of one species die, with one array of
+    random numbers. Same rule as BaseAnimal.death, animals with fitness 0
+    die regardless.
+
+    Parameters
+    ----------
+    fitness : np.ndarray
+    omega : float
+    rng : np.random.Generator or None
+        Random number generator, numpy.random if None
+
+    Returns
+    -------
+    np.ndarray
+        bool, True if the animal dies
+    """
+    rng = rng or np.random
+    fitness = np.asarray(fitness, dtype=float)
+    prob_to_die = omega * (1 - fitness)
+    dies = rng.random(len(fitness)) < prob_to_die
+    return dies | (fitness <= 0)
+
+
+def birth_arrays(age, weight, fitness, num_same_species, species,
+                 rng=None):
+    """
+    Decides which of many animals of one species give birth, and the
+    weight of each newborn, by the same rules as BaseAnimal.birth.
+
+    An animal can give birth if its age is above 0, there is at least one
+    other animal of the species in the cell and it weighs at least
+    zeta * (w_birth + phi_weight). It then does so with probability
+    min(1, gamma * fitness * (N - 1)), unless the newborn is heavier than
+    the mother can lose (xi * newborn weight).
+
+    Parameters
+    ----------
+    age : np.ndarray
+    weight : np.ndarray
+    fitness : np.ndarray
+    num_same_species : np.ndarray or int
+        Number of animals of the species in the animal's cell
+    species : class
+        Subclass of BaseAnimal holding the parameters
+    rng : np.random.Generator or None
+        Random number generator, numpy.random if None
+
+    Returns
+    -------
+    parents : np.ndarray
+        int, index of each animal that gives birth
+    newborn_weight : np.ndarray
+        float, weight of the newborn of each parent, the mother loses
+        xi times this
+    """
+    rng = rng or np.random
+    age = np.asarray(age)
+    weight = np.asarray(weight, dtype=float)
+    fitness = np.asarray(fitness, dtype=float)
+    mates = np.asarray(num_same_species) - 1
+
+    prob_to_birth = np.minimum(1, species.gamma * fitness * mates)
+    can_birth = ((age > 0) & (mates > 0) &
+                 (weight >= species.zeta * (species.w_birth +
+                                            species.phi_weight)))
+    gives_birth = can_birth & (rng.random(len(weight)) < prob_to_birth)
+    parents = np.flatnonzero(gives_birth)
+
+    newborn_weight = rng.normal(species.w_birth, species.sigma_birth,
+                                len(parents))
+    newborn_weight[newborn_weight < 0] = 0
+    enough_weight = weight[parents] >= species.xi * newborn_weight
+
+    return parents[enough_weight], newborn_weight[enough_weight]
+
+
+def hunting(carn_age, carn_weight, carn_fitness,
+            herb_fitness, herb_weight, species, rng=None):
+    """
+    Carnivores of one cell hunt on the herbivores of the cell, by the same
+    rules as Carnivore.feed.
+
+    The herbivores keep one order for all carnivores, killed ones are only
+    marked. A table pointing to the next herbivore still alive lets each
+    carnivore skip the killed ones without scanning them again.
+
+    Parameters
+    ----------
+    carn_age : array_like
+    carn_weight : array_like
+    carn_fitness : array_like
+        Carnivores in the order they hunt, fittest first
+    herb_fitness : array_like
+    herb_weight : array_like
+        Herbivores in ascending order by fitness
+    species : class
+        Carnivore or other class holding the parameters
+    rng : np.random.Generator or None
+        Random number generator, numpy.random if None
+
+    Returns
+    -------
+    killed : np.ndarray
+        bool, True for each herbivore that was eaten
+    carn_weight : np.ndarray
+        float, new weight of each carnivore
+    """
+    rng = rng or np.random
+    carn_weight = [float(weight) for weight in carn_weight]
+    herb_fitness = [float(fitness) for fitness in herb_fitness]
+    herb_weight = [float(weight) for weight in herb_weight]
+    num_herbivores = len(herb_fitness)
+    killed = np.zeros(num_herbivores, dtype=bool)
+    next_alive = list(range(num_herbivores + 1))
+
+    def find_alive(index):
+        """First herbivore still alive at or after index"""
+        root = index
+        while next_alive[root] != root:
+            root = next_alive[root]
+        while next_alive[index] != root:
+            next_alive[index], index = root, next_alive[index]
+        return root
+
+    for carn, fitness in enumerate(carn_fitness):
+        eaten = 0
+        herb = find_alive(0)
+        while herb < num_herbivores:
+            if eaten >= species.F:
+                break
+            difference = fitness - herb_fitness[herb]
+            if difference <= 0:
+                break
+            if (species.DeltaPhiMax < difference or
+                    rng.random() < difference / species.DeltaPhiMax):
+                meat = herb_weight[herb]
+                carn_weight[carn] += species.beta * min(meat,
+                                                        species.F - eaten)
+                eaten += meat
+                killed[herb] = True
+                next_alive[herb] = herb + 1
+                fitness = fitness_calculation(
+                    species.phi_age, carn_age[carn], species.a_half,
+                    species.phi_weight, carn_weight[carn], species.w_half)
+            herb += 1
+            if next_alive[herb] != herb:
+                herb = find_alive(herb)
+
+    return killed, np.array(carn_weight)
+
+
 class BaseAnimal:
     """
     Baseclass for all animals
@@ -583,8 +807,8 @@ class Carnivore(BaseAnimal):
         Cannot eat animals with greater fitness than themselves.
         Stops feeding when F(appetite) is met.
 
-        Creates deletion list with Herbivores, then removes them
-        and returns updated list of herbivores.
+        Kills are marked by hunting, then the list is compacted once, in
+        place, and returned.
 
         Parameters
         ----------
@@ -597,28 +821,17 @@ class Carnivore(BaseAnimal):
             The same list as input, killed herbivores removed
 
         """
-        eaten = 0
-        deletion_list = []
-        for herbivore in list_herbivores_least_fit:
-            if eaten >= self.F:
-                break
-
-            if self.fitness <= herbivore.fitness:
-                break  # kunne breaka
-
-            if self.DeltaPhiMax < self.fitness - herbivore.fitness:
-                self.eat(herbivore.weight, eaten)
-                eaten += herbivore.weight
-                deletion_list.append(herbivore)
-
-            else:
-                if self.kill_or_not(herbivore):
-                    self.eat(herbivore.weight, eaten)
-                    eaten += herbivore.weight
-                    deletion_list.append(herbivore)
-
-        for herbivore in deletion_list:
-            list_herbivores_least_fit.remove(herbivore)
+        killed, weight = hunting(
+            [self.age], [self.weight], [self.fitness],
+            fitness_of(list_herbivores_least_fit),
+            [herbivore.weight for herbivore in list_herbivores_least_fit],
+            type(self))
+        if killed.any():
+            self.weight = weight[0]
+            list_herbivores_least_fit[:] = [
+                herbivore for herbivore, dead
+                in zip(list_herbivores_least_fit, killed.tolist())
+                if not dead]
         return list_herbivores_least_fit
 
 
@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*-
+
+"""
+"""
+
+__author__ = "Jon-Mikkel Korsvik & Petter Bøe Hørtvedt"
+__email__ = "jonkors@nmbu.no & petterho@nmbu.no"
+
+import math
+import numpy as np
+from numba import jit
+from .island import ColumnarIsland
+
+
+@jit(nopython=True)
+def seed_kernels(seed):
+    """
+    Seeds the random number generator used inside compiled kernels, which
+    is separate from numpy.random and the generator of the island.
+
+    Parameters
+    ----------
+    seed : int
+    """
+    np.random.seed(seed)
+
+
+@jit(nopython=True)
+def fitness_kernel(age, weight, phi_age, a_half, phi_weight, w_half):
+    """
+    Fitness of every animal, same formula as fitness_calculation, 0 for
+    animals with weight <= 0.
+
+    Parameters
+    ----------
+    age : np.ndarray
+    weight : np.ndarray
+    phi_age : float
+    a_half : float
+    phi_weight : float
+    w_half : float
+
+    Returns
+    -------
+    np.ndarray
+        float
+    """
+    fitness = np.zeros(len(age))
+    for index in range(len(age)):
+        if weight[index] > 0:
+            fitness[index] = (
+                1 / (1 + math.exp(phi_age * (age[index] - a_half)))
+                / (1 + math.exp(-phi_weight * (weight[index] - w_half))))
+    return fitness
+
+
+@jit(nopython=True)
+def graze_kernel(cell, weight, fodder, appetite, beta):
+    """
+    Herbivores eat in the given order, each takes its appetite or what is
+    left in its cell. Changes weight and fodder in place.
+
+    Parameters
+    ----------
+    cell : np.ndarray
+        int, sorted by cell with the fittest animal first in each cell
+    weight : np.ndarray
+    fodder : np.ndarray
+        Indexed by flat cell index
+    appetite : float
+    beta : float
+    """
+    for index in range(len(cell)):
+        eaten = min(appetite, fodder[cell[index]])
+        if eaten > 0:
+            fodder[cell[index]] -= eaten
+            weight[index] += beta * eaten
+
+
+@jit(nopython=True)
+def hunt_kernel(herb_cell, herb_fitness, herb_weight,
+                carn_cell, carn_age, carn_weight, carn_fitness,
+                appetite, beta, delta_phi_max,
+                phi_age, a_half, phi_weight, w_half):
+    """
+    Carnivores hunt in their cell by the same rules as hunting, for all
+    cells in one pass. Changes carn_weight in place.
+
+    Parameters
+    ----------
+    herb_cell : np.ndarray
+    herb_fitness : np.ndarray
+    herb_weight : np.ndarray
+        Herbivores sorted by cell, in ascending order of fitness in
+        each cell
+    carn_cell : np.ndarray
+    carn_age : np.ndarray
+    carn_weight : np.ndarray
+    carn_fitness : np.ndarray
+        Carnivores sorted by cell, fittest first in each cell
+    appetite : float
+    beta : float
+    delta_phi_max : float
+    phi_age : float
+    a_half : float
+    phi_weight : float
+    w_half : float
+
+    Returns
+    -------
+    np.ndarray
+        bool, True for each herbivore that was eaten
+    """
+    num_herbivores = len(herb_cell)
+    killed = np.zeros(num_herbivores, dtype=np.bool_)
+    first_herb = 0
+    for carn in range(len(carn_cell)):
+        cell = carn_cell[carn]
+        while first_herb < num_herbivores and herb_cell[first_herb] < cell:
+            first_herb += 1
+
+        eaten = 0.0
+        fitness = carn_fitness[carn]
+        herb = first_herb
+        while herb < num_herbivores and herb_cell[herb] == cell:
+            if killed[herb]:
+                herb += 1
+                continue
+            if eaten >= appetite:
+                break
+            difference = fitness - herb_fitness[herb]
+            if difference <= 0:
+                break
+            if (delta_phi_max < difference or
+                    np.random.random() < difference / delta_phi_max):
+                meat = herb_weight[herb]
+                carn_weight[carn] += beta * min(meat, appetite - eaten)
+                eaten += meat
+                killed[herb] = True
+                fitness = (
+                    1 / (1 + math.exp(phi_age * (carn_age[carn] - a_half)))
+                    / (1 + math.exp(-phi_weight
+                                    * (carn_weight[carn] - w_half))))
+            herb += 1
+    return killed
+
+
+@jit(nopython=True)
+def birth_kernel(cell, age, weight, fitness, num_per_cell,
+                 gamma, zeta, w_birth, sigma_birth, phi_weight, xi):
+    """
+    Birth by the same rules as birth_arrays. The mothers lose xi times
+    the weight of their newborn in place.
+
+    Parameters
+    ----------
+    cell : np.ndarray
+    age : np.ndarray
+    weight : np.ndarray
+    fitness : np.ndarray
+    num_per_cell : np.ndarray
+        Number of animals of the species in each cell
+    gamma : float
+    zeta : float
+    w_birth : float
+    sigma_birth : float
+    phi_weight : float
+    xi : float
+
+    Returns
+    -------
+    born_cell : np.ndarray
+        int, flat cell index of each newborn
+    newborn_weight : np.ndarray
+        float
+    """
+    born_cell = np.zeros(len(cell), dtype=np.int64)
+    newborn_weight = np.zeros(len(cell))
+    num_born = 0
+    min_weight = zeta * (w_birth + phi_weight)
+    for index in range(len(cell)):
+        mates = num_per_cell[cell[index]] - 1
+        if age[index] <= 0 or mates <= 0 or weight[index] < min_weight:
+            continue
+        if np.random.random() >= min(1.0, gamma * fitness[index] * mates):
+            continue
+        newborn = max(np.random.normal(w_birth, sigma_birth), 0.0)
+        if weight[index] >= xi * newborn:
+            weight[index] -= xi * newborn
+            born_cell[num_born] = cell[index]
+            newborn_weight[num_born] = newborn
+            num_born += 1
+    return born_cell[:num_born], newborn_weight[:num_born]
+
+
+@jit(nopython=True)
+def migrate_kernel(cell, fitness, mu, probabilities, neighbours):
+    """
+    Each animal moves with probability fitness * mu, to a neighbour drawn
+    from the probabilities of its cell. Changes cell in place.
+
+    Parameters
+    ----------
+    cell : np.ndarray
+    fitness : np.ndarray
+    mu : float
+    probabilities : np.ndarray
+        (num_cells, 4), from migration_probabilities
+    neighbours : np.ndarray
+        (num_cells, 4), flat cell index of the neighbours
+    """
+    for index in range(len(cell)):
+        if np.random.random() >= fitness[index] * mu:
+            continue
+        origin = cell[index]
+        random_number = np.random.random()
+        cumulative = 0.0
+        choice = -1
+        for direction in range(4):
+            probability = probabilities[origin, direction]
+            if probability > 0:
+                choice = direction
+                cumulative += probability
+                if random_number < cumulative:
+                    break
+        if choice >= 0:
+            cell[index] = neighbours[origin, choice]
+
+
+@jit(nopython=True)
+def death_kernel(fitness, omega):
+    """
+    Which animals die, by the same rule as death_mask.
+
+    Parameters
+    ----------
+    fitness : np.ndarray
+    omega : float
+
+    Returns
+    -------
+    np.ndarray
+        bool
+    """
+    dies = np.zeros(len(fitness), dtype=np.bool_)
+    for index in range(len(fitness)):
+        dies[index] = (fitness[index] <= 0 or
+                       np.random.random() < omega * (1 - fitness[index]))
+    return dies
+
+
+@jit(nopython=True)
+def age_kernel(age, weight, eta):
+    """
+    Adds one year to the age and takes the yearly weight loss, in place.
+
+    Parameters
+    ----------
+    age : np.ndarray
+    weight : np.ndarray
+    eta : float
+    """
+    for index in range(len(age)):
+        age[index] += 1
+        weight[index] -= eta * weight[index]
+
+
+class CompiledIsland(ColumnarIsland):
+    """
+    Columnar island where the phases of the year run as compiled numba
+    kernels, one loop over the animals each.
+
+    The kernels draw from the random number generator of numba, which is
+    seeded from the generator of the island every year, so a run is
+    reproducible for the same seed and continues the same way from a
+    checkpoint. The first year takes longer, while the kernels are
+    compiled.
+    """
+
+    def update_fitness(self):
+        """Recomputes the fitness column of both species"""
+        for _, population in self.populations():
+            self.update_population_fitness(population)
+
+    @staticmethod
+    def update_population_fitness(population):
+        """
+        Recomputes the fitness column of one species with fitness_kernel.
+
+        Parameters
+        ----------
+        population : Population
+        """
+        parameters = population.parameters
+        population.fitness = fitness_kernel(
+            population.age, population.weight, parameters.phi_age,
+            parameters.a_half, parameters.phi_weight, parameters.w_half)
+
+    def simulate_one_year(self):
+        """
+        Seeds the kernels from the generator of the island, then simulates
+        the year like Island.
+        """
+        seed_kernels(int(self.rng.integers(2 ** 31)))
+        super().simulate_one_year()
+
+    def feed_herbivores(self):
+        """Herbivores eat fodder, fittest in each cell first"""
+        herbs = self.herbivores
+        if len(herbs) == 0:
+            return
+        self.update_population_fitness(herbs)
+        herbs.keep(np.lexsort((-herbs.fitness, herbs.cell)))
+        graze_kernel(herbs.cell, herbs.weight, self.fodder,
+                     herbs.parameters.F, herbs.parameters.beta)
+
+    def feed_carnivores(self):
+        """
+        Carnivores hunt in each cell, fittest first, on the herbivores
+        sorted in ascending order of fitness.
+        """
+        herbs = self.herbivores
+        carns = self.carnivores
+        if len(herbs) == 0 or len(carns) == 0:
+            return
+        self.update_population_fitness(herbs)
+        self.update_population_fitness(carns)
+        herbs.keep(np.lexsort((herbs.fitness, herbs.cell)))
+        carns.keep(np.lexsort((-carns.fitness, carns.cell)))
+
+        parameters = carns.parameters
+        killed = hunt_kernel(
+            herbs.cell, herbs.fitness, herbs.weight,
+            carns.cell, carns.age, carns.weight, carns.fitness,
+            parameters.F, parameters.beta, parameters.DeltaPhiMax,
+            parameters.phi_age, parameters.a_half, parameters.phi_weight,
+            parameters.w_half)
+        herbs.keep(~killed)
+
+    def migrate(self):
+        """
+        Every animal migrates with probability fitness * mu to one of the
+        four neighbouring cells, with the probabilities of its cell from
+        before migration.
+        """
+        probabilities = self.migration_probabilities()
+        for name, population in self.populations():
+            self.update_population_fitness(population)
+            migrate_kernel(population.cell, population.fitness,
+                           population.parameters.mu, probabilities[name],
+                           self.neighbours)
+
+    def _procreate_population(self, population):
+        """
+        Birth phase for one species.
+
+        Parameters
+        ----------
+        population : Population
+
+        Returns
+        -------
+        np.ndarray
+            int, flat cell index of each newborn
+        """
+        parameters = population.parameters
+        self.update_population_fitness(population)
+        born_cells, newborn_weight = birth_kernel(
+            population.cell, population.age, population.weight,
+            population.fitness, population.count_per_cell(self.num_cells),
+            parameters.gamma, parameters.zeta, parameters.w_birth,
+            parameters.sigma_birth, parameters.phi_weight, parameters.xi)
+        population.add(np.zeros(len(born_cells), dtype=np.int64),
+                       newborn_weight, born_cells)
+        return born_cells
+
+    def age_animals(self):
+        """Ages all animals and takes the yearly weight loss"""
+        for _, population in self.populations():
+            age_kernel(population.age, population.weight,
+                       population.parameters.eta)
+
+    def lose_weight(self):
+        """Weight loss is taken in age_animals"""
+        pass
+
+    def die(self):
+        """
+        Animals die with probability omega * (1 - fitness), or for sure
+        if fitness is 0. Adds dead to stats.
+        """
+        for name, population in self.populations():
+            self.update_population_fitness(population)
+            dies = death_kernel(
+                population.fitness, population.parameters.omega
+            )
+            if self._store_stats:
+                self.add_stats('death', name, population.cell[dies])
+            population.keep(~dies)
+
+
+if __name__ == '__main__':
+    pass
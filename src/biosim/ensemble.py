@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+"""
+"""
+
+__author__ = "Jon-Mikkel Korsvik & Petter Bøe Hørtvedt"
+__email__ = "jonkors@nmbu.no & petterho@nmbu.no"
+
+import itertools
+import multiprocessing
+import numpy as np
+from .simulation import BioSim
+from .island import Island
+
+
+def configuration_grid(seeds, animal_parameters=(None,),
+                       landscape_parameters=(None,), **bio_sim_kwargs):
+    """
+    Every combination of seed, animal parameters and landscape
+    parameters, as configurations for Ensemble.
+
+    Parameters
+    ----------
+    seeds : iterable
+        int
+    animal_parameters : iterable
+        dicts of species name to parameters, or None for the defaults
+    landscape_parameters : iterable
+        dicts of landscape letter to parameters, or None for the defaults
+    bio_sim_kwargs
+        Passed to BioSim in every configuration, like island_map, ini_pop
+        or engine
+
+    Returns
+    -------
+    list of dict
+    """
+    configurations = []
+    for seed, animal, landscape in itertools.product(
+            seeds, animal_parameters, landscape_parameters):
+        configuration = dict(bio_sim_kwargs, seed=seed)
+        configuration['animal_parameters'] = animal or {}
+        configuration['landscape_parameters'] = landscape or {}
+        configurations.append(configuration)
+    return configurations
+
+
+def run_configuration(index, configuration, num_years, defaults,
+                      queue=None):
+    """
+    Runs one configuration in this process. The simulation starts from
+    the default parameters and the parameters of the configuration are
+    set on it only, so runs that share a worker process do not see each
+    other's parameters.
+
+    Parameters
+    ----------
+    index : int
+        Index of the configuration, sent with every year
+    configuration : dict
+        BioSim keyword arguments, and optionally animal_parameters and
+        landscape_parameters
+    num_years : int
+    defaults : dict
+        From Island.default_parameters, taken in the main process
+    queue : multiprocessing queue or None
+        If given, (index, year, herbivores, carnivores) is put on it every
+        year, and (index, None, None, None) when the run is done
+
+    Returns
+    -------
+    np.ndarray
+        int, shape (num_years + 1, 2), number of herbivores and carnivores
+        each year, starting with the initial population
+    """
+    configuration = dict(configuration)
+    animal_parameters = configuration.pop('animal_parameters', {})
+    landscape_parameters = configuration.pop('landscape_parameters', {})
+    try:
+        sim = BioSim(**configuration)
+        sim.island.update_parameters(defaults)
+        for species, params in animal_parameters.items():
+            sim.set_animal_parameters(species, params)
+        for landscape, params in landscape_parameters.items():
+            sim.set_landscape_parameters(landscape, params)
+
+        series = np.zeros((num_years + 1, 2), dtype=int)
+        for year in range(num_years + 1):
+            if year > 0:
+                sim.island.simulate_one_year()
+            counts = sim.num_animals_per_species
+            series[year] = counts['Herbivore'], counts['Carnivore']
+            if queue is not None:
+                queue.put((index, year, *series[year].tolist()))
+        return series
+    finally:
+        if queue is not None:
+            queue.put((index, None, None, None))
+
+
+class Ensemble:
+    """
+    Runs many configurations of BioSim, like different seeds and
+    parameters, across a pool of processes.
+
+    Every run sets its own parameters on its own simulation, starting
+    from the default parameters of the main process when the Ensemble was
+    made, so configurations cannot change each other's parameters. Engines that
+    start processes of their own, like 'parallel', cannot run in the pool
+    and are refused with a ValueError, as are unknown engines.
+
+    Parameters
+    ----------
+    configurations : list of dict
+        BioSim keyword arguments, and optionally animal_parameters
+        (species name to dict) and landscape_parameters (letter to dict),
+        see configuration_grid
+    num_years : int
+    num_workers : int or None
+        Number of processes, None uses one per CPU
+
+    Methods
+    -------
+    stream
+    run
+    """
+    unpooled_engines = ('parallel',)
+
+    def __init__(self, configurations, num_years, num_workers=None):
+        """
+        Initializes the ensemble, nothing runs before stream or run
+
+        Parameters
+        ----------
+        configurations : list of dict
+        num_years : int
+        num_workers : int or None
+        """
+        for configuration in configurations:
+            engine = configuration.get('engine', 'object')
+            if engine not in BioSim.engines:
+                raise ValueError('Unknown engine: ' + str(engine))
+            if engine in self.unpooled_engines:
+                raise ValueError('Engine cannot run in the pool: ' +
+                                 str(engine))
+        self.configurations = list(configurations)
+        self.num_years = num_years
+        self.num_workers = num_workers
+        self.defaults = Island.default_parameters()
+
+    def stream(self):
+        """
+        Runs all configurations and yields the population of every run and
+        year as soon as a worker has simulated it. Runs are interleaved.
+
+        Yields
+        ------
+        tuple
+            (index of configuration, year, herbivores, carnivores)
+        """
+        with multiprocessing.Manager() as manager, \
+                multiprocessing.Pool(self.num_workers) as pool:
+            queue = manager.Queue()
+            results = [pool.apply_async(
+                run_configuration,
+                (index, configuration, self.num_years, self.defaults, queue))
+                for index, configuration in enumerate(self.configurations)]
+
+            running = len(results)
+            while running > 0:
+                index, year, herbivores, carnivores = queue.get()
+                if year is None:
+                    running -= 1
+                    results[index].get()
+                    continue
+                yield index, year, herbivores, carnivores
+
+    def run(self):
+        """
+        Runs all configurations and collects the yearly populations.
+
+        Returns
+        -------
+        np.ndarray
+            int, shape (num_configurations, num_years + 1, 2), number of
+            herbivores and carnivores of each run and year
+        """
+        series = np.zeros((len(self.configurations), self.num_years + 1, 2),
+                          dtype=int)
+        for index, year, herbivores, carnivores in self.stream():
+            series[index, year] = herbivores, carnivores
+        return series
+
+
+if __name__ == '__main__':
+    pass
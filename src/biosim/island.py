@@ -7,6 +7,12 @@ __author__ = "Jon-Mikkel Korsvik & Petter Bøe Hørtvedt"
 __email__ = "jonkors@nmbu.no & petterho@nmbu.no"
 
 from .landscape import *
+from .population import Population, cell_slices
+from .parameters import AnimalParameters, LandscapeParameters
+from .stats import StatsFile, weight_age_sums, SPECIES
+from .animals import (
+    fitness_of, death_mask, birth_arrays, hunting
+)
 
 
 def check_length(lines):
@@ -41,26 +47,72 @@ class Island:
         Multiple lines of string with characters representing cell type
     ini_pop : dict
         Key: location - Value: list of dict of species, age, and weight
+    store_stats : bool
+    rng : np.random.Generator or None
+        Random number generator for every random draw of the island, a
+        new one seeded from numpy.random if None
 
 
     Attributes
     ----------
     map : dict
         calls method make_map, map creation from a multilinestring
+    cells : list
+        The same instances as in map, indexed by flat cell index
+        (y * len_map_x + x)
+    neighbours : np.ndarray
+        Flat cell index of the cells North, South, West and East of each
+        cell, made once by make_map
+    landscape : np.ndarray
+        int, shape (len_map_y, len_map_x), code of the landscape type of
+        each cell, the index of its class in landscape_types
+    landscape_types : list
+        Classes of landscape in the order of map_params
+    parameters : dict
+        Parameters of this island, key : species name or landscape letter,
+        value : AnimalParameters or LandscapeParameters. Taken from the
+        class attributes when the island is made, after that only changed
+        by set_animal_parameters and set_landscape_parameters, so islands
+        in the same process do not share parameters. The cells share this
+        dict
+    rng : np.random.Generator
+        Random number generator of the island, shared with the cells
+    fodder : np.ndarray
+        float, fodder of each cell by flat cell index. The cells read and
+        write their fodder in this array
+    passable_cells : np.ndarray
+        int, flat cell index of the passable cells in ascending order. The
+        yearly phases only go through these cells
     herbivore_tot_data : list
         Total number of herbivores indexed by year
     carnivore_tot_data : list
         Total number of carnivore indexed by year
-    stats : dict
-        multiple nested dicts, stores all data on dead/ born animals.
+    stats : dict or None
+        Table of the current year when store_stats is True. 'year',
+        'alive' : np.ndarray with the number of animals of each species
+        at the start of the year, 'birth' and 'death' : np.ndarray of shape
+        (num_cells, number of species), by flat cell index and species in
+        the order of stats.SPECIES. Allocated once, zeroed every year and
+        written to stats_file at the end of the year
+    stats_file : StatsFile or None
+        Births and deaths per cell and summary of every year, when
+        store_stats is True
+    double_buffered : bool
+        Class attribute. If True, migrate collects the arriving animals in
+        a separate buffer and adds them to their new cells when all cells
+        are done, so nobody can move twice and no moved flags are needed.
+        If False, animals are added to their new cells at once and the
+        has_moved flag of each animal keeps them from moving again
     """
     map_params = {'O': Ocean,
                   'M': Mountain,
                   'D': Desert,
                   'S': Savanna,
                   'J': Jungle}
+    double_buffered = True
 
-    def __init__(self, island_map_string, ini_pop, store_stats=False):
+    def __init__(self, island_map_string, ini_pop, store_stats=False,
+                 rng=None):
         """
         Initializes instance of Island
 
@@ -71,9 +123,21 @@ class Island:
         ini_pop : dict
             key : location - Value : list of dict
         store_stats : bool
+        rng : np.random.Generator or None
         """
         self.len_map_x = None
         self.len_map_y = None
+        self.cells = []
+        self.neighbours = None
+        self.landscape = None
+        self.landscape_types = list(self.map_params.values())
+        self.parameters = self.default_parameters()
+        self.rng = rng or np.random.default_rng(np.random.randint(2 ** 31))
+        self.fodder = None
+        self.passable_cells = None
+        self._animal_count = None
+        self._density = None
+        self._landscape_raster = None
 
         self.map = self.make_map(island_map_string)
         self.add_population(ini_pop)
@@ -84,8 +148,10 @@ class Island:
         self.update_data_list()
 
         self._store_stats = store_stats
+        self.stats = None
+        self.stats_file = None
         if store_stats:
-            self.stats = {}
+            self.stats_file = StatsFile()
             self.create_and_update_stats_structure()
 
     @property
@@ -107,36 +173,328 @@ class Island:
         """
         Number of animals per species in island, as dictionary.
 
+        The cells are only counted after reset_animal_count, the phases
+        of the year keep the count up to date with the born, dead and
+        killed animals.
+
         Returns
         -------
         num_animals_per_species : dictionary
         """
-        num_animals_per_species = {}
-        num_herbivores = 0
-        num_carnivores = 0
+        if self._animal_count is None:
+            num_herbivores = 0
+            num_carnivores = 0
+            for _, cell in self.live_cells():
+                num_herbivores += cell.num_herbivores
+                num_carnivores += cell.num_carnivores
+            self._animal_count = {'Herbivore': num_herbivores,
+                                  'Carnivore': num_carnivores}
+
+        return dict(self._animal_count)
+
+    def reset_animal_count(self):
+        """
+        Clears the count of animals per species, so the cells are counted
+        again. Needed after animals are added to or removed from cells
+        outside the phases of the year.
+        """
+        self._animal_count = None
+
+    def change_animal_count(self, species, change):
+        """
+        Adds change to the count of animals of species, if counted.
+
+        Parameters
+        ----------
+        species : str
+        change : int
+        """
+        if self._animal_count is not None:
+            self._animal_count[species] += change
+
+    @property
+    def num_animals_per_cell(self):
+        """
+        Number of animals per species in each cell, as dictionary of
+        arrays indexed by [y, x].
+
+        Returns
+        -------
+        num_animals_per_cell : dictionary
+            key : species, value : np.ndarray
+        """
+        density = self.density
+        return {name: density[column].copy()
+                for column, name in enumerate(SPECIES)}
+
+    @property
+    def density(self):
+        """
+        Number of animals of each species in each cell, as one array of
+        shape (species, y, x), with the species in the order of
+        stats.SPECIES. The same array is filled in place every time, so
+        it can be shown as it is, copy it to keep the counts of a year.
+
+        Returns
+        -------
+        density : np.ndarray
+            int
+        """
+        if self._density is None:
+            self._density = np.zeros(
+                (len(SPECIES), self.len_map_y, self.len_map_x), dtype=int)
+        self.count_density(self._density.reshape(len(SPECIES), -1))
+        return self._density
+
+    def count_density(self, counts):
+        """
+        Counts the animals of each species in each cell, in one pass over
+        the passable cells.
+
+        Parameters
+        ----------
+        counts : np.ndarray
+            int, shape (species, num_cells), filled in place
+        """
+        per_cell = np.array([(cell.num_herbivores, cell.num_carnivores)
+                             for _, cell in self.live_cells()], dtype=int)
+        counts.fill(0)
+        counts[:, self.passable_cells] = per_cell.reshape(-1, 2).T
+
+    @property
+    def num_cells(self):
+        """Number of cells in map"""
+        return self.len_map_y * self.len_map_x
+
+    def flat_index(self, pos):
+        """Flat cell index of position (y, x)"""
+        y_cord, x_cord = pos
+        return y_cord * self.len_map_x + x_cord
+
+    def position(self, index):
+        """Position (y, x) of flat cell index"""
+        return divmod(int(index), self.len_map_x)
+
+    @classmethod
+    def default_parameters(cls):
+        """
+        Parameters for a new island, from the class attributes of the
+        species and landscape types.
+
+        Returns
+        -------
+        dict
+            key : species name or landscape letter, value : AnimalParameters
+            or LandscapeParameters
+        """
+        parameters = {'Herbivore': AnimalParameters.from_class(Herbivore),
+                      'Carnivore': AnimalParameters.from_class(Carnivore)}
+        for letter, landscape_type in cls.map_params.items():
+            parameters[letter] = LandscapeParameters.from_class(
+                landscape_type)
+        return parameters
+
+    def update_parameters(self, parameters):
+        """
+        Replaces parameters of this island.
+
+        Parameters
+        ----------
+        parameters : dict
+            key : species name or landscape letter, value : AnimalParameters
+            or LandscapeParameters
+        """
+        self.parameters.update(parameters)
+        self.update_passable_cells()
+
+    def set_animal_parameters(self, species, params):
+        """
+        Sets parameters of a species on this island only. Raises KeyError
+        for unknown species, TypeError for unknown parameters and
+        ValueError for values that are not valid.
+
+        Parameters
+        ----------
+        species : str
+            'Herbivore' or 'Carnivore'
+        params : dict
+            Parameter names and new values
+        """
+        if species not in ('Herbivore', 'Carnivore'):
+            raise KeyError(f'{species} is not a species')
+        self.update_parameters(
+            {species: self.parameters[species].replace(**params)})
+
+    def set_landscape_parameters(self, landscape, params):
+        """
+        Sets parameters of a landscape type on this island only. Raises
+        KeyError for unknown letters, TypeError for unknown parameters and
+        ValueError for values that are not valid.
+
+        Parameters
+        ----------
+        landscape : str
+            Letter of the landscape type in map_params
+        params : dict
+            Parameter names and new values
+        """
+        if landscape not in self.map_params:
+            raise KeyError(f'{landscape} is not a landscape type')
+        self.update_parameters(
+            {landscape: self.parameters[landscape].replace(**params)})
+
+    def cell_parameter(self, name):
+        """
+        Parameter of the landscape type of each cell, like f_max, alpha
+        or passable, read from the parameters of the island.
 
-        for cell in self.map.values():
-            num_herbivores += cell.num_herbivores
-            num_carnivores += cell.num_carnivores
+        Parameters
+        ----------
+        name : str
+            Name of the parameter
 
-        num_animals_per_species['Herbivore'] = num_herbivores
-        num_animals_per_species['Carnivore'] = num_carnivores
+        Returns
+        -------
+        np.ndarray
+            Indexed by flat cell index
+        """
+        values = np.array([getattr(self.parameters[letter], name)
+                           for letter in self.map_params])
+        return values[self.landscape.ravel()]
 
-        return num_animals_per_species
+    def grow_fodder(self):
+        r"""
+        Grows the fodder of all cells in one array operation, with f_max
+        and growth rate of the landscape types of this year.
+
+        .. math::
+
+            f \leftarrow f_{max} - (1 - r)(f_{max} - f)
+
+        where r is alpha for savanna, 1 for jungle and 0 where nothing
+        grows.
+        """
+        rates = np.array([landscape_type.growth_rate(self.parameters[letter])
+                          for letter, landscape_type
+                          in self.map_params.items()])
+        f_max = self.cell_parameter('f_max')
+        self.fodder[:] = f_max - ((1 - rates[self.landscape.ravel()])
+                                  * (f_max - self.fodder))
+
+    def update_passable_cells(self):
+        """Finds the flat cell index of all passable cells"""
+        self.passable_cells = np.flatnonzero(self.cell_parameter('passable'))
+
+    def live_cells(self):
+        """
+        The passable cells, the only cells animals can live in.
+
+        Returns
+        -------
+        list of tuples
+            (flat cell index, cell)
+        """
+        return [(index, self.cells[index])
+                for index in self.passable_cells.tolist()]
 
     def create_and_update_stats_structure(self):
-        """Creates data structure for stats"""
-        all_herbs = self.num_animals_per_species['Herbivore']
-        all_carns = self.num_animals_per_species['Carnivore']
-
-        for pos in self.map.keys():
-            self.stats[self.year] = {'Herbivore': {'death': {pos: []},
-                                                   'birth': {pos: []},
-                                                   'alive': all_herbs},
-                                     'Carnivore': {'death': {pos: []},
-                                                   'birth': {pos: []},
-                                                   'alive': all_carns}
-                                     }
+        """
+        Starts the stats table of the year: allocated the first time,
+        after that zeroed in place.
+        """
+        if self.stats is None:
+            shape = (self.num_cells, len(SPECIES))
+            self.stats = {'year': self.year,
+                          'alive': np.zeros(len(SPECIES), dtype=np.int64),
+                          'birth': np.zeros(shape, dtype=np.int64),
+                          'death': np.zeros(shape, dtype=np.int64)}
+        self.stats['year'] = self.year
+        animals_per_species = self.num_animals_per_species
+        self.stats['alive'][:] = [animals_per_species[name]
+                                  for name in SPECIES]
+        self.stats['birth'].fill(0)
+        self.stats['death'].fill(0)
+
+    def map_string(self):
+        """
+        The map as multilinestring, made from the landscape codes.
+
+        Returns
+        -------
+        str
+        """
+        letters = list(self.map_params)
+        return '\n'.join(''.join(letters[code] for code in row)
+                         for row in self.landscape.tolist())
+
+    def landscape_raster(self, palette):
+        """
+        Image of the landscape, one color per landscape type. Made once
+        from the landscape codes and kept on the island, so every figure
+        of the island shares the same read-only array.
+
+        Parameters
+        ----------
+        palette : np.ndarray
+            uint8, shape (len(landscape_types), 3), RGB of each type
+
+        Returns
+        -------
+        np.ndarray
+            uint8, shape (len_map_y, len_map_x, 3)
+        """
+        palette = np.asarray(palette, dtype=np.uint8)
+        key = palette.tobytes()
+        if self._landscape_raster is None or \
+                self._landscape_raster[0] != key:
+            raster = palette[self.landscape]
+            raster.flags.writeable = False
+            self._landscape_raster = key, raster
+        return self._landscape_raster[1]
+
+    def write_stats(self):
+        """
+        Writes the births and deaths per cell and the summary of the
+        current year to stats_file.
+        """
+        stats = self.stats
+        alive = {}
+        birth = {}
+        death = {}
+        for column, name in enumerate(SPECIES):
+            alive[name] = int(stats['alive'][column])
+            birth[name] = stats['birth'][:, column]
+            death[name] = stats['death'][:, column]
+        self.stats_file.append(stats['year'], alive, birth, death,
+                               self.animal_sums())
+
+    def add_stats(self, kind, name, cells):
+        """
+        Counts born or dead animals of a species in the stats table.
+
+        Parameters
+        ----------
+        kind : str
+            'birth' or 'death'
+        name : str
+            Species
+        cells : np.ndarray
+            int, flat cell index of each animal
+        """
+        self.stats[kind][:, SPECIES.index(name)] += np.bincount(
+            cells, minlength=self.num_cells)
+
+    def animal_sums(self):
+        """
+        Sums for the moments of weight and age of each species.
+
+        Returns
+        -------
+        dict
+            key : species, value : from weight_age_sums
+        """
+        return {name: weight_age_sums(age, weight)
+                for name, (age, weight, _) in self.animal_columns().items()}
 
     def update_data_list(self):
         """Updates list for use in visualization"""
@@ -200,6 +558,7 @@ class Island:
         """
         island_map = {}
         lines = self.clean_multi_line_string(island_map_string)
+        codes = {letter: code for code, letter in enumerate(self.map_params)}
 
         # Possible to fix using type hinting (alt+enter)
         self.len_map_x = len(lines[0])
@@ -214,9 +573,107 @@ class Island:
                                      f'letters like these:\n'
                                      f'{self.map_params}')
 
+        self.landscape = np.array([[codes[letter] for letter in line]
+                                   for line in lines], dtype=np.int8)
+        self.cells = [island_map[(y_cord, x_cord)]
+                      for y_cord in range(self.len_map_y)
+                      for x_cord in range(self.len_map_x)]
+        self.fodder = np.zeros(self.num_cells)
+        for index, cell in enumerate(self.cells):
+            cell.bind_fodder(self.fodder, index)
+            cell.parameters = self.parameters
+            cell.rng = self.rng
+        self.neighbours = self.make_neighbours()
+        self.update_passable_cells()
+
         return island_map
 
-    def probability_calc(self, pos, animal):
+    def make_neighbours(self):
+        """
+        Table of the flat cell index North, South, West and East of each
+        cell. Cells at the edge point to themselves where the neighbour
+        would be outside the map, they are ocean and nobody moves there.
+
+        Returns
+        -------
+        neighbours : np.ndarray
+            int, shape (num_cells, 4)
+        """
+        y_cords, x_cords = np.divmod(np.arange(self.num_cells),
+                                     self.len_map_x)
+        north = np.maximum(y_cords - 1, 0)
+        south = np.minimum(y_cords + 1, self.len_map_y - 1)
+        west = np.maximum(x_cords - 1, 0)
+        east = np.minimum(x_cords + 1, self.len_map_x - 1)
+
+        return np.stack([north * self.len_map_x + x_cords,
+                         south * self.len_map_x + x_cords,
+                         y_cords * self.len_map_x + west,
+                         y_cords * self.len_map_x + east], axis=1)
+
+    def meat_per_cell(self):
+        """Weight of all herbivores in each cell, by flat cell index"""
+        meat = np.zeros(self.num_cells)
+        for index, cell in self.live_cells():
+            meat[index] = cell.meat_for_carnivores
+        return meat
+
+    def propensities(self):
+        r"""
+        Propensity of each cell for herbivores and carnivores in one pass
+        over all cells, zero for cells that are not passable.
+
+        .. math::
+
+            \pi_k = e^{\lambda\epsilon_k}, \quad
+            \epsilon_k = \frac{f_k}{(n_k + 1)F}
+
+        Returns
+        -------
+        propensities : dict
+            key : species, value : np.ndarray indexed by flat cell index
+        """
+        passable = np.zeros(self.num_cells, dtype=bool)
+        passable[self.passable_cells] = True
+        fodder = self.fodder
+        num_animals_per_cell = self.num_animals_per_cell
+        num_herbivores = num_animals_per_cell['Herbivore'].ravel()
+        num_carnivores = num_animals_per_cell['Carnivore'].ravel()
+
+        herb_parameters = self.parameters['Herbivore']
+        carn_parameters = self.parameters['Carnivore']
+        propensity_herb = np.exp(
+            herb_parameters.lambda_ * fodder
+            / ((num_herbivores + 1) * herb_parameters.F))
+        propensity_carn = np.exp(
+            carn_parameters.lambda_ * self.meat_per_cell()
+            / ((num_carnivores + 1) * carn_parameters.F))
+        propensity_herb[~passable] = 0
+        propensity_carn[~passable] = 0
+        return {'Herbivore': propensity_herb, 'Carnivore': propensity_carn}
+
+    def migration_probabilities(self):
+        """
+        Probability to move to each of the four neighbours, for every cell
+        and both species, from the propensities of this year.
+
+        Returns
+        -------
+        probabilities : dict
+            key : species, value : np.ndarray of shape (num_cells, 4) in
+            the order of neighbours. Rows are zero where there is nowhere
+            to move
+        """
+        probabilities = {}
+        for animal, propensity in self.propensities().items():
+            propensity = propensity[self.neighbours]
+            prop_sum = propensity.sum(axis=1, keepdims=True)
+            with np.errstate(invalid='ignore'):
+                probabilities[animal] = np.where(
+                    prop_sum > 0, propensity / prop_sum, 0)
+        return probabilities
+
+    def probability_calc(self, pos, animal, probabilities=None):
         """
         Finds the preposition for all neighbouring cells
         within dx +- 1 and dy +-1. This means we have the positions
@@ -231,87 +688,122 @@ class Island:
             Position of current cell
         animal : str
             Name of the animal
+        probabilities : dict
+            From migration_probabilities, computed if not given
 
         Returns
         -------
         prob_list : list of tuples
             (Coordinate(y, x), and probabilities)
         """
-        y_cord, x_cord = pos
-        loc_1 = (y_cord - 1, x_cord)
-        loc_2 = (y_cord + 1, x_cord)
-        loc_3 = (y_cord, x_cord - 1)
-        loc_4 = (y_cord, x_cord + 1)
-        option_1 = self.map[loc_1]
-        option_2 = self.map[loc_2]
-        option_3 = self.map[loc_3]
-        option_4 = self.map[loc_4]
-
-        list_ = [(loc_1, option_1), (loc_2, option_2),
-                 (loc_3, option_3), (loc_4, option_4)]
-        propensity_list = []
-
-        for loc, option in list_:
-            propensity_list.append((loc,
-                                    option.propensity[animal])
-                                   )
-
-        prop_sum = np.sum(sum(dict(propensity_list).values()))
-        if prop_sum == 0:
+        if probabilities is None:
+            probabilities = self.migration_probabilities()
+        index = self.flat_index(pos)
+        probability = probabilities[animal][index]
+        if not probability.any():
             return None
+
         prob_list = []
-        for loc, prop in propensity_list:
-            prob_list.append((loc, (prop / prop_sum)))
+        for neighbour, prob in zip(self.neighbours[index].tolist(),
+                                   probability.tolist()):
+            prob_list.append((self.position(neighbour), prob))
 
         return prob_list
 
     def add_herb_to_new_cell(self, new_loc, herbivore):
         """ Add herbivore to cell in new location """
         self.map[new_loc].add_migrated_herb(herbivore)
+        self.reset_animal_count()
 
     def add_carn_to_new_cell(self, new_loc, carnivore):
         """ Add herbivore to cell in new location """
         self.map[new_loc].add_migrated_carn(carnivore)
+        self.reset_animal_count()
 
     def migrate(self):
         """
-        Goes through the map attribute of Island and calculates
-        probabilities for herbivores and carnivores, with position and
-        name of class.
+        Goes through the cells of Island and lets the animals in each
+        passable cell emigrate, with the probabilities of the cell from
+        migration_probabilities.
 
-        calls migrate method in instance of subclass of BaseCell
         Methods
         -------
-        BaseCell.migrate()
-        probability_calc(pos, animal)
+        BaseCell.emigrate()
+        migration_probabilities()
 
 
         Notes
         ------
-         Adds herbivores and carnivores that has migrated to new cells
-        """
-        for pos, cell in self.map.items():
-            if cell.passable and cell.num_animals > 0:
-                prob_herb = self.probability_calc(pos, 'Herbivore')
-                prob_carn = self.probability_calc(pos, 'Carnivore')
-                moved_herb, moved_carn = cell.migrate(prob_herb, prob_carn)
-                for loc, herb in moved_herb:
-                    self.add_herb_to_new_cell(loc, herb)
-                for loc, carn in moved_carn:
-                    self.add_carn_to_new_cell(loc, carn)
+         Adds herbivores and carnivores that has migrated to new cells, by
+         flat cell index from the neighbour table. When double_buffered,
+         they are first collected in a buffer that is added to the cells
+         once at the end
+        """
+        probabilities = self.migration_probabilities()
+        prob_herb = probabilities['Herbivore']
+        prob_carn = probabilities['Carnivore']
+        track_moved = not self.double_buffered
+        arrived_herb = {}
+        arrived_carn = {}
+        for index, cell in self.live_cells():
+            if cell.num_animals == 0:
+                continue
+            neighbours = self.neighbours[index]
+
+            if prob_herb[index].any():
+                cell.herbivores, movers, choice = cell.emigrate(
+                    cell.herbivores, prob_herb[index], track_moved,
+                    self.parameters['Herbivore'], self.rng)
+                for target, herb in zip(neighbours[choice].tolist(), movers):
+                    arrived_herb.setdefault(target, []).append(herb)
+
+            if prob_carn[index].any():
+                cell.carnivores, movers, choice = cell.emigrate(
+                    cell.carnivores, prob_carn[index], track_moved,
+                    self.parameters['Carnivore'], self.rng)
+                for target, carn in zip(neighbours[choice].tolist(), movers):
+                    arrived_carn.setdefault(target, []).append(carn)
+
+            if track_moved:
+                self.add_arrived(arrived_herb, arrived_carn)
+                arrived_herb = {}
+                arrived_carn = {}
+
+        self.add_arrived(arrived_herb, arrived_carn)
+
+    def add_arrived(self, arrived_herb, arrived_carn):
+        """
+        Adds migrated animals to their new cells.
+
+        Parameters
+        ----------
+        arrived_herb : dict
+            key : flat cell index, value : list of herbivores
+        arrived_carn : dict
+            key : flat cell index, value : list of carnivores
+        """
+        for target, herbivores in arrived_herb.items():
+            self.cells[target].herbivores.extend(herbivores)
+        for target, carnivores in arrived_carn.items():
+            self.cells[target].carnivores.extend(carnivores)
 
     def ready_for_new_year(self):
         """
-        Resets each cell in Island.map
+        Grows fodder and resets each passable cell in Island.map. The
+        moved flags of the animals are only reset if migration is not
+        double_buffered.
         Methods
         -------
-        BaseCell.grow
+        grow_fodder
         BaseCell.reset_calculate_propensity
         BaseAnimal.reset_has_moved
         """
-        for cell in self.map.values():
-            cell.grow()
+        self.update_passable_cells()
+        self.grow_fodder()
+        for _, cell in self.live_cells():
             cell.reset_calculate_propensity()
+            if self.double_buffered:
+                continue
             for herbivore in cell.herbivores:
                 herbivore.reset_has_moved()
             for carnivore in cell.carnivores:
@@ -337,42 +829,141 @@ class Island:
             loc = map_location['loc']
             if loc not in self.map.keys():
                 raise ValueError('Provided location does not exist')
-            if not self.map[loc].passable:
+            if not self.cell_parameter('passable')[self.flat_index(loc)]:
                 raise ValueError('Provided location is not passable')
 
             pop = map_location['pop']
             self.map[loc].add_animals(pop)
+        self.reset_animal_count()
+
+    def animal_columns(self):
+        """
+        Age, weight and flat cell index of all animals, one array each per
+        species, in the order of the cells.
+
+        Returns
+        -------
+        dict
+            key : species, value : (age, weight, cell) arrays
+        """
+        columns = {}
+        for name in ('Herbivore', 'Carnivore'):
+            age = []
+            weight = []
+            cell_index = []
+            for index, cell in self.live_cells():
+                animals = (cell.herbivores if name == 'Herbivore'
+                           else cell.carnivores)
+                age.extend(animal.age for animal in animals)
+                weight.extend(animal.weight for animal in animals)
+                cell_index.extend([index] * len(animals))
+            columns[name] = (np.array(age, dtype=np.int64),
+                             np.array(weight, dtype=np.float64),
+                             np.array(cell_index, dtype=np.int64))
+        return columns
+
+    def add_animal_columns(self, columns):
+        """
+        Adds animals from columns, like those from animal_columns, to
+        their cells. The values are not checked.
+
+        Parameters
+        ----------
+        columns : dict
+            key : species, value : (age, weight, cell) arrays
+        """
+        for name, (age, weight, cell_index) in columns.items():
+            species = Herbivore if name == 'Herbivore' else Carnivore
+            for age_, weight_, index in zip(np.asarray(age).tolist(),
+                                            np.asarray(weight).tolist(),
+                                            np.asarray(cell_index).tolist()):
+                cell = self.cells[index]
+                if name == 'Herbivore':
+                    cell.herbivores.append(species(age_, weight_))
+                else:
+                    cell.carnivores.append(species(age_, weight_))
+        self.reset_animal_count()
+
+    def update_fitness(self):
+        """
+        Brings fitness of all animals on the island up to date, with one
+        batched call per species instead of one call per animal.
+        """
+        herbivores = []
+        carnivores = []
+        for _, cell in self.live_cells():
+            herbivores.extend(cell.herbivores)
+            carnivores.extend(cell.carnivores)
+        fitness_of(herbivores, self.parameters['Herbivore'])
+        fitness_of(carnivores, self.parameters['Carnivore'])
 
     def feed(self):
-        """Calls feed_all in all cells of Island.map"""
-        for cell in self.map.values():
-            cell.feed_all()
+        """
+        Herbivores in all cells graze in one pass, then carnivores feed
+        in each passable cell of Island.map
+        """
+        self.update_fitness()
+        self.feed_herbivores()
+        killed = 0
+        for _, cell in self.live_cells():
+            if cell.num_carnivores == 0:
+                continue
+            num_herbivores = cell.num_herbivores
+            cell.feed_carnivores()
+            killed += num_herbivores - cell.num_herbivores
+        self.change_animal_count('Herbivore', -killed)
+
+    def feed_herbivores(self):
+        """
+        Herbivores of all cells graze with one call to grazing. Each cell
+        sorts its herbivores by fitness, and the fittest eat first. The
+        fodder left is written to the fodder array in place.
+        """
+        parameters = self.parameters['Herbivore']
+        herbivores = []
+        cell_index = []
+        for index, cell in self.live_cells():
+            if cell.num_herbivores == 0:
+                continue
+            cell.herbivores = cell.sort_by_fitness(cell.herbivores,
+                                                   parameters)
+            herbivores.extend(reversed(cell.herbivores))
+            cell_index.extend([index] * cell.num_herbivores)
+
+        intake, self.fodder[:] = grazing(cell_index, parameters.F,
+                                         self.fodder)
+        for herbivore, eaten in zip(herbivores, intake.tolist()):
+            if eaten > 0:
+                herbivore.weight += parameters.beta * eaten
 
     def procreate(self):
-        """Calls procreate in all cells of Island.map, adds born to stats"""
-        for pos, cell in self.map.items():
+        """Calls procreate in all passable cells, adds born to stats"""
+        for index, cell in self.live_cells():
             herb_birth, carn_birth = cell.procreate()
+            self.change_animal_count('Herbivore', len(herb_birth))
+            self.change_animal_count('Carnivore', len(carn_birth))
             if self._store_stats:
-                self.stats[self.year]['Herbivore']['birth'][pos] = herb_birth
-                self.stats[self.year]['Carnivore']['birth'][pos] = carn_birth
+                self.stats['birth'][index] = len(herb_birth), len(carn_birth)
 
     def age_animals(self):
-        """Calls age_pop in all cells of Island.map"""
-        for cell in self.map.values():
+        """Calls age_pop in all passable cells of Island.map"""
+        for _, cell in self.live_cells():
             cell.age_pop()
 
     def lose_weight(self):
-        """Calls lose_weight in all cells of Island.map"""
-        for cell in self.map.values():
+        """Calls lose_weight in all passable cells of Island.map"""
+        for _, cell in self.live_cells():
             cell.lose_weight()
 
     def die(self):
-        """Calls die in all cells of Island.map, adds dead to stats"""
-        for pos, cell in self.map.items():
+        """Calls die in all passable cells, adds dead to stats"""
+        self.update_fitness()
+        for index, cell in self.live_cells():
             herb_death, carn_death = cell.die()
+            self.change_animal_count('Herbivore', -len(herb_death))
+            self.change_animal_count('Carnivore', -len(carn_death))
             if self._store_stats:
-                self.stats[self.year]['Herbivore']['death'][pos] = herb_death
-                self.stats[self.year]['Carnivore']['death'][pos] = carn_death
+                self.stats['death'][index] = len(herb_death), len(carn_death)
 
     @property
     def year(self):
@@ -399,11 +990,312 @@ class Island:
         self.age_animals()
         self.lose_weight()
         self.die()
+        if self._store_stats:
+            self.write_stats()
         self.year += 1
         self.update_data_list()
         if self._store_stats:
             self.create_and_update_stats_structure()
 
 
+class ColumnarIsland(Island):
+    """
+    Island where the animals are kept in a Population per species instead
+    of as objects in the cells. The cells in map still hold the fodder and
+    the landscape parameters, but their lists of animals stay empty.
+
+    Overrides the phases of the year, so simulate_one_year from Island
+    runs on the columns. Migration is always double buffered.
+
+    Attributes
+    ----------
+    herbivores : Population
+    carnivores : Population
+    """
+    def __init__(self, island_map_string, ini_pop, store_stats=False,
+                 rng=None):
+        """
+        Initializes instance of ColumnarIsland
+
+        Parameters
+        ----------
+        island_map_string : str
+            Multilinestring of map
+        ini_pop : dict
+            key : location - Value : list of dict
+        store_stats : bool
+        rng : np.random.Generator or None
+        """
+        self.herbivores = Population(Herbivore)
+        self.carnivores = Population(Carnivore)
+        super().__init__(island_map_string, ini_pop, store_stats, rng)
+
+    def populations(self):
+        """Pairs of species name and Population"""
+        return (('Herbivore', self.herbivores),
+                ('Carnivore', self.carnivores))
+
+    def update_parameters(self, parameters):
+        """
+        Replaces parameters of this island, the populations read the
+        parameters of their species from the island.
+
+        Parameters
+        ----------
+        parameters : dict
+            key : species name or landscape letter, value : AnimalParameters
+            or LandscapeParameters
+        """
+        super().update_parameters(parameters)
+        for name, population in self.populations():
+            population.parameters = self.parameters[name]
+
+    def update_fitness(self):
+        """Recomputes the fitness column of both species"""
+        for _, population in self.populations():
+            population.update_fitness()
+
+    @property
+    def num_animals_per_species(self):
+        """
+        Number of animals per species in island, as dictionary.
+
+        Returns
+        -------
+        num_animals_per_species : dictionary
+        """
+        return {'Herbivore': len(self.herbivores),
+                'Carnivore': len(self.carnivores)}
+
+    def count_density(self, counts):
+        """
+        Counts the animals of each species in each cell with np.bincount.
+
+        Parameters
+        ----------
+        counts : np.ndarray
+            int, shape (species, num_cells), filled in place
+        """
+        for column, (_, population) in enumerate(self.populations()):
+            counts[column] = population.count_per_cell(self.num_cells)
+
+    def add_population(self, population):
+        """
+        Appends a dictionary of population to the columns by position.
+
+        Parameters
+        ----------
+        population: list
+            loc: tuple
+            pop: dict
+        """
+        columns = {name: ([], [], []) for name, _ in self.populations()}
+        for map_location in population:
+            loc = map_location['loc']
+            if loc not in self.map.keys():
+                raise ValueError('Provided location does not exist')
+            if not self.cell_parameter('passable')[self.flat_index(loc)]:
+                raise ValueError('Provided location is not passable')
+
+            index = self.flat_index(loc)
+            for animal in map_location['pop']:
+                species = animal['species']
+                age = animal['age']
+                weight = animal['weight']
+                if species not in columns:
+                    raise ValueError('Unknown species: ' + str(species))
+                if age < 0 or age != int(age):
+                    raise ValueError('age can only be a positive integer')
+                if weight < 0:
+                    raise ValueError('weight can only be positive')
+
+                ages, weights, cells = columns[species]
+                ages.append(age)
+                weights.append(weight)
+                cells.append(index)
+
+        for name, population in self.populations():
+            if columns[name][0]:
+                population.add(*columns[name])
+
+    def animal_columns(self):
+        """
+        Copies of the age, weight and cell columns of each species.
+
+        Returns
+        -------
+        dict
+            key : species, value : (age, weight, cell) arrays
+        """
+        return {name: (population.age.copy(), population.weight.copy(),
+                       population.cell.copy())
+                for name, population in self.populations()}
+
+    def add_animal_columns(self, columns):
+        """
+        Appends animals from columns, like those from animal_columns.
+
+        Parameters
+        ----------
+        columns : dict
+            key : species, value : (age, weight, cell) arrays
+        """
+        for name, population in self.populations():
+            if name in columns:
+                population.add(*columns[name])
+
+    def ready_for_new_year(self):
+        """
+        Grows fodder. The cells hold no animals, so there is nothing else
+        to reset.
+        """
+        self.update_passable_cells()
+        self.grow_fodder()
+
+    def feed(self):
+        """
+        Herbivores graze in each cell, fittest first, until the fodder
+        is gone. Then the carnivores hunt, fittest first, on the
+        herbivores in ascending order of fitness.
+        """
+        self.feed_herbivores()
+        self.feed_carnivores()
+
+    def feed_herbivores(self):
+        """Herbivores eat fodder, fittest in each cell first"""
+        herbs = self.herbivores
+        if len(herbs) == 0:
+            return
+        herbs.update_fitness()
+        herbs.keep(np.lexsort((-herbs.fitness, herbs.cell)))
+
+        intake, self.fodder[:] = grazing(herbs.cell, herbs.parameters.F,
+                                         self.fodder)
+        herbs.weight += herbs.parameters.beta * intake
+
+    def feed_carnivores(self):
+        """
+        Carnivores hunt in each cell, fittest first, on the herbivores
+        sorted in ascending order of fitness. Killed herbivores are
+        removed once all cells are done.
+        """
+        herbs = self.herbivores
+        carns = self.carnivores
+        if len(herbs) == 0 or len(carns) == 0:
+            return
+        herbs.update_fitness()
+        carns.update_fitness()
+        herbs.keep(np.lexsort((herbs.fitness, herbs.cell)))
+        carns.keep(np.lexsort((-carns.fitness, carns.cell)))
+
+        herb_slices = {index: (start, stop)
+                       for index, start, stop in cell_slices(herbs.cell)}
+        killed = np.zeros(len(herbs), dtype=bool)
+        for index, start, stop in cell_slices(carns.cell):
+            if index not in herb_slices:
+                continue
+            herb_start, herb_stop = herb_slices[index]
+            killed[herb_start:herb_stop], carns.weight[start:stop] = hunting(
+                carns.age[start:stop], carns.weight[start:stop],
+                carns.fitness[start:stop],
+                herbs.fitness[herb_start:herb_stop],
+                herbs.weight[herb_start:herb_stop], carns.parameters,
+                self.rng)
+
+        herbs.keep(~killed)
+
+    def meat_per_cell(self):
+        """Weight of all herbivores in each cell, by flat cell index"""
+        return self.herbivores.weight_per_cell(self.num_cells)
+
+    def migrate(self):
+        """
+        Every animal migrates with probability fitness * mu to one of the
+        four neighbouring cells, chosen by the migration probabilities of
+        its cell. All animals decide from the state before migration and
+        the new cells are written at once, so nobody moves twice.
+        """
+        probabilities = self.migration_probabilities()
+
+        for name, population in self.populations():
+            if len(population) == 0:
+                continue
+            population.update_fitness()
+            prob_to_move = population.fitness * population.parameters.mu
+            movers = np.flatnonzero(
+                self.rng.random(len(population)) < prob_to_move)
+
+            probability = probabilities[name][population.cell[movers]]
+            can_move = probability.any(axis=1)
+            movers = movers[can_move]
+            choice = choose_destinations(probability[can_move],
+                                         rng=self.rng)
+            population.cell[movers] = self.neighbours[population.cell[movers],
+                                                      choice]
+
+    def procreate(self):
+        """
+        Animals of age >= 1 give birth with probability
+        min(1, gamma * fitness * (N - 1)) if heavy enough, newborns are
+        appended to the columns. Adds born to stats.
+        """
+        for name, population in self.populations():
+            born = np.zeros(0, dtype=np.int64)
+            if len(population) > 0:
+                born = self._procreate_population(population)
+            if self._store_stats:
+                self.add_stats('birth', name, born)
+
+    def _procreate_population(self, population):
+        """
+        Birth phase for one species.
+
+        Parameters
+        ----------
+        population : Population
+
+        Returns
+        -------
+        np.ndarray
+            int, flat cell index of each newborn
+        """
+        parameters = population.parameters
+        population.update_fitness()
+        num_same_species = population.count_per_cell(
+            self.num_cells)[population.cell]
+        parents, newborn_weight = birth_arrays(
+            population.age, population.weight, population.fitness,
+            num_same_species, parameters, self.rng)
+
+        population.weight[parents] -= parameters.xi * newborn_weight
+        born_cells = population.cell[parents]
+        population.add(np.zeros(len(parents), dtype=np.int64),
+                       newborn_weight, born_cells)
+        return born_cells
+
+    def age_animals(self):
+        """Adds an increment of 1 to the age of all animals"""
+        for _, population in self.populations():
+            population.age += 1
+
+    def lose_weight(self):
+        """Yearly passive weight loss for all animals"""
+        for _, population in self.populations():
+            population.weight -= population.parameters.eta * population.weight
+
+    def die(self):
+        """
+        Animals die with probability omega * (1 - fitness), or for sure
+        if fitness is 0. Adds dead to stats.
+        """
+        for name, population in self.populations():
+            population.update_fitness()
+            dies = death_mask(population.fitness,
+                              population.parameters.omega, self.rng)
+            if self._store_stats:
+                self.add_stats('death', name, population.cell[dies])
+            population.keep(~dies)
+
+
 if __name__ == '__main__':
     pass
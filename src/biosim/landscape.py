@@ -6,7 +6,9 @@
 __author__ = "Jon-Mikkel Korsvik & Petter Bøe Hørtvedt"
 __email__ = "jonkors@nmbu.no & petterho@nmbu.no"
 
-from .animals import Herbivore, Carnivore
+from .animals import (
+    Herbivore, Carnivore, fitness_of, death_mask, birth_arrays, hunting
+)
 import numpy as np
 import itertools
 import math
@@ -14,6 +16,47 @@ import random
 from numba import jit
 
 
+def choose_destinations(probabilities, size=None, rng=None):
+    """
+    Draws destinations for many animals with one array of random numbers.
+
+    With one distribution, size draws are made from it by searching the
+    cumulative sum. With one distribution per row, one draw is made per
+    row. A draw never lands on a destination with probability 0, even
+    if the cumulative sum is slightly below 1.
+
+    Parameters
+    ----------
+    probabilities : np.ndarray
+        1D, one distribution, or 2D, one distribution per row
+    size : int
+        Number of draws, only for a 1D distribution
+    rng : np.random.Generator or None
+        Random number generator, numpy.random if None
+
+    Returns
+    -------
+    np.ndarray
+        int, index of the chosen destination for each draw
+    """
+    rng = rng or np.random
+    probabilities = np.asarray(probabilities, dtype=float)
+    positive = probabilities > 0
+    if probabilities.ndim == 1:
+        cumulative = np.cumsum(probabilities)
+        random_number = rng.random(size)
+        choice = np.searchsorted(cumulative, random_number, side='left')
+        last = len(probabilities) - 1 - np.argmax(positive[::-1])
+        return np.minimum(choice, last)
+
+    cumulative = np.cumsum(probabilities, axis=1)
+    random_number = rng.random(len(probabilities))
+    choice = (random_number[:, None] > cumulative).sum(axis=1)
+    last = (probabilities.shape[1] - 1
+            - np.argmax(positive[:, ::-1], axis=1))
+    return np.minimum(choice, last)
+
+
 def choose_new_location(prob_list):
     """
     Draws one out of a list with weights.
@@ -29,13 +72,53 @@ def choose_new_location(prob_list):
         new_location - (y, x)
     """
     probabilities = [x[1] for x in prob_list]
-    cumulative_sum = np.cumsum(probabilities)
-    locations = [x[0] for x in prob_list]
-    index = 0
-    random_number = random.random()
-    while random_number > cumulative_sum[index]:
-        index += 1
-    return locations[index]
+    index = choose_destinations(probabilities, 1)[0]
+    return prob_list[index][0]
+
+
+def grazing(cells, appetite, fodder):
+    """
+    Amount of fodder each herbivore eats, for many cells at once.
+
+    Within a cell the animals eat in the given order, each takes its
+    appetite or what is left. The fodder eaten before an animal is the sum
+    of the appetites before it in the cell, so every intake follows from
+    one cumulative sum and one clip.
+
+    Parameters
+    ----------
+    cells : np.ndarray
+        int, cell index of each animal, sorted in ascending order, and
+        within each cell with the fittest animal first. The start of each
+        cell is found by binary search, so unsorted cells give wrong
+        intakes
+    appetite : float or np.ndarray
+        F of each animal
+    fodder : np.ndarray
+        float, fodder indexed by cell index
+
+    Returns
+    -------
+    intake : np.ndarray
+        Fodder eaten by each animal
+    fodder_left : np.ndarray
+        Fodder left in each cell
+    """
+    cells = np.asarray(cells, dtype=np.int64)
+    fodder = np.asarray(fodder, dtype=float)
+    appetite = np.broadcast_to(np.asarray(appetite, dtype=float),
+                               cells.shape)
+    if len(cells) == 0:
+        return np.zeros(0), fodder.copy()
+
+    cumulative = np.cumsum(appetite)
+    first = np.searchsorted(cells, cells)
+    eaten_before = (cumulative - appetite) - (cumulative[first]
+                                              - appetite[first])
+    intake = np.clip(fodder[cells] - eaten_before, 0, appetite)
+    fodder_left = fodder - np.bincount(cells, weights=intake,
+                                       minlength=len(fodder))
+    return intake, np.maximum(fodder_left, 0)
 
 
 class BaseCell:
@@ -45,6 +128,13 @@ class BaseCell:
     herbivores : list
     carnivores : list
     fodder : float
+    parameters : dict
+        key : species, value : parameters of the species as class or
+        AnimalParameters. The classes for a cell on its own, Island gives
+        its cells the parameters of the simulation
+    rng : np.random.Generator or module
+        Random number generator of the cell, numpy.random for a cell on
+        its own, Island gives its cells the generator of the simulation
     death_list : list
         list for stats
     birth_list : list
@@ -52,6 +142,8 @@ class BaseCell:
 
     Methods
     --------
+    bind_fodder
+    growth_rate
     grow
     add_animals
     add_migrated_herb
@@ -60,7 +152,9 @@ class BaseCell:
     remove_migrated_carn
     chain_lists
     migrate
+    emigrate
     procreate
+    give_birth
     lose_weight
     sort_by_fitness
     feed_all
@@ -68,6 +162,7 @@ class BaseCell:
     feed_carnivores
     age_pop
     die
+    split_dead
     reset_calculate_propensity
     """
     passable = True
@@ -131,10 +226,59 @@ class BaseCell:
         """
         self.herbivores = []
         self.carnivores = []
+        self.parameters = {'Herbivore': Herbivore, 'Carnivore': Carnivore}
+        self.rng = np.random
         self._calculate_propensity = True
         self._propensity = None
+        self._fodder_array = np.zeros(1)
+        self._fodder_index = 0
         self.fodder = 0
 
+    @property
+    def fodder(self):
+        """Amount of fodder in cell, kept in the fodder array of the cell"""
+        return self._fodder_array[self._fodder_index]
+
+    @fodder.setter
+    def fodder(self, new_fodder):
+        """Sets fodder in the fodder array of the cell"""
+        self._fodder_array[self._fodder_index] = new_fodder
+
+    def bind_fodder(self, fodder_array, index):
+        """
+        Moves the fodder of the cell into a shared array, like the fodder
+        array of Island, from then on fodder reads and writes there.
+
+        Parameters
+        ----------
+        fodder_array : np.ndarray
+            float
+        index : int
+            Index of the cell in fodder_array
+        """
+        fodder_array[index] = self.fodder
+        self._fodder_array = fodder_array
+        self._fodder_index = index
+
+    @classmethod
+    def growth_rate(cls, parameters=None):
+        """
+        Share of the missing fodder, f_max - fodder, that grows back each
+        year, so grow is the same as
+        fodder = f_max - (1 - growth_rate) * (f_max - fodder).
+        Lets Island grow the fodder of all cells at once.
+
+        Parameters
+        ----------
+        parameters : LandscapeParameters or None
+            Parameters of the landscape type, read from the class if None
+
+        Returns
+        -------
+        float
+        """
+        return 0.0
+
     def grow(self):
         """Grows fodder in cell"""
         pass
@@ -194,9 +338,9 @@ class BaseCell:
 
     def migrate(self, prob_herb, prob_carn):
         """
-        Goes through herbivores, migrates, appends to moved_herb.
-        Goes through carnivores, migrates, appends to moved_carn.
-        Deletes the animal that has moved from the list of class.
+        Finds the herbivores and carnivores that migrate, and draws all
+        their new locations at once per species.
+        Keeps only the animals that stay in the lists of the cell.
 
 
         Parameters
@@ -222,34 +366,81 @@ class BaseCell:
         if prob_herb is None and prob_carn is None:
             return moved_herb, moved_carn
 
-        for herb in self.herbivores:
-            if herb.will_migrate():
-                loc = choose_new_location(prob_herb)
-                moved_herb.append((loc, herb))
+        if prob_herb is not None:
+            locations = [loc for loc, prob in prob_herb]
+            self.herbivores, movers, choice = self.emigrate(
+                self.herbivores, [prob for loc, prob in prob_herb],
+                parameters=self.parameters['Herbivore'], rng=self.rng)
+            moved_herb = [(locations[index], herb)
+                          for index, herb in zip(choice.tolist(), movers)]
+
+        if prob_carn is not None:
+            locations = [loc for loc, prob in prob_carn]
+            self.carnivores, movers, choice = self.emigrate(
+                self.carnivores, [prob for loc, prob in prob_carn],
+                parameters=self.parameters['Carnivore'], rng=self.rng)
+            moved_carn = [(locations[index], carn)
+                          for index, carn in zip(choice.tolist(), movers)]
 
-        for carn in self.carnivores:
-            if carn.will_migrate():
-                loc = choose_new_location(prob_carn)
-                moved_carn.append((loc, carn))
+        return moved_herb, moved_carn
 
-        for loc, herb in moved_herb:
-            self.remove_migrated_herb(herb)
-        for loc, carn in moved_carn:
-            self.remove_migrated_carn(carn)
+    @staticmethod
+    def emigrate(animal_list, probabilities, track_moved=True,
+                 parameters=None, rng=None):
+        """
+        Animals migrate with probability fitness * mu. Destinations of all
+        migrating animals are drawn in one call.
 
-        return moved_herb, moved_carn
+        Parameters
+        ----------
+        animal_list : list
+            Animals of the same species
+        probabilities : array_like
+            Probability of each destination
+        track_moved : bool
+            If True, animals that have moved this year stay, and all
+            animals are marked as moved. Not needed when the migrated
+            animals are buffered until every cell is done
+        parameters : AnimalParameters or None
+            Parameters of the species, read from the class if None
+        rng : np.random.Generator or None
+            Random number generator, numpy.random if None
+
+        Returns
+        -------
+        staying : list
+            Animals that stay in the cell
+        movers : list
+            Animals that migrate
+        choice : np.ndarray
+            int, index of the destination of each mover
+        """
+        if len(animal_list) == 0:
+            return animal_list, [], np.zeros(0, dtype=int)
+
+        parameters = parameters or type(animal_list[0])
+        rng = rng or np.random
+        moves = (rng.random(len(animal_list))
+                 < fitness_of(animal_list, parameters) * parameters.mu)
+        if track_moved:
+            moves &= np.array([not animal.has_moved
+                               for animal in animal_list])
+        movers = list(itertools.compress(animal_list, moves))
+        staying = list(itertools.compress(animal_list, ~moves))
+        choice = choose_destinations(probabilities, len(movers), rng)
+        return staying, movers, choice
 
     def procreate(self):
         """
         Goes through herbivores and carnivores if there is more than one
         animal the same list.
 
-        Calls birth method, and if offspring returned appends the offspring
-        to the cells appropriate list.
+        Finds all parents and newborn weights of a species in one call,
+        and appends the offspring to the cells appropriate list.
 
         Methods
         -------
-        birth(num_of_same_species)
+        give_birth(animal_list)
 
 
         Returns
@@ -261,38 +452,73 @@ class BaseCell:
 
         """
         birth_list_herb = []
-        number_of_adult_herbivores = self.num_herbivores
-        if number_of_adult_herbivores > 1:
-            for herbivore in self.herbivores:
-                offspring = herbivore.birth(number_of_adult_herbivores)
-                if not offspring:
-                    continue
-                self.herbivores.append(offspring)
-                birth_list_herb.append(offspring)
+        if self.num_herbivores > 1:
+            birth_list_herb = self.give_birth(self.herbivores,
+                                              self.parameters['Herbivore'],
+                                              self.rng)
+            self.herbivores.extend(birth_list_herb)
 
         birth_list_carn = []
-        number_of_adult_carnivores = self.num_carnivores
-        if number_of_adult_carnivores > 1:
-            for carnivore in self.carnivores:
-                offspring = carnivore.birth(number_of_adult_carnivores)
-                if not offspring:
-                    continue
-                self.carnivores.append(offspring)
-                birth_list_carn.append(offspring)
+        if self.num_carnivores > 1:
+            birth_list_carn = self.give_birth(self.carnivores,
+                                              self.parameters['Carnivore'],
+                                              self.rng)
+            self.carnivores.extend(birth_list_carn)
 
         return birth_list_herb, birth_list_carn
 
+    @staticmethod
+    def give_birth(animal_list, parameters=None, rng=None):
+        """
+        Birth phase for a list of animals of the same species in one cell.
+        The mothers lose weight, the offspring are returned.
+
+        Methods
+        -------
+        birth_arrays(age, weight, fitness, num_same_species, species)
+
+        Parameters
+        ----------
+        animal_list : list
+        parameters : AnimalParameters or None
+            Parameters of the species, read from the class if None
+        rng : np.random.Generator or None
+            Random number generator, numpy.random if None
+
+        Returns
+        -------
+        offspring : list
+            New instances with age 0
+        """
+        species = type(animal_list[0])
+        parameters = parameters or species
+        ages = [animal.age for animal in animal_list]
+        weights = [animal.weight for animal in animal_list]
+        parents, newborn_weight = birth_arrays(
+            ages, weights, fitness_of(animal_list, parameters),
+            len(animal_list), parameters, rng)
+
+        offspring = []
+        for index, weight in zip(parents.tolist(), newborn_weight.tolist()):
+            animal_list[index].weight -= parameters.xi * weight
+            offspring.append(species(0, weight))
+        return offspring
+
     def lose_weight(self):
         """Makes animals in cell lose_weight"""
+        eta = self.parameters['Herbivore'].eta
         for herbivore in self.herbivores:
-            herbivore.lose_weight()
+            herbivore.weight -= eta * herbivore.weight
+        eta = self.parameters['Carnivore'].eta
         for carnivore in self.carnivores:
-            carnivore.lose_weight()
+            carnivore.weight -= eta * carnivore.weight
 
     @staticmethod
-    def sort_by_fitness(animal_list):
-        """Sort list of animals by fitness"""
-        sorted_list = sorted(animal_list, key=lambda var: var.fitness)
+    def sort_by_fitness(animal_list, parameters=None):
+        """Sort list of animals by fitness, computed in one batched call"""
+        order = np.argsort(fitness_of(animal_list, parameters),
+                           kind='stable')
+        sorted_list = [animal_list[index] for index in order]
         return sorted_list
 
     def feed_all(self):
@@ -305,39 +531,66 @@ class BaseCell:
         Herbivores is sorted by fitness thereafter goes through the updated
         list in reverse. This makes the most fit animals first to feed.
 
-        Updated the cells amount of food(fodder) after each animal has fed.
+        The intake of every animal is found in one call, then the cells
+        amount of food(fodder) is updated.
 
         Methods
         -------
-        feed()
+        grazing(cells, appetite, fodder)
 
         """
-        self.herbivores = self.sort_by_fitness(self.herbivores)
-        for herbivore in reversed(self.herbivores):
-            self.fodder = herbivore.feed(self.fodder)
+        if self.num_herbivores == 0:
+            return
+        parameters = self.parameters['Herbivore']
+        self.herbivores = self.sort_by_fitness(self.herbivores, parameters)
+        fittest_first = self.herbivores[::-1]
+        intake, fodder_left = grazing(np.zeros(len(fittest_first)),
+                                      parameters.F, [self.fodder])
+        for herbivore, eaten in zip(fittest_first, intake.tolist()):
+            if eaten > 0:
+                herbivore.weight += parameters.beta * eaten
+        self.fodder = fodder_left[0]
 
     def feed_carnivores(self):
         """
         Sorts herbivores by fitness
         Sorts carnivores by fitness
 
-        The fittest carnivore feeds first with sorted list of herbivores
-        as input.
+        The fittest carnivore feeds first, all carnivores hunt on the same
+        sorted list of herbivores.
 
-        Sets the returned list as the new list for herbivores.
+        Killed herbivores are removed from the list once, after all
+        carnivores have fed.
 
         Methods
         ------
-        feed(least_fit_herbivores)
-            Returns list of herbivores that are still living
-
-
+        hunting(carn_age, carn_weight, carn_fitness, herb_fitness,
+        herb_weight, species)
+            Returns which herbivores were killed and new carnivore weights
 
         """
-        self.herbivores = self.sort_by_fitness(self.herbivores)
-        self.carnivores = self.sort_by_fitness(self.carnivores)
-        for carnivore in reversed(self.carnivores):
-            self.herbivores = carnivore.feed(self.herbivores)
+        if self.num_herbivores == 0 or self.num_carnivores == 0:
+            return
+        herb_parameters = self.parameters['Herbivore']
+        carn_parameters = self.parameters['Carnivore']
+        self.herbivores = self.sort_by_fitness(self.herbivores,
+                                               herb_parameters)
+        self.carnivores = self.sort_by_fitness(self.carnivores,
+                                               carn_parameters)
+        hunters = self.carnivores[::-1]
+
+        killed, weight = hunting(
+            [carnivore.age for carnivore in hunters],
+            [carnivore.weight for carnivore in hunters],
+            fitness_of(hunters, carn_parameters),
+            fitness_of(self.herbivores, herb_parameters),
+            [herbivore.weight for herbivore in self.herbivores],
+            carn_parameters, self.rng)
+
+        for carnivore, new_weight in zip(hunters, weight.tolist()):
+            if new_weight != carnivore.weight:
+                carnivore.weight = new_weight
+        self.herbivores = list(itertools.compress(self.herbivores, ~killed))
 
     def age_pop(self):
         """Adds a increment of 1 to the animals age attribute"""
@@ -348,15 +601,15 @@ class BaseCell:
 
     def die(self):
         """
-        Iterates through animals, adds them to a death list.
-
-        Iterates through death list and removes them from the cell's
-        appropriate list by object instance.
+        Decides who dies for all herbivores at once, then for all
+        carnivores, and keeps the survivors in the cell's lists.
 
         Methods
         -------
-        BaseAnimal.death()
-            Returns bool
+        fitness_of(animals)
+            Returns np.ndarray
+        death_mask(fitness, omega)
+            Returns np.ndarray of bool
 
         Returns
         -------
@@ -366,24 +619,40 @@ class BaseCell:
             Carnivore instances that died
 
         """
+        self.herbivores, death_list_herb = self.split_dead(
+            self.herbivores, self.parameters['Herbivore'], self.rng)
+        self.carnivores, death_list_carn = self.split_dead(
+            self.carnivores, self.parameters['Carnivore'], self.rng)
 
-        death_list_herb = []
-        for herbivore in self.herbivores:
-            if herbivore.death():
-                death_list_herb.append(herbivore)
+        return death_list_herb, death_list_carn
 
-        for dead in death_list_herb:
-            self.herbivores.remove(dead)
+    @staticmethod
+    def split_dead(animal_list, parameters=None, rng=None):
+        """
+        Splits a list of animals of the same species in survivors and dead
 
-        death_list_carn = []
-        for carnivore in self.carnivores:
-            if carnivore.death():
-                death_list_carn.append(carnivore)
+        Parameters
+        ----------
+        animal_list : list
+        parameters : AnimalParameters or None
+            Parameters of the species, read from the class if None
+        rng : np.random.Generator or None
+            Random number generator, numpy.random if None
 
-        for dead in death_list_carn:
-            self.carnivores.remove(dead)
+        Returns
+        -------
+        survivors : list
+        dead : list
+        """
+        if len(animal_list) == 0:
+            return animal_list, []
 
-        return death_list_herb, death_list_carn
+        parameters = parameters or type(animal_list[0])
+        dies = death_mask(fitness_of(animal_list, parameters),
+                          parameters.omega, rng)
+        survivors = list(itertools.compress(animal_list, ~dies))
+        dead = list(itertools.compress(animal_list, dies))
+        return survivors, dead
 
     @property
     def propensity(self):
@@ -425,16 +694,16 @@ class BaseCell:
                                 'Herbivore': 0}
         else:
 
-            lambda_ = Herbivore.lambda_
-            appetite = Herbivore.F
+            lambda_ = self.parameters['Herbivore'].lambda_
+            appetite = self.parameters['Herbivore'].F
             dividend = ((self.num_herbivores + 1) * appetite)
             exponent_herb = (lambda_ * (self.fodder
                                         / dividend))
 
             propensity_herb = math.exp(exponent_herb)
 
-            lambda_ = Carnivore.lambda_
-            appetite_ = Carnivore.F
+            lambda_ = self.parameters['Carnivore'].lambda_
+            appetite_ = self.parameters['Carnivore'].F
 
             dividend = ((self.num_carnivores + 1) * appetite_)
             exponent_carn = (lambda_ * (self.meat_for_carnivores
@@ -528,6 +797,11 @@ class Savanna(BaseCell):
         super().__init__()
         self.fodder = self.f_max
 
+    @classmethod
+    def growth_rate(cls, parameters=None):
+        """Fodder grows alpha of what is missing"""
+        return (parameters or cls).alpha
+
     def grow(self):
         self.fodder += self.alpha * (self.f_max - self.fodder)
 
@@ -555,6 +829,11 @@ class Jungle(BaseCell):
         super().__init__()
         self.fodder = self.f_max
 
+    @classmethod
+    def growth_rate(cls, parameters=None):
+        """Fodder grows back to f_max"""
+        return 1.0
+
     def grow(self):
         self.fodder = self.f_max
 
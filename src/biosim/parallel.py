@@ -0,0 +1,616 @@
+# -*- coding: utf-8 -*-
+
+"""
+"""
+
+__author__ = "Jon-Mikkel Korsvik & Petter Bøe Hørtvedt"
+__email__ = "jonkors@nmbu.no & petterho@nmbu.no"
+
+import os
+import multiprocessing
+import numpy as np
+from .island import ColumnarIsland
+from .animals import death_mask
+from .stats import weight_age_sums, SPECIES
+
+
+def split_rows(len_map_y, num_bands):
+    """
+    Splits the rows of a map into contiguous bands of close to equal size.
+
+    Parameters
+    ----------
+    len_map_y : int
+        Number of rows
+    num_bands : int
+
+    Returns
+    -------
+    list of tuples
+        (first_row, stop_row) of each band
+    """
+    num_bands = max(1, min(num_bands, len_map_y))
+    bands = np.array_split(np.arange(len_map_y), num_bands)
+    return [(int(band[0]), int(band[-1]) + 1) for band in bands]
+
+
+class BandIsland(ColumnarIsland):
+    """
+    The part of a ParallelIsland kept by one worker process: the animals
+    living in rows [first_row, stop_row) of the map.
+
+    The arrays cover the whole map, so the phases of ColumnarIsland work
+    unchanged on flat cell indices, but only cells in the band hold
+    animals. Before migration the band gets the halo, the rows just
+    outside it, from the neighbouring bands, since animals in the edge
+    rows choose between cells in those rows.
+
+    Parameters
+    ----------
+    island_map_string : str
+        Multilinestring of the whole map
+    first_row : int
+    stop_row : int
+
+    Attributes
+    ----------
+    first_cell : int
+        Flat cell index of the first cell in the band
+    stop_cell : int
+        Flat cell index after the last cell in the band
+    halo : dict
+        key : flat cell index array of halo cells, and per-cell fodder,
+        number of herbivores, number of carnivores and meat in them
+    """
+    def __init__(self, island_map_string, first_row, stop_row):
+        """
+        Initializes empty band
+
+        Parameters
+        ----------
+        island_map_string : str
+        first_row : int
+        stop_row : int
+        """
+        super().__init__(island_map_string, [])
+        self.first_cell = first_row * self.len_map_x
+        self.stop_cell = stop_row * self.len_map_x
+        self.halo = None
+
+    def load(self, fodder, herbivores, carnivores):
+        """
+        Takes over the fodder and animals of the band.
+
+        Parameters
+        ----------
+        fodder : np.ndarray
+            Fodder of the cells in the band
+        herbivores : tuple
+            (age, weight, cell) arrays
+        carnivores : tuple
+            (age, weight, cell) arrays
+        """
+        self.fodder[self.first_cell:self.stop_cell] = fodder
+        self.herbivores.add(*herbivores)
+        self.carnivores.add(*carnivores)
+
+    def unload(self):
+        """
+        Gives back the fodder and animals of the band.
+
+        Returns
+        -------
+        tuple
+            fodder, herbivore columns, carnivore columns
+        """
+        return (self.fodder[self.first_cell:self.stop_cell],
+                (self.herbivores.age, self.herbivores.weight,
+                 self.herbivores.cell),
+                (self.carnivores.age, self.carnivores.weight,
+                 self.carnivores.cell))
+
+    def first_half(self, parameters, immigrants, seed):
+        """
+        Adds the animals that migrated into the band last year, then
+        grows fodder, feeds and gives birth.
+
+        Parameters
+        ----------
+        parameters : dict
+            Parameters of the island in the main process
+        immigrants : dict
+            key : species, value : (age, weight, cell) arrays
+        seed : int
+            Seed of the generator of the band for this year
+
+        Returns
+        -------
+        edges : list of tuples
+            Halo data of the first and the last row of the band
+        born : dict
+            key : species, value : flat cell index of each newborn
+        """
+        self.update_parameters(parameters)
+        self.rng = np.random.default_rng(seed)
+        self.halo = None
+        for name, population in self.populations():
+            population.add(*immigrants[name])
+
+        self.ready_for_new_year()
+        self.feed()
+        born = {}
+        for name, population in self.populations():
+            born[name] = np.zeros(0, dtype=np.int64)
+            if len(population) > 0:
+                born[name] = self._procreate_population(population)
+
+        last_row = self.stop_cell - self.len_map_x
+        edges = [self.row_data(self.first_cell), self.row_data(last_row)]
+        return edges, born
+
+    def row_data(self, first_cell):
+        """
+        Fodder, number of animals and meat in one row, as needed by the
+        neighbouring band for the propensities.
+
+        Parameters
+        ----------
+        first_cell : int
+            Flat cell index of the first cell in the row
+
+        Returns
+        -------
+        tuple
+            cells, fodder, herbivores, carnivores, meat
+        """
+        cells = np.arange(first_cell, first_cell + self.len_map_x)
+        num_animals_per_cell = self.num_animals_per_cell
+        return (cells, self.fodder[cells],
+                num_animals_per_cell['Herbivore'].ravel()[cells],
+                num_animals_per_cell['Carnivore'].ravel()[cells],
+                self.meat_per_cell()[cells])
+
+    def second_half(self, halos):
+        """
+        Migration with the halo rows from the neighbouring bands, then
+        ageing, weight loss and death. The animals that moved out of the
+        band are taken out and returned.
+
+        Parameters
+        ----------
+        halos : list of tuples
+            row_data of the rows just outside the band
+
+        Returns
+        -------
+        emigrants : dict
+            key : species, value : (age, weight, cell) arrays
+        dead : dict
+            key : species, value : flat cell index of each dead animal
+        counts : dict
+            key : species, value : number of animals in each cell of the
+            band, without the emigrants
+        fodder : np.ndarray
+            Fodder of the cells in the band
+        sums : dict
+            key : species, value : weight_age_sums of the animals in the
+            band, without the emigrants
+        """
+        if halos:
+            cells, fodder, herbs, carns, meat = (np.concatenate(column)
+                                                 for column in zip(*halos))
+            self.fodder[cells] = fodder
+            self.halo = {'cells': cells, 'Herbivore': herbs,
+                         'Carnivore': carns, 'meat': meat}
+        self.migrate()
+        self.age_animals()
+        self.lose_weight()
+
+        emigrants = {}
+        dead = {}
+        counts = {}
+        sums = {}
+        for name, population in self.populations():
+            population.update_fitness()
+            dies = death_mask(population.fitness,
+                              population.parameters.omega, self.rng)
+            dead[name] = population.cell[dies]
+            population.keep(~dies)
+
+            leaves = ((population.cell < self.first_cell)
+                      | (population.cell >= self.stop_cell))
+            emigrants[name] = (population.age[leaves],
+                               population.weight[leaves],
+                               population.cell[leaves])
+            population.keep(~leaves)
+            counts[name] = population.count_per_cell(
+                self.num_cells)[self.first_cell:self.stop_cell]
+            sums[name] = weight_age_sums(population.age, population.weight)
+
+        return (emigrants, dead, counts,
+                self.fodder[self.first_cell:self.stop_cell], sums)
+
+    @property
+    def num_animals_per_cell(self):
+        """
+        Number of animals per species in each cell, with the counts of
+        the halo cells from the neighbouring bands.
+
+        Returns
+        -------
+        num_animals_per_cell : dictionary
+            key : species, value : np.ndarray
+        """
+        num_animals_per_cell = super().num_animals_per_cell
+        if self.halo is not None:
+            for name, counts in num_animals_per_cell.items():
+                counts.ravel()[self.halo['cells']] = self.halo[name]
+        return num_animals_per_cell
+
+    def meat_per_cell(self):
+        """Weight of all herbivores in each cell, with the halo cells"""
+        meat = super().meat_per_cell()
+        if self.halo is not None:
+            meat[self.halo['cells']] = self.halo['meat']
+        return meat
+
+
+def serve_band(connection, island_map_string, first_row, stop_row):
+    """
+    Main loop of a worker process. Keeps one BandIsland and runs the
+    commands sent by ParallelIsland until it gets 'close'.
+
+    The generator of the band is seeded every year by first_half, with a
+    seed from the generator of the main process, so a run is
+    reproducible for the same seed and number of bands.
+
+    Parameters
+    ----------
+    connection : multiprocessing.connection.Connection
+    island_map_string : str
+    first_row : int
+    stop_row : int
+    """
+    band = BandIsland(island_map_string, first_row, stop_row)
+    commands = {'load': band.load,
+                'unload': band.unload,
+                'first_half': band.first_half,
+                'second_half': band.second_half}
+    while True:
+        command, args = connection.recv()
+        if command == 'close':
+            break
+        connection.send(commands[command](*args))
+    connection.close()
+
+
+class ParallelIsland(ColumnarIsland):
+    """
+    Columnar island where the phases of the year run in worker processes,
+    one per band of rows of the map.
+
+    Feeding, birth, ageing, weight loss and death only involve one cell,
+    so each worker runs them on its band alone. Before migration the
+    workers exchange the halo, the edge rows of the neighbouring bands,
+    and after migration only the animals that left a band are sent, to
+    be added to their new band next year.
+
+    The workers are started by the first simulate_one_year and hold the
+    animals while the simulation runs. The main process keeps the fodder
+    and the number of animals per cell up to date every year. gather
+    brings the animals back and stops the workers, which is done before
+    adding animals or pickling. The workers are also stopped by close,
+    at the end of a with block and when the island is garbage collected.
+
+    Attributes
+    ----------
+    num_workers : int or None
+        Class attribute, number of worker processes. None uses one per
+        CPU. Never more than the number of rows
+    bands : list of tuples
+        (first_row, stop_row) of each worker
+    """
+    num_workers = None
+
+    def __init__(self, island_map_string, ini_pop, store_stats=False,
+                 rng=None):
+        """
+        Initializes instance of ParallelIsland
+
+        Parameters
+        ----------
+        island_map_string : str
+            Multilinestring of map
+        ini_pop : dict
+            key : location - Value : list of dict
+        store_stats : bool
+        rng : np.random.Generator or None
+        """
+        self._connections = []
+        self._processes = []
+        self._immigrants = []
+        self._counts = None
+        self._sums = None
+        self.bands = []
+        super().__init__(island_map_string, ini_pop, store_stats, rng)
+
+    def __enter__(self):
+        """Returns the island, the workers are closed on exit"""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Stops the workers"""
+        self.close()
+
+    def __del__(self):
+        """Stops the workers of an island that is no longer used"""
+        if getattr(self, '_connections', None):
+            self.close()
+
+    @property
+    def running(self):
+        """True if the workers hold the animals"""
+        return len(self._connections) > 0
+
+    def scatter(self):
+        """
+        Starts one worker per band and hands each the fodder and animals
+        of its rows.
+        """
+        num_workers = self.num_workers or os.cpu_count() or 1
+        self.bands = split_rows(self.len_map_y, num_workers)
+        island_map_string = self.map_string()
+
+        for first_row, stop_row in self.bands:
+            parent_end, worker_end = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=serve_band, daemon=True,
+                args=(worker_end, island_map_string, first_row, stop_row))
+            process.start()
+            worker_end.close()
+            self._connections.append(parent_end)
+            self._processes.append(process)
+
+        first_cells = self.band_first_cells()
+        for index, connection in enumerate(self._connections):
+            first_cell = first_cells[index]
+            stop_cell = self.bands[index][1] * self.len_map_x
+            columns = []
+            for _, population in self.populations():
+                inside = ((population.cell >= first_cell)
+                          & (population.cell < stop_cell))
+                columns.append((population.age[inside],
+                                population.weight[inside],
+                                population.cell[inside]))
+            connection.send(('load', (self.fodder[first_cell:stop_cell],
+                                      *columns)))
+            connection.recv()
+
+        self._immigrants = [self.empty_arrivals() for _ in self.bands]
+        self._counts = {name: population.count_per_cell(self.num_cells)
+                        for name, population in self.populations()}
+        for _, population in self.populations():
+            population.keep(np.zeros(len(population), dtype=bool))
+
+    def gather(self):
+        """
+        Brings fodder and animals back from the workers, into
+        herbivores and carnivores, and stops the workers.
+        """
+        if not self.running:
+            return
+        first_cells = self.band_first_cells()
+        for connection, first_cell, immigrants in zip(
+                self._connections, first_cells, self._immigrants):
+            connection.send(('unload', ()))
+            fodder, herbivores, carnivores = connection.recv()
+            self.fodder[first_cell:first_cell + len(fodder)] = fodder
+            self.herbivores.add(*herbivores)
+            self.carnivores.add(*carnivores)
+            for name, population in self.populations():
+                population.add(*immigrants[name])
+        self.close()
+
+    def close(self):
+        """Stops the workers, the animals they hold are lost"""
+        for connection in self._connections:
+            connection.send(('close', ()))
+            connection.close()
+        for process in self._processes:
+            process.join()
+        self._connections = []
+        self._processes = []
+        self._immigrants = []
+        self._counts = None
+        self._sums = None
+
+    def band_first_cells(self):
+        """Flat cell index of the first cell of each band"""
+        return [first_row * self.len_map_x for first_row, _ in self.bands]
+
+    def empty_arrivals(self):
+        """Arrays for animals arriving in a band, one tuple per species"""
+        return {name: (np.zeros(0, dtype=np.int64),
+                       np.zeros(0, dtype=np.float64),
+                       np.zeros(0, dtype=np.int64))
+                for name, _ in self.populations()}
+
+    def simulate_one_year(self):
+        """
+        Simulates a whole year in the workers. The main process passes
+        the halo rows between neighbouring bands and sends the migrated
+        animals to their new band.
+        """
+        if not self.running:
+            self.scatter()
+
+        seeds = self.rng.integers(2 ** 31, size=len(self._connections))
+        for connection, immigrants, seed in zip(
+                self._connections, self._immigrants, seeds.tolist()):
+            connection.send(('first_half',
+                             (self.parameters, immigrants, seed)))
+        first_halves = [connection.recv() for connection in self._connections]
+
+        for index, connection in enumerate(self._connections):
+            halos = []
+            if index > 0:
+                halos.append(first_halves[index - 1][0][1])
+            if index < len(self._connections) - 1:
+                halos.append(first_halves[index + 1][0][0])
+            connection.send(('second_half', (halos,)))
+        second_halves = [connection.recv()
+                         for connection in self._connections]
+
+        self._immigrants = [self.empty_arrivals() for _ in self.bands]
+        self._sums = {name: np.zeros(4) for name, _ in self.populations()}
+        first_cells = self.band_first_cells()
+        for (_, born), (emigrants, dead, counts, fodder, sums), first_cell \
+                in zip(first_halves, second_halves, first_cells):
+            stop_cell = first_cell + len(fodder)
+            self.fodder[first_cell:stop_cell] = fodder
+            for name, count in counts.items():
+                self._counts[name][first_cell:stop_cell] = count
+                self._sums[name] += sums[name]
+            self.send_emigrants(emigrants)
+            if self._store_stats:
+                for name in counts:
+                    self.add_stats('birth', name, born[name])
+                    self.add_stats('death', name, dead[name])
+
+        for immigrants in self._immigrants:
+            for name, (age, weight, cells) in immigrants.items():
+                self._counts[name] += np.bincount(cells,
+                                                  minlength=self.num_cells)
+                self._sums[name] += weight_age_sums(age, weight)
+
+        if self._store_stats:
+            self.write_stats()
+        self.year += 1
+        self.update_data_list()
+        if self._store_stats:
+            self.create_and_update_stats_structure()
+
+    def send_emigrants(self, emigrants):
+        """
+        Puts animals that left a band on the list of arrivals of the band
+        of their new cell.
+
+        Parameters
+        ----------
+        emigrants : dict
+            key : species, value : (age, weight, cell) arrays
+        """
+        first_cells = np.array(self.band_first_cells())
+        for name, (age, weight, cell) in emigrants.items():
+            if len(cell) == 0:
+                continue
+            band_of_cell = np.searchsorted(first_cells, cell, side='right') - 1
+            for band in np.unique(band_of_cell).tolist():
+                arrives = band_of_cell == band
+                arrived = self._immigrants[band][name]
+                self._immigrants[band][name] = (
+                    np.concatenate((arrived[0], age[arrives])),
+                    np.concatenate((arrived[1], weight[arrives])),
+                    np.concatenate((arrived[2], cell[arrives])))
+
+    @property
+    def num_animals_per_species(self):
+        """
+        Number of animals per species in island, as dictionary.
+
+        Returns
+        -------
+        num_animals_per_species : dictionary
+        """
+        if not self.running:
+            return super().num_animals_per_species
+        return {name: int(counts.sum())
+                for name, counts in self._counts.items()}
+
+    def count_density(self, counts):
+        """
+        Number of animals of each species in each cell, from the counts
+        sent by the bands while running.
+
+        Parameters
+        ----------
+        counts : np.ndarray
+            int, shape (species, num_cells), filled in place
+        """
+        if not self.running:
+            super().count_density(counts)
+            return
+        for column, name in enumerate(SPECIES):
+            counts[column] = self._counts[name]
+
+    def animal_sums(self):
+        """
+        Sums for the moments of weight and age of each species, sent by
+        the workers while running.
+
+        Returns
+        -------
+        dict
+            key : species, value : from weight_age_sums
+        """
+        if not self.running:
+            return super().animal_sums()
+        return {name: sums.copy() for name, sums in self._sums.items()}
+
+    def add_population(self, population):
+        """
+        Gathers the animals from the workers, if running, then adds the
+        population like ColumnarIsland.
+
+        Parameters
+        ----------
+        population: list
+            loc: tuple
+            pop: dict
+        """
+        self.gather()
+        super().add_population(population)
+
+    def animal_columns(self):
+        """
+        Gathers the animals from the workers, if running, then returns
+        the columns like ColumnarIsland.
+
+        Returns
+        -------
+        dict
+            key : species, value : (age, weight, cell) arrays
+        """
+        self.gather()
+        return super().animal_columns()
+
+    def add_animal_columns(self, columns):
+        """
+        Gathers the animals from the workers, if running, then adds the
+        columns like ColumnarIsland.
+
+        Parameters
+        ----------
+        columns : dict
+            key : species, value : (age, weight, cell) arrays
+        """
+        self.gather()
+        super().add_animal_columns(columns)
+
+    def __getstate__(self):
+        """Gathers the animals, the workers are not pickled"""
+        self.gather()
+        state = self.__dict__.copy()
+        del state['_connections']
+        del state['_processes']
+        return state
+
+    def __setstate__(self, state):
+        """Restores without workers, they start on the next year"""
+        self.__dict__.update(state)
+        self._connections = []
+        self._processes = []
+
+
+if __name__ == '__main__':
+    pass
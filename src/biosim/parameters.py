@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+"""
+"""
+
+__author__ = "Jon-Mikkel Korsvik & Petter Bøe Hørtvedt"
+__email__ = "jonkors@nmbu.no & petterho@nmbu.no"
+
+from typing import NamedTuple
+
+
+class AnimalParameters(NamedTuple):
+    """
+    Immutable parameters of one species for one simulation. Has the same
+    names as the class attributes of BaseAnimal, so it can be used
+    wherever the species class is read for parameters. Being a named
+    tuple it can also be passed to numba kernels as it is.
+
+    Methods
+    -------
+    from_class
+    from_values
+    replace
+    """
+    w_birth: float = 8.0
+    sigma_birth: float = 1.5
+    beta: float = 0.9
+    eta: float = 0.05
+    a_half: float = 40
+    phi_age: float = 0.2
+    w_half: float = 10
+    phi_weight: float = 0.1
+    mu: float = 0.25
+    lambda_: float = 1.0
+    gamma: float = 0.2
+    zeta: float = 3.5
+    xi: float = 1.2
+    omega: float = 0.4
+    F: float = 10.0
+    DeltaPhiMax: float = 10.0
+
+    @classmethod
+    def from_class(cls, species):
+        """
+        Parameters with the current class attributes of a species, the
+        defaults for new simulations.
+
+        Parameters
+        ----------
+        species : class
+            Subclass of BaseAnimal
+
+        Returns
+        -------
+        AnimalParameters
+        """
+        return cls(**{name: getattr(species, name, default)
+                      for name, default in cls._field_defaults.items()})
+
+    @classmethod
+    def from_values(cls, values):
+        """
+        Parameters from values in the order of the fields, like an array
+        read from a checkpoint.
+
+        Parameters
+        ----------
+        values : iterable
+            float
+
+        Returns
+        -------
+        AnimalParameters
+        """
+        return cls._make(values)
+
+    def replace(self, **params):
+        """
+        New parameters with some values changed, checked by the same
+        rules as BaseAnimal.set_parameters. Nothing changes if one value
+        is not valid.
+
+        Parameters
+        ----------
+        params
+            Parameter names and new values
+
+        Returns
+        -------
+        AnimalParameters
+        """
+        for name, value in params.items():
+            if name not in self._fields:
+                raise TypeError(f'{name} is not a parameter of animals')
+            if name == 'eta' and not 1 >= value >= 0:
+                raise ValueError('eta takes int or float '
+                                 'arguments 0 <= eta <= 1 only')
+            if name == 'DeltaPhiMax' and not value > 0:
+                raise ValueError('DeltaPhiMax takes  strictly positive int or '
+                                 'float arguments only')
+            if not value >= 0:
+                raise ValueError(f'{name} takes positive int or float '
+                                 f'arguments only')
+        return self._replace(**params)
+
+
+class LandscapeParameters(NamedTuple):
+    """
+    Immutable parameters of one landscape type for one simulation, with
+    the same names as the class attributes of BaseCell.
+
+    Methods
+    -------
+    from_class
+    from_values
+    replace
+    """
+    passable: bool = True
+    f_max: float = 0
+    alpha: float = 0
+
+    @classmethod
+    def from_class(cls, landscape):
+        """
+        Parameters with the current class attributes of a landscape type.
+
+        Parameters
+        ----------
+        landscape : class
+            Subclass of BaseCell
+
+        Returns
+        -------
+        LandscapeParameters
+        """
+        return cls(**{name: getattr(landscape, name)
+                      for name in cls._fields})
+
+    @classmethod
+    def from_values(cls, values):
+        """
+        Parameters from values in the order of the fields, like an array
+        read from a checkpoint, where passable is stored as a number.
+
+        Parameters
+        ----------
+        values : iterable
+
+        Returns
+        -------
+        LandscapeParameters
+        """
+        passable, f_max, alpha = values
+        return cls(bool(passable), f_max, alpha)
+
+    def replace(self, **params):
+        """
+        New parameters with some values changed, checked by the same
+        rules as BaseCell.set_parameters.
+
+        Parameters
+        ----------
+        params
+            Parameter names and new values
+
+        Returns
+        -------
+        LandscapeParameters
+        """
+        for name, value in params.items():
+            if name not in self._fields:
+                raise TypeError(f'{name} is not a parameter of landscapes')
+            if name == 'passable' and type(value) is not bool:
+                raise ValueError('passable takes bool arguments only')
+            if name != 'passable' and not value >= 0:
+                raise ValueError(f'{name} takes int or float arguments only')
+        return self._replace(**params)
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+"""
+"""
+
+__author__ = "Jon-Mikkel Korsvik & Petter Bøe Hørtvedt"
+__email__ = "jonkors@nmbu.no & petterho@nmbu.no"
+
+import numpy as np
+from .animals import fitness_array
+from .parameters import AnimalParameters
+
+
+class Population:
+    """
+    Columnar storage of all animals of one species on the island.
+
+    Instead of one object per animal, every attribute is kept in its own
+    contiguous array, so the yearly phases can work on whole columns at
+    once. Index i in every column belongs to the same animal.
+
+    Parameters
+    ----------
+    species : class
+        Herbivore or Carnivore
+    parameters : AnimalParameters or None
+        Parameters of the species, from the class if None
+
+    Attributes
+    ----------
+    parameters : AnimalParameters
+    age : np.ndarray
+        int
+    weight : np.ndarray
+        float
+    fitness : np.ndarray
+        float between 0 and 1, valid after update_fitness
+    cell : np.ndarray
+        int, flat index of the cell the animal lives in (y * len_map_x + x)
+
+    Methods
+    -------
+    __len__
+    add
+    keep
+    update_fitness
+    count_per_cell
+    weight_per_cell
+    """
+    columns = ('age', 'weight', 'fitness', 'cell')
+
+    def __init__(self, species, parameters=None):
+        """
+        Creates empty columns for the species
+
+        Parameters
+        ----------
+        species : class
+            Subclass of BaseAnimal
+        parameters : AnimalParameters or None
+        """
+        self.species = species
+        if parameters is None:
+            parameters = AnimalParameters.from_class(species)
+        self.parameters = parameters
+        self.age = np.zeros(0, dtype=np.int64)
+        self.weight = np.zeros(0, dtype=np.float64)
+        self.fitness = np.zeros(0, dtype=np.float64)
+        self.cell = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        """Number of animals in the population"""
+        return len(self.age)
+
+    def add(self, age, weight, cell):
+        """
+        Appends animals to the end of the columns.
+
+        Parameters
+        ----------
+        age : array_like
+            int
+        weight : array_like
+            float
+        cell : array_like or int
+            Flat cell index of the new animals
+
+        Returns
+        -------
+
+        """
+        age = np.asarray(age, dtype=np.int64)
+        weight = np.asarray(weight, dtype=np.float64)
+        cell = np.broadcast_to(np.asarray(cell, dtype=np.int64), age.shape)
+
+        self.age = np.concatenate((self.age, age))
+        self.weight = np.concatenate((self.weight, weight))
+        self.fitness = np.concatenate((self.fitness, np.zeros(len(age))))
+        self.cell = np.concatenate((self.cell, cell))
+        self.update_fitness()
+
+    def keep(self, mask):
+        """
+        Compacts the columns to the animals where mask is True. An array
+        of indices can be given instead, which also reorders the animals.
+
+        Parameters
+        ----------
+        mask : np.ndarray
+            bool, one entry per animal, or int indices
+
+        Returns
+        -------
+
+        """
+        for column in self.columns:
+            setattr(self, column, getattr(self, column)[mask])
+
+    def update_fitness(self):
+        """
+        Recomputes the fitness column from age and weight, animals with
+        weight <= 0 get fitness 0.
+        """
+        species = self.parameters
+        self.fitness = fitness_array(
+            species.phi_age, self.age, species.a_half,
+            species.phi_weight, self.weight, species.w_half)
+
+    def count_per_cell(self, num_cells):
+        """
+        Number of animals in each cell.
+
+        Parameters
+        ----------
+        num_cells : int
+
+        Returns
+        -------
+        np.ndarray
+            int, indexed by flat cell index
+        """
+        return np.bincount(self.cell, minlength=num_cells)
+
+    def weight_per_cell(self, num_cells):
+        """
+        Sum of the weight of the animals in each cell.
+
+        Parameters
+        ----------
+        num_cells : int
+
+        Returns
+        -------
+        np.ndarray
+            float, indexed by flat cell index
+        """
+        return np.bincount(self.cell, weights=self.weight,
+                           minlength=num_cells)
+
+
+def cell_slices(sorted_cells):
+    """
+    Finds the start and stop of each run of equal cell indices.
+
+    Parameters
+    ----------
+    sorted_cells : np.ndarray
+        int, cell indices sorted in ascending order
+
+    Returns
+    -------
+    list of tuples
+        (cell, start, stop)
+    """
+    cells, starts, counts = np.unique(sorted_cells, return_index=True,
+                                      return_counts=True)
+    return list(zip(cells.tolist(), starts.tolist(),
+                    (starts + counts).tolist()))
+
+
+if __name__ == '__main__':
+    pass
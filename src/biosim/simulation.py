@@ -7,8 +7,13 @@ __author__ = "Jon-Mikkel Korsvik & Petter Bøe Hørtvedt"
 __email__ = "jonkors@nmbu.no & petterho@nmbu.no"
 
 
-from .island import Island
-from .visualization import Visuals
+from .island import Island, ColumnarIsland
+from .parallel import ParallelIsland
+from .compiled import CompiledIsland
+from .visualization import (
+    Visuals, YearSnapshot, Renderer, MovieWriter, ffmpeg_path
+)
+from .stats import StatsFile
 from .landscape import (
     Jungle, Ocean, Savanna, Mountain, Desert
 )
@@ -18,51 +23,104 @@ import pandas as pd
 import numpy as np
 import subprocess
 import random
-import pickle
-import os
-
-
-FFMPEG = os.path.join(os.path.dirname(__file__), '../../FFMPEG/ffmpeg.exe')
-
-# Retrieved from:
-# https://stackoverflow.com/questions/19201290/how-to-save-a-dictionary-to-a-file/32216025
+import json
 
 
-def save_sim(simulation, name):
+def save_sim(island, name):
     """
-    Save a state of Simulation
+    Saves a checkpoint of an island to name.npz. The map, fodder,
+    parameters and the age, weight and cell of every animal are stored as
+    typed arrays, the stats are not stored. The state of the generator of
+    the island, of numpy.random and of random is stored as well, so a
+    restored run continues exactly like one that was never saved.
 
     Parameters
     ----------
-    simulation : object
-        Instance of Simulation
+    island : Island
+        Island of any engine
     name : str
-        Save name
-
-    Returns
-    -------
-
+        Save name, without extension
     """
-    with open(name + '.pkl', 'wb') as f:
-        pickle.dump(simulation, f, pickle.HIGHEST_PROTOCOL)
-
-
-def load_sim(name):
+    _, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    arrays = {'letters': np.array(list(island.map_params)),
+              'landscape': island.landscape,
+              'fodder': island.fodder,
+              'year': np.array(island.year),
+              'herbivore_tot_data': np.array(island.herbivore_tot_data),
+              'carnivore_tot_data': np.array(island.carnivore_tot_data),
+              'rng_keys': keys,
+              'rng_pos': np.array(pos),
+              'rng_has_gauss': np.array(has_gauss),
+              'rng_cached_gaussian': np.array(cached_gaussian),
+              'generator_state': np.array(
+                  json.dumps(island.rng.bit_generator.state)),
+              'python_rng_state': np.array(json.dumps(random.getstate()))}
+    for key, parameters in island.parameters.items():
+        arrays['parameters_' + key] = np.array(parameters, dtype=float)
+    for species, (age, weight, cell) in island.animal_columns().items():
+        arrays[species + '_age'] = age
+        arrays[species + '_weight'] = weight
+        arrays[species + '_cell'] = cell
+    np.savez(name + '.npz', **arrays)
+
+
+def load_sim(name, island_class=Island, store_stats=False, rng=None):
     """
-    Loads state of Simulation
+    Restores an island from a checkpoint made by save_sim, and sets the
+    state of its generator, numpy.random and random to what they were
+    when it was saved. The island can be of another engine than the one
+    saved, but only the same engine continues bit for bit.
 
     Parameters
     ----------
-    name : file
-        Name of file
+    name : str
+        Save name, without extension
+    island_class : class
+        Island or a subclass, the engine of the restored island
+    store_stats : bool
+        Stats start over from the year of the checkpoint
+    rng : np.random.Generator or None
+        Generator for the island, its state is replaced by the one in the
+        checkpoint. A new generator if None
 
     Returns
     -------
-    Loaded file of Simulation
-
+    Island
+        Instance of island_class
     """
-    with open(name + '.pkl', 'rb') as f:
-        return pickle.load(f)
+    with np.load(name + '.npz') as checkpoint:
+        letters = checkpoint['letters'].tolist()
+        island_map_string = '\n'.join(
+            ''.join(letters[code] for code in row)
+            for row in checkpoint['landscape'].tolist())
+        island = island_class(island_map_string, [], store_stats, rng)
+
+        island.update_parameters(
+            {key: type(parameters).from_values(
+                checkpoint['parameters_' + key].tolist())
+             for key, parameters in island.parameters.items()})
+        island.fodder[:] = checkpoint['fodder']
+        island.year = int(checkpoint['year'])
+        island.herbivore_tot_data = checkpoint['herbivore_tot_data'].tolist()
+        island.carnivore_tot_data = checkpoint['carnivore_tot_data'].tolist()
+        island.add_animal_columns(
+            {species: (checkpoint[species + '_age'],
+                       checkpoint[species + '_weight'],
+                       checkpoint[species + '_cell'])
+             for species in ('Herbivore', 'Carnivore')})
+        if store_stats:
+            island.create_and_update_stats_structure()
+
+        island.rng.bit_generator.state = json.loads(
+            str(checkpoint['generator_state']))
+        np.random.set_state(('MT19937', checkpoint['rng_keys'],
+                             int(checkpoint['rng_pos']),
+                             int(checkpoint['rng_has_gauss']),
+                             float(checkpoint['rng_cached_gaussian'])))
+        version, internal_state, gauss_next = json.loads(
+            str(checkpoint['python_rng_state']))
+        random.setstate((version, tuple(internal_state), gauss_next))
+    return island
 
 
 class BioSim:
@@ -92,6 +150,11 @@ class BioSim:
                   """
     default_map = textwrap.dedent(default_map)
 
+    engines = {'object': Island,
+               'columnar': ColumnarIsland,
+               'parallel': ParallelIsland,
+               'numba': CompiledIsland}
+
     default_population = [
         {
             "loc": (10, 10),
@@ -120,12 +183,21 @@ class BioSim:
         img_fmt="png",
         movie_fmt="mp4",
         island_save_name=None,
-        store_stats=False
+        store_stats=False,
+        engine='object',
+        num_workers=None,
+        stats_path=None,
+        headless=False,
+        stream_movie=False
     ):
         """
         :param island_map: Multi-line string specifying island geography
         :param ini_pop: List of dictionaries specifying initial population
-        :param seed: Integer used as random number seed
+        :param seed: Integer used as random number seed. Seeds the
+            numpy.random.Generator owned by the simulation, self.rng, which
+            makes every random draw of the island. numpy.random and random
+            are seeded too. Not used with island_save_name, the random
+            state of the checkpoint is restored instead
         :param ymax_animals: Number specifying y-axis limit for graph showing
             animal numbers
         :param cmax_animals: Dict specifying color-code limits for animal
@@ -133,10 +205,27 @@ class BioSim:
         :param img_base: String with beginning of file name for figures,
             including path
         :param img_fmt: String with file type for figures, e.g. 'png'
-        :param island_save_name: Name of previously saved game, directory is
-            already defined within the project.
+        :param island_save_name: Name of a checkpoint made by save_sim,
+            without the .npz extension. The island is restored with the
+            given engine, island_map and ini_pop are not used
         :param store_stats: boolean statement, wether to store all dead and
             born animals overtime for analysis
+        :param engine: String, 'object' keeps every animal as an instance
+            in its cell, 'columnar' keeps each species in arrays,
+            'parallel' is columnar with the map split in bands of rows run
+            by worker processes, 'numba' is columnar with the phases as
+            compiled numba kernels
+        :param num_workers: Number of worker processes for the 'parallel'
+            engine, default is one per CPU
+        :param stats_path: Directory the stats are written to every year
+            when store_stats is True, a temporary directory if None
+        :param headless: boolean statement, if True simulate draws the
+            figures off-screen in a background thread and never shows a
+            window, so the simulation does not wait for the drawing
+        :param stream_movie: boolean statement, if True the figures are
+            piped to ffmpeg as they are made and encoded into the movie
+            '{img_base}.{movie_fmt}', instead of written as image files.
+            make_movie finishes the movie
 
         If ymax_animals is None, the y-axis limit should be adjusted
         automatically.
@@ -155,53 +244,58 @@ class BioSim:
         """
         if ini_pop is None:
             ini_pop = self.default_population
-        if island_save_name is None:
-            if island_map is None:
-                self.island = Island(self.default_map, ini_pop, store_stats)
-            else:
-                self.island = Island(island_map, ini_pop, store_stats)
-        else:
-            self.island = load_sim(island_save_name)
+        if engine not in self.engines:
+            raise ValueError('Unknown engine: ' + str(engine))
+        island_class = self.engines[engine]
 
+        self.rng = np.random.default_rng(seed)
         if seed is not None:
             np.random.seed(seed)
             random.seed(seed)
 
+        if island_save_name is None:
+            if island_map is None:
+                self.island = island_class(self.default_map, ini_pop,
+                                           store_stats, self.rng)
+            else:
+                self.island = island_class(island_map, ini_pop, store_stats,
+                                           self.rng)
+        else:
+            self.island = load_sim(island_save_name, island_class,
+                                   store_stats, self.rng)
+        if num_workers is not None:
+            self.island.num_workers = num_workers
+        if store_stats and stats_path is not None:
+            self.island.stats_file = StatsFile(stats_path)
+
         self.ymax_animals = ymax_animals
         self.cmax_animals = cmax_animals
         self.img_base = img_base
         self.img_fmt = img_fmt
         self.movie_fmt = movie_fmt
+        self.headless = headless
+        self.stream_movie = stream_movie
+        self._movie = None
 
-    @staticmethod
-    def set_animal_parameters(species, params):
+    def set_animal_parameters(self, species, params):
         """
-        Set parameters for animal species.
+        Set parameters for animal species in this simulation only. The
+        defaults for new simulations are the class attributes, set by
+        Herbivore.set_parameters and Carnivore.set_parameters.
 
         :param species: String, name of animal species
         :param params: Dict with valid parameter specification for species
         """
+        self.island.set_animal_parameters(species, params)
 
-        animal_species = {'Herbivore': Herbivore,
-                          'Carnivore': Carnivore}
-
-        animal_species[species].set_parameters(**params)
-
-    @staticmethod
-    def set_landscape_parameters(landscape, params):
+    def set_landscape_parameters(self, landscape, params):
         """
-        Set parameters for landscape type.
+        Set parameters for landscape type in this simulation only.
 
         :param landscape: String, code letter for landscape
         :param params: Dict with valid parameter specification for landscape
         """
-        map_params = {'O': Ocean,
-                      'M': Mountain,
-                      'D': Desert,
-                      'S': Savanna,
-                      'J': Jungle}
-
-        map_params[landscape].set_parameters(**params)
+        self.island.set_landscape_parameters(landscape, params)
 
     def clean_simulation(self, num_years):
         """
@@ -215,10 +309,37 @@ class BioSim:
         -------
 
         """
-        index = 1
-        while index <= num_years:
-            self.island.simulate_one_year()
-            index += 1
+        try:
+            index = 1
+            while index <= num_years:
+                self.island.simulate_one_year()
+                index += 1
+        except BaseException:
+            self.stop_workers(keep_animals=False)
+            raise
+        self.stop_workers()
+
+    def stop_workers(self, keep_animals=True):
+        """
+        Stops the worker processes of the 'parallel' engine, done when a
+        simulation finishes. They start again with the next simulation.
+
+        Parameters
+        ----------
+        keep_animals : bool
+            Brings the animals back from the workers, False drops them,
+            as after an error in the workers
+
+        Returns
+        -------
+
+        """
+        if not isinstance(self.island, ParallelIsland):
+            return
+        if keep_animals:
+            self.island.gather()
+        else:
+            self.island.close()
 
     def simulate(self, num_years, vis_years=1, img_years=None):
         """
@@ -229,28 +350,56 @@ class BioSim:
         :param img_years: years between visualizations saved to files
             (default: vis_years)
 
-        Image files will be numbered consecutively.
+        Image files will be numbered consecutively. If the simulation is
+        headless, the figures are drawn by a Renderer while the island is
+        simulated, and simulate returns when all are drawn and saved.
         """
-
-        visuals = Visuals(self.island, num_years, self.ymax_animals,
-                          self.cmax_animals, self.img_base, self.img_fmt)
-
         if img_years is None:
             img_years = vis_years
         if img_years % vis_years != 0:
             raise ValueError('img_years must be a multiple of vis_years')
-        if self.img_base is not None:
-            visuals.save_fig()
-
-        index = 1
-        while index <= num_years:
-            self.island.simulate_one_year()
-            if index % vis_years == 0:
-                visuals.update_fig(self.island)
-            if self.img_base is not None:
-                if index % img_years == 0:
+
+        visuals = Visuals(self.island, num_years, self.ymax_animals,
+                          self.cmax_animals, self.img_base, self.img_fmt,
+                          self.headless)
+        if self.stream_movie and self.img_base is not None:
+            if self._movie is None:
+                if self.movie_fmt != 'mp4':
+                    raise ValueError('Unknown movie format: ' +
+                                     self.movie_fmt)
+                self._movie = MovieWriter(f'{self.img_base}.{self.movie_fmt}')
+            visuals.movie = self._movie
+        renderer = None
+        if self.headless:
+            renderer = Renderer(visuals)
+            update_fig = renderer.submit
+        else:
+            def update_fig(snapshot, save=False):
+                if snapshot is not None:
+                    visuals.update_fig(snapshot)
+                if save:
                     visuals.save_fig()
-            index += 1
+
+        try:
+            if self.img_base is not None:
+                update_fig(None, save=True)
+
+            index = 1
+            while index <= num_years:
+                self.island.simulate_one_year()
+                if index % vis_years == 0:
+                    save = (self.img_base is not None and
+                            index % img_years == 0)
+                    update_fig(YearSnapshot.from_island(self.island,
+                                                       self.headless), save)
+                index += 1
+        except BaseException:
+            self.stop_workers(keep_animals=False)
+            raise
+        finally:
+            if renderer is not None:
+                renderer.close()
+        self.stop_workers()
 
     def add_population(self, population):
         """
@@ -282,12 +431,15 @@ class BioSim:
         """Pandas DataFrame with animal count per species for each cell
         on island."""
         dict_for_df = {"Row": [], "Col": [], "Herbivore": [], "Carnivore": []}
-        for pos, cell in self.island.map.items():
+        num_animals_per_cell = self.island.num_animals_per_cell
+        for pos in self.island.map.keys():
             row, col = pos
             dict_for_df["Row"].append(row)
             dict_for_df["Col"].append(col)
-            dict_for_df["Herbivore"].append(cell.num_herbivores)
-            dict_for_df["Carnivore"].append(cell.num_carnivores)
+            dict_for_df["Herbivore"].append(
+                num_animals_per_cell['Herbivore'][pos])
+            dict_for_df["Carnivore"].append(
+                num_animals_per_cell['Carnivore'][pos])
 
         df_sim = pd.DataFrame.from_dict(dict_for_df)
         if save_name is not None:
@@ -297,7 +449,8 @@ class BioSim:
     def island_stats(self):
         """
         Creates dictionary for birth and death rate. Can be used as an example
-        for extracting data from stats.
+        for extracting data from stats. Reads the yearly rows of the stats
+        file of the island when called.
 
         Returns
         -------
@@ -316,35 +469,22 @@ class BioSim:
         birth_rate_per_year_herb = {}
         birth_rate_per_year_carn = {}
 
-        for year, value in self.island.stats.items():
-            deaths_herb = 0
-            deaths_carn = 0
-            born_herb = 0
-            born_carn = 0
-            death_per_pos_herb = value['Herbivore']['death']
-            death_per_pos_carn = value['Carnivore']['death']
-            birth_per_pos_herb = value['Herbivore']['birth']
-            birth_per_pos_carn = value['Carnivore']['birth']
-
-            N_herbivores = value['Herbivore']['alive']
-            for dead in death_per_pos_herb.values():
-                deaths_herb += len(dead)
-            death_rate_per_year_herb[year] = deaths_herb / N_herbivores
-
-            for born in birth_per_pos_herb.values():
-                born_herb += len(born)
-            birth_rate_per_year_herb[year] = born_herb / N_herbivores
-
-            N_carnivores = value['Carnivore']['alive']
+        years = self.island.stats_file.years()
+        for index, year in enumerate(years['year'].tolist()):
+            N_herbivores = int(years['Herbivore_alive'][index])
+            if N_herbivores > 0:
+                death_rate_per_year_herb[year] = (
+                    int(years['Herbivore_death'][index]) / N_herbivores)
+                birth_rate_per_year_herb[year] = (
+                    int(years['Herbivore_birth'][index]) / N_herbivores)
+
+            N_carnivores = int(years['Carnivore_alive'][index])
             if N_carnivores <= 0:
                 continue
-            for dead in death_per_pos_carn.values():
-                deaths_carn += len(dead)
-            death_rate_per_year_carn[year] = deaths_carn / N_carnivores
-
-            for born in birth_per_pos_carn.values():
-                born_carn += len(born)
-            birth_rate_per_year_carn[year] = born_carn / N_carnivores
+            death_rate_per_year_carn[year] = (
+                int(years['Carnivore_death'][index]) / N_carnivores)
+            birth_rate_per_year_carn[year] = (
+                int(years['Carnivore_birth'][index]) / N_carnivores)
 
         return (
             death_rate_per_year_herb, death_rate_per_year_carn,
@@ -352,26 +492,32 @@ class BioSim:
         )
 
     def make_movie(self):
-        """Create MPEG4 movie from visualization images saved."""
+        """
+        Create MPEG4 movie from visualization images saved, with ffmpeg
+        found on PATH. If the figures were streamed, the movie is
+        finished instead.
+        """
 
         if self.img_base is None:
             raise RuntimeError("No filename defined.")
 
-        if self.movie_fmt == 'mp4':
-            try:
-                subprocess.check_call(f'{FFMPEG} -y -r 8 -i '
-                                      f'{self.img_base}_%05d.{self.img_fmt}'
-                                      f' -c:v libx264 -vf fps=25 -pix_fmt '
-                                      f'yuv420p '
-                                      f'-start_number 0 '
-                                      f'{self.img_base}.{self.movie_fmt}')
-            except subprocess.CalledProcessError as err:
-                raise RuntimeError(f'ERROR: ffmpeg failed with: {err}')
-        else:
+        if self.movie_fmt != 'mp4':
             raise ValueError('Unknown movie format: ' + self.movie_fmt)
+        if self._movie is not None:
+            movie, self._movie = self._movie, None
+            movie.close()
+            return
+        try:
+            subprocess.check_call([
+                ffmpeg_path(), '-y', '-r', '8',
+                '-i', f'{self.img_base}_%05d.{self.img_fmt}',
+                '-c:v', 'libx264', '-vf', 'fps=25', '-pix_fmt', 'yuv420p',
+                '-start_number', '0', f'{self.img_base}.{self.movie_fmt}'])
+        except subprocess.CalledProcessError as err:
+            raise RuntimeError(f'ERROR: ffmpeg failed with: {err}')
 
     def save_sim(self, name):
-        """Calls function: save_sim outside Simulation"""
+        """Calls function: save_sim outside Simulation, writes name.npz"""
         save_sim(self.island, name)
 
 
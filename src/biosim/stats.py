@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+"""
+"""
+
+__author__ = "Jon-Mikkel Korsvik & Petter Bøe Hørtvedt"
+__email__ = "jonkors@nmbu.no & petterho@nmbu.no"
+
+import os
+import tempfile
+import numpy as np
+
+SPECIES = ('Herbivore', 'Carnivore')
+
+
+def weight_age_sums(age, weight):
+    """
+    Sums needed for the yearly moments of one species. Sums of several
+    parts of a population, like the bands of ParallelIsland, add up to
+    the sums of the whole population.
+
+    Parameters
+    ----------
+    age : np.ndarray
+    weight : np.ndarray
+
+    Returns
+    -------
+    np.ndarray
+        float, number of animals, sum of weight, sum of squared weight
+        and sum of age
+    """
+    weight = np.asarray(weight, dtype=np.float64)
+    return np.array([len(weight), weight.sum(), (weight ** 2).sum(),
+                     np.asarray(age).sum()], dtype=np.float64)
+
+
+def moments(sums):
+    """
+    Mean and variance of the weight and mean age from weight_age_sums.
+
+    Parameters
+    ----------
+    sums : np.ndarray
+
+    Returns
+    -------
+    tuple
+        weight mean, weight variance, age mean, all nan if there are no
+        animals
+    """
+    count, weight_sum, weight_squared_sum, age_sum = sums.tolist()
+    if count == 0:
+        return np.nan, np.nan, np.nan
+    weight_mean = weight_sum / count
+    weight_var = max(weight_squared_sum / count - weight_mean ** 2, 0.0)
+    return weight_mean, weight_var, age_sum / count
+
+
+class StatsFile:
+    """
+    Append-only columnar file of the stats of a run. Every column is a
+    raw binary file in one directory, one table per year and one with a
+    row for each cell and year with births or deaths. Rows are appended
+    at the end of every year, so nothing is kept in memory, and the
+    columns are read back as memory maps.
+
+    Table 'years', for each species:
+    alive (at the start of the year), birth, death, weight_mean,
+    weight_var and age_mean (of the animals alive at the end of the year),
+    as columns named like 'Herbivore_birth'.
+
+    Table 'cells': year, cell (flat cell index) and for each species
+    birth and death.
+
+    Parameters
+    ----------
+    path : str or None
+        Directory of the files, a temporary directory removed with the
+        StatsFile if None
+    append : bool
+        If False, columns already in path are emptied
+
+    Methods
+    -------
+    append
+    read
+    years
+    cells
+    """
+    tables = {
+        'years': [('year', np.int64)] + [
+            (species + '_' + name, dtype) for species in SPECIES
+            for name, dtype in (('alive', np.int64), ('birth', np.int64),
+                                ('death', np.int64),
+                                ('weight_mean', np.float64),
+                                ('weight_var', np.float64),
+                                ('age_mean', np.float64))],
+        'cells': [('year', np.int64), ('cell', np.int64)] + [
+            (species + '_' + name, np.int64) for species in SPECIES
+            for name in ('birth', 'death')]
+    }
+
+    def __init__(self, path=None, append=False):
+        """
+        Opens the directory of the stats file
+
+        Parameters
+        ----------
+        path : str or None
+        append : bool
+        """
+        self._temporary = None
+        if path is None:
+            self._temporary = tempfile.TemporaryDirectory(
+                prefix='biosim_stats_')
+            path = self._temporary.name
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        if not append:
+            for table, columns in self.tables.items():
+                for column, _ in columns:
+                    open(self.column_path(table, column), 'wb').close()
+
+    def column_path(self, table, column):
+        """File name of a column"""
+        return os.path.join(self.path, f'{table}.{column}.bin')
+
+    def _write(self, table, values):
+        """Appends values, a dict of column name and array, to table"""
+        for column, dtype in self.tables[table]:
+            with open(self.column_path(table, column), 'ab') as file:
+                np.asarray(values[column], dtype=dtype).tofile(file)
+
+    def append(self, year, alive, birth, death, sums):
+        """
+        Appends the stats of one year.
+
+        Parameters
+        ----------
+        year : int
+        alive : dict
+            key : species, value : number of animals at the start of year
+        birth : dict
+            key : species, value : np.ndarray of births per flat cell index
+        death : dict
+            key : species, value : np.ndarray of deaths per flat cell index
+        sums : dict
+            key : species, value : weight_age_sums of the animals alive
+        """
+        row = {'year': [year]}
+        for species in SPECIES:
+            weight_mean, weight_var, age_mean = moments(sums[species])
+            row[species + '_alive'] = [alive[species]]
+            row[species + '_birth'] = [birth[species].sum()]
+            row[species + '_death'] = [death[species].sum()]
+            row[species + '_weight_mean'] = [weight_mean]
+            row[species + '_weight_var'] = [weight_var]
+            row[species + '_age_mean'] = [age_mean]
+        self._write('years', row)
+
+        cells = np.flatnonzero(sum(birth[species] + death[species]
+                                   for species in SPECIES))
+        rows = {'year': np.full(len(cells), year), 'cell': cells}
+        for species in SPECIES:
+            rows[species + '_birth'] = birth[species][cells]
+            rows[species + '_death'] = death[species][cells]
+        self._write('cells', rows)
+
+    def read(self, table):
+        """
+        Columns of a table, read lazily through memory maps.
+
+        Parameters
+        ----------
+        table : str
+            'years' or 'cells'
+
+        Returns
+        -------
+        dict
+            key : column name, value : np.ndarray
+        """
+        columns = {}
+        for column, dtype in self.tables[table]:
+            path = self.column_path(table, column)
+            if os.path.getsize(path) == 0:
+                columns[column] = np.zeros(0, dtype=dtype)
+            else:
+                columns[column] = np.memmap(path, dtype=dtype, mode='r')
+        return columns
+
+    def years(self):
+        """Columns of the table with one row per year"""
+        return self.read('years')
+
+    def cells(self):
+        """Columns of the table with one row per cell and year"""
+        return self.read('cells')
+
+
+if __name__ == '__main__':
+    pass
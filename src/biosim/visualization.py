@@ -6,10 +6,72 @@
 __author__ = "Jon-Mikkel Korsvik & Petter Bøe Hørtvedt"
 __email__ = "jonkors@nmbu.no & petterho@nmbu.no"
 
+import queue
+import shutil
+import subprocess
+import threading
+from typing import NamedTuple
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import numpy as np
 from .island import Island
+from .stats import SPECIES
+
+
+def ffmpeg_path():
+    """
+    Finds ffmpeg, by the name or path in matplotlib's rcParams
+    'animation.ffmpeg_path', 'ffmpeg' by default, looked up on PATH.
+
+    Returns
+    -------
+    str
+    """
+    path = shutil.which(plt.rcParams['animation.ffmpeg_path'])
+    if path is None:
+        raise RuntimeError('ffmpeg not found, put it on PATH or set '
+                           "matplotlib.rcParams['animation.ffmpeg_path']")
+    return path
+
+
+class YearSnapshot(NamedTuple):
+    """
+    What Visuals shows of one year, taken from the island so the figure
+    can be updated while the island goes on to the next year.
+    """
+    year: int
+    num_herbivores: int
+    num_carnivores: int
+    herbivore_density: np.ndarray
+    carnivore_density: np.ndarray
+
+    @classmethod
+    def from_island(cls, island, copy=False):
+        """
+        Snapshot of the current year of island. The densities are views of
+        Island.density, which changes with the island, unless copied.
+
+        Parameters
+        ----------
+        island : object
+            Instance of Island
+        copy : bool
+            If True the densities are copied, needed when the snapshot is
+            used after the island has gone on, like by Renderer
+
+        Returns
+        -------
+        YearSnapshot
+        """
+        density = island.density
+        if copy:
+            density = density.copy()
+        return cls(island.year, island.herbivore_tot_data[-1],
+                   island.carnivore_tot_data[-1],
+                   density[SPECIES.index('Herbivore')],
+                   density[SPECIES.index('Carnivore')])
 
 
 class Visuals:
@@ -30,9 +92,23 @@ class Visuals:
        Where to store pictures and make movie from
     img_fmt : filetype
        Default: 'png'
+    headless : bool
+       If True the figure is drawn on an off-screen Agg canvas, not known
+       to pyplot, and update_fig never runs the GUI event loop. A headless
+       Visuals can be updated from another thread, see Renderer
 
     Attributes
     ----------
+    movie : MovieWriter or None
+        If set, save_fig sends the figure to the movie instead of writing
+        an image file
+    herbivores_over_time_data : np.ndarray
+        float, number of herbivores indexed by year, nan for the years not
+        shown yet. Grows when a year does not fit
+    carnivores_over_time_data : np.ndarray
+        float, as herbivores_over_time_data
+    num_points : int
+        Number of years shown in the line graph
     cell_colors : dict
         cell type to color name
     density_heatmap : dict
@@ -55,9 +131,12 @@ class Visuals:
             ymax_animals=None,
             cmax_animals=None,
             img_base=None,
-            img_fmt='png'
+            img_fmt='png',
+            headless=False
     ):
         self.img_num = 0
+        self.headless = headless
+        self.movie = None
         self.x_len = island.len_map_x  # Double code
         self.y_len = island.len_map_y  # Double code
         self.num_years_sim = num_years_sim
@@ -96,8 +175,11 @@ class Visuals:
         self.carnivores_over_time_data = None
         self.years = None
 
+        self.num_points = 0
+
         self.line_carnivore = None
         self.line_herbivore = None
+        self._background = None
 
         self.setup_graphics(island)
         self.pixel_colors = self.make_color_pixels(island)
@@ -112,28 +194,18 @@ class Visuals:
         )
         self.draw_animals_over_time(island)
 
+        if not self.headless:
+            for artist in self.animated_artists():
+                artist.set_animated(True)
+            self.figure.canvas.mpl_connect('draw_event',
+                                           self.save_background)
+
         """
         self.tot_num_ani_by_species = self.line_graph(island_map)
         self.population_map_herb = self.heatmap_herb(island_map)
         self.population_map_carn = self.heatmap_carn(island_map)
         """
 
-    def empty_nested_list(self):
-        """
-        Creates an empty list indexed by y and x (row, columns)
-        Returns
-        -------
-        empty_nested_list : list
-            Nested list
-
-        """
-        empty_nested_list = []
-        for y in range(self.y_len):
-            empty_nested_list.append([])
-            for x in range(self.x_len):
-                empty_nested_list[y].append(None)
-        return empty_nested_list
-
     def setup_graphics(self, island):
         """
         Sets up graphics and places figures in the right place.
@@ -148,7 +220,12 @@ class Visuals:
 
         """
         if self.figure is None:
-            self.figure = plt.figure(constrained_layout=True, figsize=(16, 9))
+            if self.headless:
+                self.figure = Figure(constrained_layout=True, figsize=(16, 9))
+                FigureCanvasAgg(self.figure)
+            else:
+                self.figure = plt.figure(constrained_layout=True,
+                                         figsize=(16, 9))
             self.grid = self.figure.add_gridspec(2, 24)
 
         # The map
@@ -202,10 +279,12 @@ class Visuals:
 
     def make_color_pixels(self, island):
         """
-        Creates a list indexed by [y][x] that represents an color by type of
-        cell. The color is collected from a class variable called color_params
+        Creates an image indexed by [y, x] that represents a color by type
+        of cell. The colors are collected from the class variable
+        cell_colors, the image is made and cached by
+        Island.landscape_raster.
 
-        For example: pixel_colors[0][0] = the color code for cyan in rgba
+        For example: pixel_colors[0, 0] = the color code for cyan in rgb
                     (since all cell at the edges shall be ocean)
 
         Parameters
@@ -214,19 +293,14 @@ class Visuals:
 
         Returns
         -------
-        pixel_colors : list
-            Nested with triplets of rgb-values
+        pixel_colors : np.ndarray
+            uint8, shape (y, x, 3), read-only
 
         """
-        pixel_colors = self.empty_nested_list()
-
-        for pos, cell in island.map.items():
-            y, x = pos
-            name_of_class = cell.__class__.__name__
-            color_name = self.cell_colors[name_of_class]
-            color_code_rgb = mcolors.to_rgb(color_name)
-            pixel_colors[y][x] = color_code_rgb
-        return pixel_colors
+        palette = np.array(
+            [mcolors.to_rgb(self.cell_colors[landscape_type.__name__])
+             for landscape_type in island.landscape_types])
+        return island.landscape_raster(np.round(palette * 255))
 
     def draw_geography(self):
         """
@@ -266,13 +340,15 @@ class Visuals:
                 transform=self.island_map_exp_ax.transAxes
             )
 
-    def update_year(self, island):
-        """Updates title of map to current year"""
-        self.island_map_ax.set_title(f' Year: {island.year}')
+    def update_year(self, snapshot):
+        """Updates title of map to the year of snapshot"""
+        self.island_map_ax.set_title(f' Year: {snapshot.year}')
 
     def draw_animals_over_time(self, island):
         """
-        Draw line graph for herbivores and carnivores over time.
+        Draw line graph for herbivores and carnivores over time. The
+        buffers hold the years of island so far and room for the years to
+        simulate, padded with nan.
 
         Parameters
         ----------
@@ -283,58 +359,83 @@ class Visuals:
         -------
 
         """
-        self.herbivores_over_time_data = island.herbivore_tot_data.copy()
-        self.carnivores_over_time_data = island.carnivore_tot_data.copy()
-        self.years = [year for year in range(island.year + 1)]
-        for n in range(self.num_years_sim):
-            self.herbivores_over_time_data.append(None)
-            self.carnivores_over_time_data.append(None)
-            self.years.append(island.year + n + 1)
+        self.num_points = len(island.herbivore_tot_data)
+        capacity = self.num_points + self.num_years_sim
+        self.years = np.arange(capacity, dtype=float)
+        self.herbivores_over_time_data = np.full(capacity, np.nan)
+        self.carnivores_over_time_data = np.full(capacity, np.nan)
+        self.herbivores_over_time_data[:self.num_points] = \
+            island.herbivore_tot_data
+        self.carnivores_over_time_data[:self.num_points] = \
+            island.carnivore_tot_data
 
-        self.herbivores_over_time_data = np.array(
-            self.herbivores_over_time_data)
-        self.carnivores_over_time_data = np.array(
-            self.carnivores_over_time_data)
-        self.years = np.array(self.years)
         self.line_carnivore, = self.animals_over_time_ax.plot(
-            self.years, self.carnivores_over_time_data,
+            self.years[:self.num_points],
+            self.carnivores_over_time_data[:self.num_points],
             color='r', label='Carnivore'
         )
-
         self.line_herbivore, = self.animals_over_time_ax.plot(
-            self.years, self.herbivores_over_time_data, color='b', label='Herbivore'
+            self.years[:self.num_points],
+            self.herbivores_over_time_data[:self.num_points],
+            color='b', label='Herbivore'
         )
         self.animals_over_time_ax.set(
             xlabel='Years', ylabel='Number of Animals'
         )
         self.animals_over_time_ax.legend(loc='upper left')
 
-    def update_animals_over_time(self, island):
+    def grow_animals_over_time(self, min_capacity):
         """
-        Collect data from island instance to plot graph
+        Doubles the buffers of the line graph until min_capacity years
+        fit, and widens the x-axis to match.
 
         Parameters
         ----------
-        island : object
-            Instance of Island
+        min_capacity : int
+        """
+        capacity = len(self.years)
+        while capacity < min_capacity:
+            capacity *= 2
+        for name in ('herbivores_over_time_data',
+                     'carnivores_over_time_data'):
+            grown = np.full(capacity, np.nan)
+            old = getattr(self, name)
+            grown[:len(old)] = old
+            setattr(self, name, grown)
+        self.years = np.arange(capacity, dtype=float)
+        self.animals_over_time_ax.set_xlim(right=capacity - 1)
+        self._background = None
+
+    def update_animals_over_time(self, snapshot):
+        """
+        Adds the number of animals of one year to the graph. Only the
+        years shown so far are handed to the lines, the buffers grow if
+        the year does not fit, like when a run is continued.
+
+        Parameters
+        ----------
+        snapshot : YearSnapshot
 
         Returns
         -------
 
         """
-        # Island has property or attribute year
-        self.herbivores_over_time_data[island.year] = island.herbivore_tot_data[-1]
-        self.carnivores_over_time_data[island.year] = island.carnivore_tot_data[-1]
-
-        self.line_herbivore.set_ydata(self.herbivores_over_time_data)
-
-        self.line_carnivore.set_ydata(self.carnivores_over_time_data)
-
-
+        if snapshot.year >= len(self.years):
+            self.grow_animals_over_time(snapshot.year + 1)
+        self.herbivores_over_time_data[snapshot.year] = snapshot.num_herbivores
+        self.carnivores_over_time_data[snapshot.year] = snapshot.num_carnivores
+        self.num_points = max(self.num_points, snapshot.year + 1)
+
+        years = self.years[:self.num_points]
+        self.line_herbivore.set_data(
+            years, self.herbivores_over_time_data[:self.num_points])
+        self.line_carnivore.set_data(
+            years, self.carnivores_over_time_data[:self.num_points])
 
     def get_data_heat_map(self, island, data_type):
         """
-        Could have also used pandas DF to get data.
+        Density of animals from Island.density, without copying for one
+        species.
 
         Parameters
         ----------
@@ -344,13 +445,16 @@ class Visuals:
 
         Returns
         -------
+        heat_map : np.ndarray
+            indexed by [y, x]
 
         """
-        heat_map = self.empty_nested_list()
-        for pos, cell in island.map.items():
-            y, x = pos
-            heat_map[y][x] = getattr(cell, data_type)
-        return heat_map
+        density = island.density
+        if data_type == 'num_herbivores':
+            return density[SPECIES.index('Herbivore')]
+        if data_type == 'num_carnivores':
+            return density[SPECIES.index('Carnivore')]
+        return density.sum(axis=0)
 
     def draw_heat_map_herbivore(self, heat_map):
         """
@@ -358,8 +462,8 @@ class Visuals:
 
         Parameters
         ----------
-        heat_map : list
-            Nested list with int
+        heat_map : np.ndarray
+            int, indexed by [y, x]
 
         Returns
         -------
@@ -369,7 +473,7 @@ class Visuals:
         self.heat_map_herbivores_ax.set_title('Distribution of Herbivores')
         self.heat_map_herb_img_ax = self.heat_map_herbivores_ax.imshow(
             heat_map, cmap='inferno', vmax=self.cmax_animals['Herbivore'])
-        plt.colorbar(
+        self.figure.colorbar(
             self.heat_map_herb_img_ax, cax=self.colorbar_herb_ax
         )
 
@@ -379,8 +483,8 @@ class Visuals:
 
         Parameters
         ----------
-        heat_map : list
-           Nested list with int
+        heat_map : np.ndarray
+           int, indexed by [y, x]
 
         Returns
         -------
@@ -390,38 +494,94 @@ class Visuals:
         self.heat_map_carnivores_ax.set_title('Distribution of Carnivores')
         self.heat_map_carn_img_ax = self.heat_map_carnivores_ax.imshow(
             heat_map, cmap='inferno', vmax=self.cmax_animals['Carnivore'])
-        plt.colorbar(
+        self.figure.colorbar(
             self.heat_map_carn_img_ax, cax=self.colorbar_carn_ax
         )
 
-    def update_heat_maps(self, island):
+    def update_heat_maps(self, snapshot):
         """
-        Gets new data for heat map from island
+        Hands the densities of snapshot to the heat maps as they are
 
         Parameters
         ----------
-        island : object
-            Instance of Island
+        snapshot : YearSnapshot
 
         Returns
         -------
 
         """
-        heat_map_herb = self.get_data_heat_map(island, 'num_herbivores')
-        self.heat_map_herb_img_ax.set_data(heat_map_herb)
+        self.heat_map_herb_img_ax.set_data(snapshot.herbivore_density)
+        self.heat_map_carn_img_ax.set_data(snapshot.carnivore_density)
 
-        heat_map_carn = self.get_data_heat_map(island, 'num_carnivores')
-        self.heat_map_carn_img_ax.set_data(heat_map_carn)
+    def update_fig(self, snapshot):
+        """
+        Updates the figure, and shows it if not headless
 
-    def update_fig(self, island):
-        """Updates the figure"""
-        self.update_animals_over_time(island)
-        self.update_heat_maps(island)
-        self.update_year(island)
-        plt.pause(1e-10)
+        Parameters
+        ----------
+        snapshot : YearSnapshot
+        """
+        self.update_animals_over_time(snapshot)
+        self.update_heat_maps(snapshot)
+        self.update_year(snapshot)
+        if not self.headless:
+            self.blit()
+
+    def animated_artists(self):
+        """
+        The artists that change every year, redrawn by blit when the
+        figure is shown.
+
+        Returns
+        -------
+        list
+        """
+        return [self.heat_map_herb_img_ax, self.heat_map_carn_img_ax,
+                self.island_map_ax.title, self.line_herbivore,
+                self.line_carnivore]
+
+    def save_background(self, event):
+        """
+        Keeps the figure without the animated artists after every full
+        draw, and draws them on top.
+
+        Parameters
+        ----------
+        event : matplotlib.backend_bases.DrawEvent
+        """
+        canvas = self.figure.canvas
+        if canvas.is_saving():
+            return
+        self._background = canvas.copy_from_bbox(self.figure.bbox)
+        for artist in self.animated_artists():
+            self.figure.draw_artist(artist)
+
+    def blit(self):
+        """
+        Shows the updated figure. Only the animated artists are drawn, on
+        top of the background kept at the last full draw. The whole
+        figure is drawn if there is no background, the first time and
+        after the axes or the figure changed.
+        """
+        if self._background is None:
+            plt.pause(1e-10)
+            return
+        canvas = self.figure.canvas
+        canvas.restore_region(self._background)
+        for artist in self.animated_artists():
+            self.figure.draw_artist(artist)
+        canvas.blit(self.figure.bbox)
+        canvas.flush_events()
 
     def save_fig(self):
-        """Saves the figure at desired destination"""
+        """
+        Saves the figure at desired destination, or adds it to movie. The
+        figure is drawn again in full on the next update.
+        """
+        self._background = None
+        if self.movie is not None:
+            self.movie.write_frame(self.figure)
+            return
 
         self.figure.savefig(
             f'{self.img_base}_{self.img_num:05d}.{self.img_fmt}',
@@ -429,6 +589,179 @@ class Visuals:
         self.img_num += 1
 
 
+class MovieWriter:
+    """
+    Encodes a movie while the frames are made. Every frame is drawn by
+    savefig as raw RGBA pixels straight into the stdin of ffmpeg, so no
+    image files are written. ffmpeg is started with the first frame, all
+    frames must have the same size.
+
+    Parameters
+    ----------
+    path : str
+        File name of the movie, including the extension
+    fps : int
+        Frames per second the frames are shown with
+
+    Methods
+    -------
+    write_frame
+    close
+    """
+    def __init__(self, path, fps=8):
+        """
+        Initializes the writer, ffmpeg is found and started with the first
+        frame
+
+        Parameters
+        ----------
+        path : str
+        fps : int
+        """
+        self.path = path
+        self.fps = fps
+        self.frame_size = None
+        self.process = None
+
+    def start(self, width, height):
+        """
+        Starts ffmpeg, reading frames of width x height pixels.
+
+        Parameters
+        ----------
+        width : int
+        height : int
+        """
+        self.process = subprocess.Popen(
+            [ffmpeg_path(), '-y', '-loglevel', 'error',
+             '-f', 'rawvideo', '-pix_fmt', 'rgba', '-s', f'{width}x{height}',
+             '-r', str(self.fps), '-i', '-',
+             '-c:v', 'libx264', '-vf', 'fps=25,pad=ceil(iw/2)*2:ceil(ih/2)*2',
+             '-pix_fmt', 'yuv420p', self.path],
+            stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def write_frame(self, figure):
+        """
+        Draws figure and sends the pixels to ffmpeg.
+
+        Parameters
+        ----------
+        figure : matplotlib.figure.Figure
+        """
+        frame_size = tuple(int(size) for size in figure.bbox.size)
+        if self.process is None:
+            self.frame_size = frame_size
+            self.start(*frame_size)
+        elif frame_size != self.frame_size:
+            raise ValueError('All frames of a movie must have the same size')
+        try:
+            figure.savefig(self.process.stdin, format='rgba', dpi=figure.dpi)
+        except BrokenPipeError:
+            self.close()
+
+    def close(self):
+        """Waits for ffmpeg to finish the movie"""
+        if self.process is None:
+            return
+        _, error = self.process.communicate()
+        return_code = self.process.returncode
+        self.process = None
+        if return_code != 0:
+            raise RuntimeError(f'ERROR: ffmpeg failed with: '
+                               f'{error.decode(errors="replace")}')
+
+
+class Renderer:
+    """
+    Updates and saves a headless Visuals in a background thread, so the
+    simulation does not wait for the figure.
+
+    Snapshots are passed through a bounded queue. A snapshot that is only
+    shown is skipped if the queue is full, the next one replaces it. A
+    snapshot that is saved to file is never skipped, so if the thread is
+    more than max_queued snapshots behind, submit waits for it, which
+    keeps the memory used by the snapshots bounded.
+
+    Parameters
+    ----------
+    visuals : Visuals
+        Headless, not used by any other thread until close
+    max_queued : int
+        Size of the queue
+
+    Methods
+    -------
+    submit
+    close
+    """
+    def __init__(self, visuals, max_queued=8):
+        """
+        Starts the thread
+
+        Parameters
+        ----------
+        visuals : Visuals
+        max_queued : int
+        """
+        if not visuals.headless:
+            raise ValueError('Renderer takes headless Visuals only')
+        self.visuals = visuals
+        self.queue = queue.Queue(max_queued)
+        self.skipped = 0
+        self.error = None
+        self.thread = threading.Thread(target=self._render, daemon=True)
+        self.thread.start()
+
+    def submit(self, snapshot, save=False):
+        """
+        Hands a year to the thread.
+
+        Parameters
+        ----------
+        snapshot : YearSnapshot or None
+            None saves the figure as it is
+        save : bool
+            If True the figure is saved after the update
+        """
+        if save:
+            self.queue.put((snapshot, save))
+            return
+        try:
+            self.queue.put_nowait((snapshot, save))
+        except queue.Full:
+            self.skipped += 1
+
+    def _render(self):
+        """
+        Runs in the thread until close. After an error the queue is still
+        emptied, so submit never waits for a thread that stopped drawing.
+        """
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                continue
+            snapshot, save = item
+            try:
+                if snapshot is not None:
+                    self.visuals.update_fig(snapshot)
+                if save:
+                    self.visuals.save_fig()
+            except Exception as err:
+                self.error = err
+
+    def close(self):
+        """
+        Waits for all submitted snapshots, and raises the first error the
+        thread ran into.
+        """
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+
 if __name__ == '__main__':
     ini_herbs = [
         {
@@ -444,5 +777,5 @@ if __name__ == '__main__':
     visuals = Visuals(island, 50)
     for _ in range(50):
         island.simulate_one_year()
-        visuals.update_animals_over_time(island)
+        visuals.update_animals_over_time(YearSnapshot.from_island(island))
     plt.show()
\ No newline at end of file
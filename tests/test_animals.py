@@ -7,8 +7,11 @@ __author__ = "Jon-Mikkel Korsvik & Petter Bøe Hørtvedt"
 __email__ = "jonkors@nmbu.no & petterho@nmbu.no"
 
 
-from biosim.animals import BaseAnimal, Carnivore, Herbivore
+from biosim.animals import BaseAnimal, Carnivore, Herbivore, \
+    fitness_calculation, fitness_array, fitness_of, death_mask, \
+    birth_arrays, hunting
 import pytest
+import numpy as np
 import unittest.mock as mock
 
 
@@ -293,3 +296,82 @@ class TestAnimalSpecialCases:
         with mock.patch('random.gauss', return_negative):
             animal = BaseAnimal()
             assert animal.weight == 0
+
+
+class TestBatchedFitness:
+    def test_fitness_array(self):
+        ages = [0, 5, 40, 80]
+        weights = [8.0, 20.0, 0.0, 35.5]
+        fitness = fitness_array(Herbivore.phi_age, ages, Herbivore.a_half,
+                                Herbivore.phi_weight, weights,
+                                Herbivore.w_half)
+        assert len(fitness) == 4
+        assert fitness[2] == 0
+        for age, weight, value in zip(ages, weights, fitness):
+            if weight > 0:
+                assert value == pytest.approx(fitness_calculation(
+                    Herbivore.phi_age, age, Herbivore.a_half,
+                    Herbivore.phi_weight, weight, Herbivore.w_half))
+
+    def test_fitness_of(self, herbivore_list):
+        fitness = fitness_of(herbivore_list)
+        for herbivore, value in zip(herbivore_list, fitness):
+            assert herbivore._compute_fitness is False
+            assert herbivore.fitness == value
+        herbivore_list[0].weight = 1000
+        assert fitness_of(herbivore_list)[0] > fitness[0]
+        assert len(fitness_of([])) == 0
+
+    def test_fitness_of_keeps_stored_fitness(self):
+        carnivore = Carnivore(5, 20)
+        carnivore._compute_fitness = False
+        carnivore._fitness = 0.25
+        assert fitness_of([carnivore])[0] == 0.25
+
+    def test_death_mask(self):
+        fitness = np.array([0.0, 1.0, 0.5, 0.5])
+        dies = death_mask(fitness, 0.4)
+        assert dies.dtype == bool
+        assert dies[0]
+        assert not dies[1]
+        dies = death_mask(np.full(1000, 0.5), 0.4)
+        assert 100 < dies.sum() < 300
+
+    def test_birth_arrays(self):
+        age = np.array([0, 10, 10, 10])
+        weight = np.array([60.0, 60.0, 8.2, 60.0])
+        fitness = np.array([1.0, 1.0, 1.0, 1.0])
+        parents, newborn_weight = birth_arrays(age, weight, fitness, 10000,
+                                               Herbivore)
+        assert 0 not in parents
+        assert 2 not in parents
+        assert len(parents) == len(newborn_weight)
+        assert (newborn_weight * Herbivore.xi <= weight[parents]).all()
+
+        parents, newborn_weight = birth_arrays(age, weight, fitness, 1,
+                                               Herbivore)
+        assert len(parents) == 0
+
+    def test_hunting(self):
+        herb_fitness = np.array([0.0, 0.0, 0.0, 1.0])
+        herb_weight = np.array([30.0, 30.0, 30.0, 30.0])
+        carn_fitness = np.array([1.0, 1.0, 0.5])
+        carn_weight = np.array([30.0, 30.0, 30.0])
+        carn_age = np.array([5, 5, 5])
+        Carnivore.set_parameters(DeltaPhiMax=0.5)
+        killed, weight = hunting(carn_age, carn_weight, carn_fitness,
+                                 herb_fitness, herb_weight, Carnivore)
+        reset_parameters()
+        # The first carnivore eats two herbivores and is full, the second
+        # eats the last of the least fit ones
+        assert list(killed) == [True, True, True, False]
+        assert weight[0] == 30 + Carnivore.beta * Carnivore.F
+        assert weight[1] == 30 + Carnivore.beta * 30
+        assert weight[2] == 30
+        assert list(carn_weight) == [30.0, 30.0, 30.0]
+
+    def test_hunting_stops_at_fitter_herbivore(self):
+        killed, weight = hunting([5], [30.0], [0.5], [0.6, 0.0], [20, 20],
+                                 Carnivore)
+        assert not killed.any()
+        assert weight[0] == 30
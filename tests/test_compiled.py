@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+"""
+"""
+
+__author__ = "Jon-Mikkel Korsvik & Petter Bøe Hørtvedt"
+__email__ = "jonkors@nmbu.no & petterho@nmbu.no"
+
+import pytest
+import numpy as np
+from biosim.compiled import (
+    CompiledIsland, fitness_kernel, graze_kernel, hunt_kernel,
+    birth_kernel, migrate_kernel, death_kernel, age_kernel, seed_kernels
+)
+from biosim.animals import Herbivore, Carnivore, fitness_array
+from biosim.landscape import grazing
+
+
+def test_fitness_kernel():
+    age = np.array([0, 5, 50])
+    weight = np.array([10.0, 0.0, 30.0])
+    expected = fitness_array(Herbivore.phi_age, age, Herbivore.a_half,
+                             Herbivore.phi_weight, weight, Herbivore.w_half)
+    fitness = fitness_kernel(age, weight, Herbivore.phi_age,
+                             Herbivore.a_half, Herbivore.phi_weight,
+                             Herbivore.w_half)
+    assert fitness == pytest.approx(expected)
+
+
+def test_graze_kernel_same_as_grazing():
+    cell = np.array([0, 0, 0, 2, 2])
+    weight = np.full(5, 20.0)
+    fodder = np.array([25.0, 5.0, 100.0])
+    intake, fodder_left = grazing(cell, 10.0, fodder)
+    graze_kernel(cell, weight, fodder, 10.0, 0.5)
+    assert fodder == pytest.approx(fodder_left)
+    assert weight == pytest.approx(20.0 + 0.5 * intake)
+
+
+def test_hunt_kernel():
+    herb_cell = np.array([0, 0, 1])
+    herb_fitness = np.array([0.0, 0.1, 0.0])
+    herb_weight = np.array([30.0, 30.0, 30.0])
+    carn_cell = np.array([0])
+    carn_weight = np.array([20.0])
+    killed = hunt_kernel(herb_cell, herb_fitness, herb_weight,
+                         carn_cell, np.array([5]), carn_weight,
+                         np.array([1.0]), 50.0, 0.75, 0.5,
+                         Carnivore.phi_age, Carnivore.a_half,
+                         Carnivore.phi_weight, Carnivore.w_half)
+    assert killed.tolist() == [True, True, False]
+    assert carn_weight[0] == pytest.approx(20.0 + 0.75 * 50)
+
+
+def test_birth_kernel():
+    seed_kernels(1)
+    cell = np.zeros(4, dtype=np.int64)
+    age = np.array([0, 5, 5, 5])
+    weight = np.array([80.0, 80.0, 80.0, 1.0])
+    born_cell, newborn_weight = birth_kernel(
+        cell, age, weight, np.ones(4), np.array([4]), 1.0, 3.5, 8.0, 1.5,
+        0.1, 1.2)
+    assert len(born_cell) == 2
+    assert (born_cell == 0).all()
+    assert weight[0] == 80.0 and weight[3] == 1.0
+    assert weight[1:3].sum() == pytest.approx(160 - 1.2 * newborn_weight.sum())
+
+
+def test_migrate_kernel():
+    seed_kernels(1)
+    cell = np.zeros(100, dtype=np.int64)
+    probabilities = np.array([[0.0, 0.0, 0.0, 1.0], [0.0, 0.0, 0.0, 0.0]])
+    neighbours = np.array([[0, 0, 0, 1], [1, 1, 0, 1]])
+    migrate_kernel(cell, np.ones(100), 0.5, probabilities, neighbours)
+    assert 0 < cell.sum() < 100
+    assert set(cell.tolist()) == {0, 1}
+
+
+def test_death_kernel():
+    seed_kernels(1)
+    dies = death_kernel(np.array([0.0, 1.0, 1.0]), 0.9)
+    assert dies.tolist() == [True, False, False]
+
+
+def test_age_kernel():
+    age = np.array([0, 3])
+    weight = np.array([10.0, 20.0])
+    age_kernel(age, weight, 0.1)
+    assert age.tolist() == [1, 4]
+    assert weight == pytest.approx([9.0, 18.0])
+
+
+class TestCompiledIsland:
+    def test_simulate_one_year(self, plain_map_string, ini_herbs, ini_carns):
+        island = CompiledIsland(plain_map_string, ini_herbs,
+                                store_stats=True)
+        island.add_population(ini_carns)
+        for _ in range(3):
+            island.simulate_one_year()
+        assert island.year == 3
+        assert island.num_animals == len(island.herbivores) + len(
+            island.carnivores)
+        assert (island.fodder >= 0).all()
+
+    def test_reproducible(self, plain_map_string, ini_herbs):
+        weights = []
+        for _ in range(2):
+            np.random.seed(2)
+            island = CompiledIsland(plain_map_string, ini_herbs)
+            for _ in range(5):
+                island.simulate_one_year()
+            weights.append(island.herbivores.weight)
+        assert np.array_equal(*weights)
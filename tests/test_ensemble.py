@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+"""
+"""
+
+__author__ = "Jon-Mikkel Korsvik & Petter Bøe Hørtvedt"
+__email__ = "jonkors@nmbu.no & petterho@nmbu.no"
+
+import pytest
+import numpy as np
+from biosim.ensemble import (
+    Ensemble, configuration_grid, run_configuration
+)
+from biosim.island import Island
+from biosim.simulation import BioSim
+from biosim.animals import Herbivore
+
+
+@pytest.fixture
+def small_map():
+    return "OOOO\nOJSO\nOOOO"
+
+
+@pytest.fixture
+def small_pop():
+    return [{'loc': (1, 1),
+             'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                     for _ in range(20)]}]
+
+
+def test_configuration_grid(small_map):
+    grid = configuration_grid(
+        [1, 2], animal_parameters=[None, {'Herbivore': {'F': 20}}],
+        island_map=small_map)
+    assert len(grid) == 4
+    assert grid[0] == {'island_map': small_map, 'seed': 1,
+                       'animal_parameters': {}, 'landscape_parameters': {}}
+    assert grid[3]['animal_parameters'] == {'Herbivore': {'F': 20}}
+    assert grid[3]['seed'] == 2
+
+
+def test_run_configuration_isolates_parameters(small_map, small_pop):
+    defaults = Island.default_parameters()
+    series = run_configuration(
+        0, {'island_map': small_map, 'ini_pop': small_pop, 'seed': 1,
+            'animal_parameters': {'Herbivore': {'F': 20}}}, 3, defaults)
+    assert series.shape == (4, 2)
+    assert series[0].tolist() == [20, 0]
+    assert Herbivore.F == defaults['Herbivore'].F
+
+
+def test_ensemble_same_as_bio_sim(small_map, small_pop):
+    grid = configuration_grid([1, 2], island_map=small_map,
+                              ini_pop=small_pop, engine='columnar')
+    series = Ensemble(grid, 4, num_workers=2).run()
+    assert series.shape == (2, 5, 2)
+
+    sim = BioSim(island_map=small_map, ini_pop=small_pop, seed=2,
+                 engine='columnar')
+    sim.clean_simulation(4)
+    assert series[1, -1, 0] == sim.num_animals_per_species['Herbivore']
+
+
+def test_ensemble_stream(small_map, small_pop):
+    grid = configuration_grid([1, 2, 3], island_map=small_map,
+                              ini_pop=small_pop)
+    records = list(Ensemble(grid, 2, num_workers=2).stream())
+    assert len(records) == 3 * 3
+    assert sorted((index, year) for index, year, _, _ in records) == [
+        (index, year) for index in range(3) for year in range(3)]
+
+
+def test_ensemble_raises_errors_from_runs(small_map):
+    grid = configuration_grid([1], island_map=small_map,
+                              ini_pop=[{'loc': (0, 0), 'pop': []}])
+    with pytest.raises(ValueError):
+        Ensemble(grid, 2, num_workers=1).run()
+
+
+@pytest.mark.parametrize('engine', ['parallel', 'spreadsheet'])
+def test_ensemble_refuses_engine(small_map, small_pop, engine):
+    grid = configuration_grid([1], island_map=small_map, ini_pop=small_pop,
+                              engine=engine)
+    with pytest.raises(ValueError):
+        Ensemble(grid, 2, num_workers=1)
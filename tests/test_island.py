@@ -7,6 +7,7 @@ __author__ = "Jon-Mikkel Korsvik & Petter Bøe Hørtvedt"
 __email__ = "jonkors@nmbu.no & petterho@nmbu.no"
 
 import pytest
+import numpy as np
 from biosim.island import *
 from biosim.landscape import *
 
@@ -40,6 +41,33 @@ class TestIsland:
         assert test_island.num_animals_per_species['Carnivore'] == 20
         assert test_island.num_animals_per_species['Herbivore'] == 200
 
+    def test_animal_columns(self, test_island):
+        columns = test_island.animal_columns()
+        age, weight, cell = columns['Herbivore']
+        assert len(age) == test_island.num_animals_per_species['Herbivore']
+        island = Island(test_island.map_string(), [])
+        island.add_animal_columns(columns)
+        assert island.num_animals_per_cell['Herbivore'].tolist() == \
+            test_island.num_animals_per_cell['Herbivore'].tolist()
+        assert sorted(island.animal_columns()['Carnivore'][1]) == \
+            sorted(columns['Carnivore'][1])
+
+    def test_animal_count(self, test_island, ini_herbs, ini_carns):
+        herbs = len(ini_herbs[0]['pop'])
+        carns = len(ini_carns[0]['pop'])
+        assert test_island.num_animals_per_species == {'Herbivore': herbs,
+                                                       'Carnivore': carns}
+        test_island.map[(1, 1)].herbivores = []
+        assert test_island.num_animals_per_species['Herbivore'] == herbs
+        test_island.reset_animal_count()
+        assert test_island.num_animals_per_species['Herbivore'] == 0
+
+        for _ in range(5):
+            test_island.simulate_one_year()
+        counted = test_island.num_animals_per_species
+        test_island.reset_animal_count()
+        assert counted == test_island.num_animals_per_species
+
     def test_update_data_list(self, test_island):
         test_island.simulate_one_year()
         assert test_island.herbivore_tot_data[0] == 100
@@ -76,6 +104,40 @@ class TestIsland:
                             ini_pop=ini_herbs)
             island.simulate_one_year()
 
+    def test_landscape_grid(self, plain_map_string, ini_herbs):
+        island = Island(plain_map_string, ini_herbs)
+        assert island.landscape.shape == (3, 4)
+        assert island.landscape_types[island.landscape[1, 1]] is Jungle
+        assert island.landscape_types[island.landscape[1, 2]] is Savanna
+        assert island.landscape_types[island.landscape[0, 0]] is Ocean
+        assert island.cell_parameter('f_max')[
+            island.flat_index((1, 1))] == Jungle.f_max
+        assert island.passable_cells.tolist() == [
+            island.flat_index((1, 1)), island.flat_index((1, 2))]
+        assert [index for index, _ in island.live_cells()] == \
+            island.passable_cells.tolist()
+
+    def test_landscape_raster(self, plain_map_string):
+        island = Island(plain_map_string, [])
+        palette = np.arange(15).reshape(5, 3)
+        raster = island.landscape_raster(palette)
+        assert raster.dtype == np.uint8
+        assert raster.shape == (3, 4, 3)
+        assert raster[0, 0].tolist() == [0, 1, 2]
+        assert raster[1, 2].tolist() == palette[3].tolist()
+        assert island.landscape_raster(palette) is raster
+        assert not raster.flags.writeable
+        assert island.landscape_raster(palette + 1) is not raster
+
+    def test_fodder_array(self, plain_map_string, ini_herbs):
+        island = Island(plain_map_string, ini_herbs)
+        index = island.flat_index((1, 2))
+        assert island.fodder[index] == island.map[(1, 2)].fodder
+        island.map[(1, 2)].fodder = 10
+        assert island.fodder[index] == 10
+        island.fodder[index] = 20
+        assert island.map[(1, 2)].fodder == 20
+
     def test_probability_calc(self, ini_herbs, ini_carns):
         island = Island('OOOO\nOJJO\nOOOO', ini_carns)
         prob_list = island.probability_calc((1, 1), 'Herbivore')
@@ -94,6 +156,32 @@ class TestIsland:
 
         # Could test that the sum always is 1
 
+    def test_make_neighbours(self, plain_map_string, ini_herbs):
+        island = Island(plain_map_string, ini_herbs)
+        index = island.flat_index((1, 2))
+        neighbours = [island.position(neighbour)
+                      for neighbour in island.neighbours[index]]
+        assert neighbours == [(0, 2), (2, 2), (1, 1), (1, 3)]
+        assert island.neighbours.shape == (island.num_cells, 4)
+
+    def test_propensities(self, test_island):
+        propensities = test_island.propensities()
+        cell = test_island.map[(1, 1)]
+        index = test_island.flat_index((1, 1))
+        assert propensities['Herbivore'][index] == pytest.approx(
+            cell.propensity['Herbivore'])
+        assert propensities['Carnivore'][index] == pytest.approx(
+            cell.propensity['Carnivore'])
+        assert propensities['Herbivore'][0] == 0
+
+    def test_migration_probabilities(self, test_island):
+        probabilities = test_island.migration_probabilities()
+        for animal in ('Herbivore', 'Carnivore'):
+            sums = probabilities[animal].sum(axis=1)
+            assert ((sums == 0) | np.isclose(sums, 1)).all()
+            assert sums[test_island.flat_index((1, 1))] == pytest.approx(1)
+            assert sums[0] == 0
+
     def test_add_herb_to_new_cell(self, test_island):
         loc = (1, 2)
         assert test_island.map[loc].num_herbivores == 0
@@ -129,15 +217,50 @@ class TestIsland:
         assert num_animals12 * 0.8 < num_animals11 < num_animals12 * 1.2
 
     def test_ready_for_new_year(self, test_island):
+        test_island.double_buffered = False
         test_island.simulate_one_year()
         assert test_island.map[(1, 1)].fodder < test_island.map[(1, 1)].f_max
-        assert test_island.map[(1, 1)]._calculate_propensity is False
         assert test_island.map[(1, 1)].herbivores[0]._has_moved is True
         test_island.ready_for_new_year()
         assert test_island.map[(1, 1)].fodder == test_island.map[(1, 1)].f_max
         assert test_island.map[(1, 1)]._calculate_propensity is True
         assert test_island.map[(1, 1)].herbivores[0]._has_moved is False
 
+    def test_grow_fodder(self, plain_map_string, ini_herbs):
+        island = Island(plain_map_string, ini_herbs)
+        savanna = island.map[(1, 2)]
+        expected = Savanna()
+        for cell in (island.map[(1, 1)], savanna, expected):
+            cell.fodder = 50
+        island.grow_fodder()
+        expected.grow()
+        assert island.map[(1, 1)].fodder == Jungle.f_max
+        assert savanna.fodder == pytest.approx(expected.fodder)
+        assert island.map[(0, 0)].fodder == 0
+
+        island.set_landscape_parameters('S', {'f_max': 100, 'alpha': 1})
+        island.grow_fodder()
+        assert savanna.fodder == 100
+        assert Savanna.f_max == 300
+
+    def test_migrate_double_buffered(self, test_island):
+        assert test_island.double_buffered
+        herbivores = list(test_island.map[(1, 1)].herbivores)
+        for _ in range(5):
+            test_island.migrate()
+        for cell in test_island.map.values():
+            for herbivore in cell.herbivores:
+                assert herbivore._has_moved is False
+        assert test_island.num_animals == 110
+        # (1, 1) has no diagonal neighbour, a single pass cannot reach (2, 2)
+        test_island = Island('OOOO\nOJJO\nOJJO\nOOOO',
+                             [{'loc': (1, 1), 'pop': [
+                                 {"species": "Herbivore", "age": 5,
+                                  "weight": 40} for _ in range(200)]}])
+        test_island.migrate()
+        assert test_island.map[(2, 2)].num_animals == 0
+        assert test_island.num_animals == 200
+
     def test_add_population(self, test_island):
         assert test_island.map[(1, 2)].num_animals == 0
         test_island.add_population([{'loc': (1, 2),
@@ -183,6 +306,20 @@ class TestIsland:
         assert test_island.map[(1, 1)].herbivores[-1].weight > 40
         assert test_island.map[(1, 1)].carnivores[0].weight > 20
 
+    def test_feed_herbivores(self, plain_map_string, ini_herbs):
+        island = Island(plain_map_string, ini_herbs)
+        island.add_population([{'loc': (1, 2),
+                                'pop': [{"species": "Herbivore",
+                                         "age": 5,
+                                         "weight": 40}]}])
+        island.feed_herbivores()
+        assert island.map[(1, 1)].fodder == 0
+        assert island.map[(1, 2)].fodder == Savanna.f_max - Herbivore.F
+        fed = [herbivore for herbivore in island.map[(1, 1)].herbivores
+               if herbivore.weight > 40]
+        assert len(fed) == Jungle.f_max / Herbivore.F
+        assert island.map[(1, 2)].herbivores[0].weight > 40
+
     def test_procreate(self, test_island):
         test_island.procreate()
         assert test_island.num_animals > 110
@@ -207,14 +344,14 @@ class TestIsland:
         assert test_island.map[(1, 1)].carnivores[-1].weight < 20
 
     def test_die(self, test_island):
-        Herbivore.set_parameters(omega=1)
+        test_island.set_animal_parameters('Herbivore', {'omega': 1})
         num_before = test_island.num_animals
         for _ in range(10):
             test_island.die()
         num_after = test_island.num_animals
         print(num_before, num_after)
         assert num_before > num_after
-        Herbivore.set_parameters(omega=0.4)
+        assert Herbivore.omega == 0.4
 
     def test_year(self, test_island):
         assert test_island.year == 0
@@ -227,6 +364,20 @@ class TestIsland:
         test_island.simulate_one_year()
         assert True
 
+    def test_stats_keep_every_cell(self):
+        island_map = "OOOOO\nOJJJO\nOOOOO"
+        ini_pop = [{"loc": (1, col),
+                    "pop": [{"species": "Herbivore", "age": 500,
+                             "weight": 40} for _ in range(20)]}
+                   for col in (1, 2, 3)]
+        island = Island(island_map, ini_pop, store_stats=True)
+        island.set_animal_parameters('Herbivore', {'omega': 1})
+        island.die()
+        death = island.stats['death'][:, 0]
+        for col in (1, 2, 3):
+            assert death[island.flat_index((1, col))] > 0
+        assert death.sum() == 60 - island.num_animals
+
 
 class TestIslandSpecialCases:
     def test_species_separated(self, test_island):
@@ -237,3 +388,113 @@ class TestIslandSpecialCases:
                     assert isinstance(herbivore, Herbivore)
                 for carnivore in cell.carnivores:
                     assert isinstance(carnivore, Carnivore)
+
+
+class TestColumnarIsland:
+    def test_init(self, plain_map_string, ini_herbs):
+        island = ColumnarIsland(plain_map_string, ini_herbs)
+        assert len(island.herbivores) == 100
+        assert len(island.carnivores) == 0
+        assert island.num_cells == 12
+        assert all(cell.num_animals == 0 for cell in island.map.values())
+        assert set(island.herbivores.cell) == {island.flat_index((1, 1))}
+
+    def test_position(self, plain_map_string, ini_herbs):
+        island = ColumnarIsland(plain_map_string, ini_herbs)
+        assert island.position(island.flat_index((2, 3))) == (2, 3)
+
+    def test_add_population(self, plain_map_string, ini_herbs, ini_carns):
+        island = ColumnarIsland(plain_map_string, ini_herbs)
+        island.add_population(ini_carns)
+        assert island.num_animals_per_species == {'Herbivore': 100,
+                                                  'Carnivore': 10}
+        with pytest.raises(ValueError):
+            island.add_population([{'loc': (0, 0), 'pop': []}])
+        with pytest.raises(ValueError):
+            island.add_population([{'loc': (1, 1),
+                                    'pop': [{"species": "Herbivore",
+                                             "age": 0.5,
+                                             "weight": 40}]}])
+        with pytest.raises(ValueError):
+            island.add_population([{'loc': (1, 1),
+                                    'pop': [{"species": "Omnivore",
+                                             "age": 5,
+                                             "weight": 40}]}])
+        assert len(island.herbivores) == 100
+
+    def test_num_animals_per_cell(self, plain_map_string, ini_herbs):
+        island = ColumnarIsland(plain_map_string, ini_herbs)
+        herbivores = island.num_animals_per_cell['Herbivore']
+        assert herbivores.shape == (3, 4)
+        assert herbivores[1, 1] == 100
+        assert herbivores.sum() == 100
+        island = Island(plain_map_string, ini_herbs)
+        assert (island.num_animals_per_cell['Herbivore'] == herbivores).all()
+
+    @pytest.mark.parametrize('island_class', [Island, ColumnarIsland])
+    def test_density(self, island_class, plain_map_string, ini_herbs,
+                     ini_carns):
+        island = island_class(plain_map_string, ini_herbs + ini_carns)
+        density = island.density
+        assert density.shape == (2, 3, 4)
+        assert density[0, 1, 1] == 100
+        assert density[1, 1, 1] == 10
+        island.simulate_one_year()
+        assert island.density is density
+        assert density[0].sum() == island.num_animals_per_species['Herbivore']
+        assert (density[1] ==
+                island.num_animals_per_cell['Carnivore']).all()
+
+    def test_feed(self, plain_map_string, ini_herbs, ini_carns):
+        island = ColumnarIsland(plain_map_string, ini_herbs)
+        island.add_population(ini_carns)
+        island.herbivores.weight[:] = 5
+        island.feed()
+        # 800 fodder is enough for 80 herbivores with appetite 10
+        assert island.map[(1, 1)].fodder == 0
+        assert (island.herbivores.weight > 5).sum() <= 80
+        assert len(island.herbivores) < 100
+        assert island.carnivores.weight.sum() > 10 * 20
+
+    def test_procreate(self, plain_map_string, ini_herbs):
+        island = ColumnarIsland(plain_map_string, ini_herbs)
+        island.procreate()
+        assert len(island.herbivores) > 100
+        assert (island.herbivores.age[100:] == 0).all()
+        assert (island.herbivores.weight[:100] <= 40).all()
+
+    def test_migrate(self, test_island, ini_herbs, ini_carns):
+        geogr = "OOOO\nOJJO\nOJJO\nOOOO"
+        island = ColumnarIsland(geogr, ini_herbs)
+        island.add_population(ini_carns)
+        island.simulate_one_year()
+        per_cell = island.num_animals_per_cell
+        animals = per_cell['Herbivore'] + per_cell['Carnivore']
+        assert animals[1, 2] > 5
+        assert animals[2, 1] > 5
+        assert animals[2, 2] == 0
+        assert animals[0, :].sum() == 0
+
+    def test_die(self, plain_map_string, ini_herbs):
+        island = ColumnarIsland(plain_map_string, ini_herbs)
+        island.herbivores.weight[:50] = 0
+        island.die()
+        assert len(island.herbivores) <= 50
+
+    def test_simulate_one_year_with_stats(self, plain_map_string, ini_herbs):
+        island = ColumnarIsland(plain_map_string, ini_herbs,
+                                store_stats=True)
+        for _ in range(5):
+            island.simulate_one_year()
+        assert island.year == 5
+        assert len(island.herbivore_tot_data) == 6
+        assert island.stats['year'] == 5
+        assert island.stats['birth'].shape == (island.num_cells, 2)
+        years = island.stats_file.years()
+        assert years['year'].tolist() == [0, 1, 2, 3, 4]
+        assert years['Herbivore_alive'][0] == island.herbivore_tot_data[0]
+        cells = island.stats_file.cells()
+        first_year = cells['year'] == 0
+        assert cells['Herbivore_birth'][first_year].sum() == \
+            years['Herbivore_birth'][0] > 0
+        assert island.flat_index((1, 1)) in cells['cell'][first_year]
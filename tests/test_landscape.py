@@ -8,10 +8,61 @@ __email__ = "jonkors@nmbu.no & petterho@nmbu.no"
 
 
 from biosim.landscape import BaseCell, Ocean, Mountain, Desert, \
-    Savanna, Jungle
+    Savanna, Jungle, grazing, choose_destinations, choose_new_location
 from biosim.animals import Herbivore, Carnivore
 import pytest
 import math
+import numpy as np
+import unittest.mock as mock
+
+
+def test_grazing():
+    cells = np.array([0, 0, 0, 2, 2])
+    fodder = np.array([25.0, 100.0, 300.0])
+    intake, fodder_left = grazing(cells, 10, fodder)
+    assert list(intake) == [10, 10, 5, 10, 10]
+    assert list(fodder_left) == [0, 100, 280]
+
+
+def test_grazing_same_as_sequential_feeding():
+    appetite = np.array([10.0, 3.5, 7.25, 10.0, 1.0, 12.0])
+    cells = np.array([1, 1, 1, 1, 3, 3])
+    fodder = np.array([0.0, 21.3, 5.0, 12.5])
+    intake, fodder_left = grazing(cells, appetite, fodder)
+
+    expected_fodder = fodder.copy()
+    for index, cell in enumerate(cells):
+        eaten = min(appetite[index], expected_fodder[cell])
+        assert intake[index] == pytest.approx(eaten)
+        expected_fodder[cell] -= eaten
+    assert fodder_left == pytest.approx(expected_fodder)
+    assert len(grazing([], 10, fodder)[0]) == 0
+
+
+def test_choose_destinations():
+    choice = choose_destinations([0.25, 0, 0.75, 0], 1000)
+    assert len(choice) == 1000
+    assert set(choice) <= {0, 2}
+    assert 150 < (choice == 0).sum() < 350
+
+    rows = np.array([[0, 0, 1.0, 0], [1.0, 0, 0, 0], [0, 0.5, 0, 0.5]])
+    choice = choose_destinations(rows)
+    assert choice[0] == 2
+    assert choice[1] == 0
+    assert choice[2] in (1, 3)
+
+
+def test_choose_destinations_never_picks_zero_probability():
+    almost_one = [0.3, 0.3, 0.3999999, 0]
+    with mock.patch('numpy.random.random',
+                    lambda size=None: np.full(size, 0.99999999)):
+        assert choose_destinations(almost_one, 3).tolist() == [2, 2, 2]
+        assert choose_destinations([almost_one]).tolist() == [2]
+
+
+def test_choose_new_location():
+    prob_list = [((0, 1), 0), ((2, 1), 1.0), ((1, 0), 0), ((1, 2), 0)]
+    assert choose_new_location(prob_list) == (2, 1)
 
 
 class TestBaseCell:
@@ -38,6 +89,14 @@ class TestBaseCell:
         cell.grow()
         assert True
 
+    def test_bind_fodder(self):
+        cell = Savanna()
+        fodder = np.zeros(3)
+        cell.bind_fodder(fodder, 1)
+        assert fodder[1] == Savanna.f_max
+        cell.fodder = 5
+        assert fodder[1] == 5
+
     def test_add_animals(self, animal_list):
         jungle = Jungle()
         jungle.add_animals(animal_list)
@@ -117,6 +176,17 @@ class TestBaseCell:
                                                              prob_carn=None)
         assert len(moved_herb) == 0 and len(moved_carn) == 0
 
+    def test_emigrate(self, herbivore_list):
+        staying, movers, choice = BaseCell.emigrate(herbivore_list,
+                                                    [0, 1.0, 0, 0])
+        assert len(staying) + len(movers) == len(herbivore_list)
+        assert len(choice) == len(movers)
+        assert (choice == 1).all()
+        for herbivore in herbivore_list:
+            assert herbivore._has_moved
+        staying, movers, choice = BaseCell.emigrate(staying, [1.0, 0, 0, 0])
+        assert len(movers) == 0
+
     def test_procreate(self, jungle_with_animals, animal_list):
         # Works only with two or more herbivores and one or zero carnivores
         num_herbivores_start = jungle_with_animals.num_herbivores
@@ -131,6 +201,18 @@ class TestBaseCell:
         assert jungle_with_animals.num_herbivores > num_herbivores_start
         assert jungle_with_animals.num_carnivores > num_carnivores_start
 
+    def test_give_birth(self, herbivore_list):
+        for herbivore in herbivore_list:
+            herbivore.weight = 60
+        offspring = BaseCell.give_birth(herbivore_list)
+        assert len(offspring) > 0
+        for baby in offspring:
+            assert isinstance(baby, Herbivore)
+            assert baby.age == 0
+        lost = sum(60 - herbivore.weight for herbivore in herbivore_list)
+        assert lost == pytest.approx(
+            sum(baby.weight for baby in offspring) * Herbivore.xi)
+
     def test_lose_weight(self, jungle_with_animals):
         herbivore0_weight = jungle_with_animals.herbivores[0].weight
         herbivore1_weight = jungle_with_animals.herbivores[1].weight
@@ -191,6 +273,15 @@ class TestBaseCell:
         assert carnivore0 not in jungle.carnivores
         assert carnivore1 in jungle.carnivores
 
+    def test_split_dead(self, herbivore_list):
+        survivors, dead = BaseCell.split_dead(herbivore_list)
+        assert len(survivors) + len(dead) == len(herbivore_list)
+        assert not set(survivors) & set(dead)
+        herbivore_list[0].weight = 0
+        survivors, dead = BaseCell.split_dead(herbivore_list)
+        assert herbivore_list[0] in dead
+        assert BaseCell.split_dead([]) == ([], [])
+
     def test_propensity(self):
         jungle = Jungle()
         jungle.add_migrated_herb(Herbivore())
@@ -275,6 +366,7 @@ class TestSavanna:
         savanna.grow()
         assert savanna.fodder < Savanna.f_max
         assert savanna.fodder > 0
+        assert Savanna.growth_rate() == Savanna.alpha
 
 
 class TestJungle:
@@ -289,6 +381,7 @@ class TestJungle:
         jungle.fodder = 0
         jungle.grow()
         assert jungle.fodder == Jungle.f_max
+        assert Jungle.growth_rate() == 1
 
     def test_feed_herbivore(self, animal_list):
         test_jungle = Jungle()
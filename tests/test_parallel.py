@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+"""
+"""
+
+__author__ = "Jon-Mikkel Korsvik & Petter Bøe Hørtvedt"
+__email__ = "jonkors@nmbu.no & petterho@nmbu.no"
+
+import pickle
+import pytest
+import numpy as np
+from biosim.parallel import ParallelIsland, BandIsland, split_rows
+from biosim.animals import Herbivore
+
+
+@pytest.fixture
+def band_map_string():
+    return "OOOOO\nOJJJO\nOJJJO\nOJJJO\nOJJJO\nOOOOO"
+
+
+@pytest.fixture
+def band_pop():
+    return [{'loc': (y_cord, 2),
+             'pop': [{'species': species, 'age': 5, 'weight': 30}
+                     for species in ['Herbivore'] * 20 + ['Carnivore'] * 4]}
+            for y_cord in range(1, 5)]
+
+
+def test_split_rows():
+    assert split_rows(6, 3) == [(0, 2), (2, 4), (4, 6)]
+    assert split_rows(5, 2) == [(0, 3), (3, 5)]
+    assert split_rows(2, 8) == [(0, 1), (1, 2)]
+
+
+class TestBandIsland:
+    def test_halo(self, band_map_string):
+        band = BandIsland(band_map_string, 0, 3)
+        assert band.first_cell == 0
+        assert band.stop_cell == 15
+        cells = np.arange(15, 20)
+        band.second_half([(cells, np.zeros(5), np.full(5, 3),
+                           np.full(5, 1), np.full(5, 90.0))])
+        assert band.num_animals_per_cell['Herbivore'][3].tolist() == [3] * 5
+        assert band.meat_per_cell()[cells].tolist() == [90.0] * 5
+        assert band.fodder[cells].tolist() == [0] * 5
+
+    def test_first_half_takes_parameters(self, band_map_string):
+        band = BandIsland(band_map_string, 0, 3)
+        parameters = dict(band.parameters)
+        parameters['Herbivore'] = parameters['Herbivore'].replace(F=20)
+        band.first_half(parameters, {'Herbivore': ([], [], []),
+                                     'Carnivore': ([], [], [])}, 1)
+        assert band.herbivores.parameters.F == 20
+        assert Herbivore.F == 10
+
+    def test_emigrants_leave_band(self, band_map_string):
+        band = BandIsland(band_map_string, 0, 3)
+        band.load(band.fodder[0:15], ([5] * 50, [40.0] * 50, [12] * 50),
+                  ([], [], []))
+        emigrants, dead, counts, fodder, sums = band.second_half([])
+        age, weight, cell = emigrants['Herbivore']
+        assert (cell >= 15).all()
+        assert len(band.herbivores) + len(cell) + len(
+            dead['Herbivore']) == 50
+        assert counts['Herbivore'].sum() == len(band.herbivores)
+        assert len(fodder) == 15
+        assert sums['Herbivore'][0] == len(band.herbivores)
+
+
+class TestParallelIsland:
+    def test_map_string(self, band_map_string, band_pop):
+        island = ParallelIsland(band_map_string, band_pop)
+        assert island.map_string() == band_map_string
+
+    def test_simulate_and_gather(self, band_map_string, band_pop):
+        island = ParallelIsland(band_map_string, band_pop)
+        island.num_workers = 2
+        for _ in range(3):
+            island.simulate_one_year()
+        assert island.running
+        assert island.bands == [(0, 3), (3, 6)]
+        counted = island.num_animals_per_species
+        per_cell = island.num_animals_per_cell
+        assert island.herbivore_tot_data[-1] == counted['Herbivore']
+        assert (island.density[1] == per_cell['Carnivore']).all()
+
+        island.gather()
+        assert not island.running
+        assert island.num_animals_per_species == counted
+        for name, counts in island.num_animals_per_cell.items():
+            assert (counts == per_cell[name]).all()
+
+    def test_context_manager(self, band_map_string, band_pop):
+        with ParallelIsland(band_map_string, band_pop) as island:
+            island.num_workers = 2
+            island.simulate_one_year()
+            processes = list(island._processes)
+            assert island.running
+        assert not island.running
+        assert not any(process.is_alive() for process in processes)
+
+    def test_del_stops_workers(self, band_map_string, band_pop):
+        island = ParallelIsland(band_map_string, band_pop)
+        island.num_workers = 2
+        island.simulate_one_year()
+        processes = list(island._processes)
+        del island
+        assert not any(process.is_alive() for process in processes)
+
+    def test_reproducible(self, band_map_string, band_pop):
+        results = []
+        for _ in range(2):
+            np.random.seed(4)
+            island = ParallelIsland(band_map_string, band_pop)
+            island.num_workers = 3
+            for _ in range(4):
+                island.simulate_one_year()
+            island.gather()
+            results.append(np.sort(island.herbivores.weight))
+        assert np.array_equal(*results)
+
+    def test_gather_does_not_change_run(self, band_map_string, band_pop):
+        results = []
+        for gather_at in (None, 2):
+            island = ParallelIsland(band_map_string, band_pop,
+                                    rng=np.random.default_rng(5))
+            island.num_workers = 3
+            for year in range(4):
+                if year == gather_at:
+                    island.gather()
+                island.simulate_one_year()
+            island.gather()
+            results.append(island.herbivores.weight)
+        assert np.array_equal(*results)
+
+    def test_stats(self, band_map_string, band_pop):
+        island = ParallelIsland(band_map_string, band_pop, store_stats=True)
+        island.num_workers = 2
+        island.simulate_one_year()
+        years = island.stats_file.years()
+        assert years['Herbivore_birth'][0] > 0
+        count, weight_sum = island.animal_sums()['Herbivore'][:2]
+        assert count == island.num_animals_per_species['Herbivore']
+        assert years['Herbivore_weight_mean'][0] == pytest.approx(
+            weight_sum / count)
+        island.close()
+
+    def test_pickle(self, band_map_string, band_pop):
+        island = ParallelIsland(band_map_string, band_pop)
+        island.num_workers = 2
+        island.simulate_one_year()
+        num_animals = island.num_animals
+        loaded = pickle.loads(pickle.dumps(island))
+        assert loaded.num_animals == num_animals
+        loaded.simulate_one_year()
+        assert loaded.running
+        loaded.close()
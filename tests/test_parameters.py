@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+"""
+"""
+
+__author__ = "Jon-Mikkel Korsvik & Petter Bøe Hørtvedt"
+__email__ = "jonkors@nmbu.no & petterho@nmbu.no"
+
+import pytest
+from biosim.parameters import AnimalParameters, LandscapeParameters
+from biosim.animals import Herbivore, Carnivore
+from biosim.landscape import Savanna, Ocean
+from biosim.island import Island
+
+
+class TestAnimalParameters:
+    def test_from_class(self):
+        herb = AnimalParameters.from_class(Herbivore)
+        carn = AnimalParameters.from_class(Carnivore)
+        assert herb.F == Herbivore.F
+        assert carn.DeltaPhiMax == Carnivore.DeltaPhiMax
+        assert herb.w_birth != carn.w_birth
+
+    def test_replace(self):
+        herb = AnimalParameters.from_class(Herbivore)
+        changed = herb.replace(mu=0.5, eta=1)
+        assert changed.mu == 0.5
+        assert changed.eta == 1
+        assert herb.mu == Herbivore.mu
+        with pytest.raises(TypeError):
+            herb.replace(badabom=1)
+        with pytest.raises(ValueError):
+            herb.replace(eta=2)
+        with pytest.raises(ValueError):
+            herb.replace(DeltaPhiMax=0)
+        with pytest.raises(ValueError):
+            herb.replace(mu=0.5, lambda_=-1)
+
+    def test_immutable(self):
+        herb = AnimalParameters.from_class(Herbivore)
+        with pytest.raises(AttributeError):
+            herb.F = 20
+
+
+class TestLandscapeParameters:
+    def test_from_class(self):
+        assert LandscapeParameters.from_class(Savanna) == (True, 300, 0.3)
+        assert LandscapeParameters.from_class(Ocean).passable is False
+
+    def test_replace(self):
+        savanna = LandscapeParameters.from_class(Savanna)
+        assert savanna.replace(f_max=100).f_max == 100
+        with pytest.raises(TypeError):
+            savanna.replace(maximus=42)
+        with pytest.raises(ValueError):
+            savanna.replace(passable=1)
+        with pytest.raises(ValueError):
+            savanna.replace(alpha=-1)
+
+
+def test_islands_do_not_share_parameters():
+    island_map = "OOOO\nOJSO\nOOOO"
+    island1 = Island(island_map, [])
+    island2 = Island(island_map, [])
+    island1.set_animal_parameters('Carnivore', {'F': 100})
+    island1.set_landscape_parameters('S', {'passable': False})
+    assert island2.parameters['Carnivore'].F == Carnivore.F
+    assert island1.map[(1, 2)].parameters['Carnivore'].F == 100
+    assert island1.passable_cells.tolist() == [5]
+    assert island2.passable_cells.tolist() == [5, 6]
+    with pytest.raises(ValueError):
+        island1.add_population([{'loc': (1, 2), 'pop': []}])
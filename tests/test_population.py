@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+"""
+"""
+
+__author__ = "Jon-Mikkel Korsvik & Petter Bøe Hørtvedt"
+__email__ = "jonkors@nmbu.no & petterho@nmbu.no"
+
+import pytest
+import numpy as np
+from biosim.population import Population, cell_slices
+from biosim.animals import Herbivore, Carnivore
+
+
+class TestPopulation:
+    def test_init(self):
+        population = Population(Herbivore)
+        assert len(population) == 0
+        assert population.species is Herbivore
+        for column in Population.columns:
+            assert len(getattr(population, column)) == 0
+
+    def test_add(self):
+        population = Population(Herbivore)
+        population.add([5, 10], [20.0, 30.0], 7)
+        population.add([1], [8.0], [3])
+        assert len(population) == 3
+        assert list(population.age) == [5, 10, 1]
+        assert list(population.weight) == [20.0, 30.0, 8.0]
+        assert list(population.cell) == [7, 7, 3]
+
+    def test_fitness_same_as_animal(self):
+        population = Population(Carnivore)
+        population.add([0, 5, 30, 2], [6.0, 20.0, 50.0, 0.0], 0)
+        for age, weight, fitness in zip(population.age, population.weight,
+                                        population.fitness):
+            carnivore = Carnivore(age, weight)
+            assert fitness == pytest.approx(carnivore.fitness)
+        assert population.fitness[-1] == 0
+
+    def test_keep(self):
+        population = Population(Herbivore)
+        population.add([1, 2, 3], [10.0, 20.0, 30.0], [0, 1, 2])
+        population.keep(np.array([True, False, True]))
+        assert list(population.age) == [1, 3]
+        assert list(population.cell) == [0, 2]
+        population.keep(np.array([1, 0]))
+        assert list(population.weight) == [30.0, 10.0]
+
+    def test_count_and_weight_per_cell(self):
+        population = Population(Herbivore)
+        population.add([1, 2, 3], [10.0, 20.0, 30.0], [0, 2, 2])
+        assert list(population.count_per_cell(4)) == [1, 0, 2, 0]
+        assert list(population.weight_per_cell(4)) == [10.0, 0, 50.0, 0]
+
+
+def test_cell_slices():
+    slices = cell_slices(np.array([1, 1, 4, 4, 4, 6]))
+    assert slices == [(1, 0, 2), (4, 2, 5), (6, 5, 6)]
+    assert cell_slices(np.array([], dtype=int)) == []
@@ -8,6 +8,9 @@ __email__ = "jonkors@nmbu.no & petterho@nmbu.no"
 
 import pytest
 import os
+import shutil
+import numpy as np
+import matplotlib.pyplot as plt
 from biosim.simulation import BioSim
 from biosim.landscape import Savanna
 from biosim.animals import Herbivore
@@ -19,7 +22,7 @@ def test_save_sim():
     sim = BioSim()
     sim.clean_simulation(10)
     sim.save_sim(save_load_name)
-    assert os.path.isfile(save_load_name + '.pkl')
+    assert os.path.isfile(save_load_name + '.npz')
 
 
 def test_load_sim():
@@ -30,43 +33,100 @@ def test_load_sim():
     assert sim.year == 10
 
 
+@pytest.mark.parametrize('engine', ['object', 'columnar'])
+def test_load_sim_restores_island(engine):
+    sim = BioSim(seed=1)
+    sim.set_animal_parameters('Herbivore', {'F': 15})
+    sim.clean_simulation(5)
+    sim.save_sim(save_load_name)
+    loaded = BioSim(island_save_name=save_load_name, engine=engine)
+    assert loaded.num_animals_per_species == sim.num_animals_per_species
+    assert (loaded.island.fodder == sim.island.fodder).all()
+    assert loaded.island.parameters == sim.island.parameters
+    assert loaded.island.herbivore_tot_data == sim.island.herbivore_tot_data
+    columns = sim.island.animal_columns()
+    for species, (age, weight, cell) in loaded.island.animal_columns().items():
+        order = np.lexsort((weight, cell))
+        expected = columns[species]
+        expected_order = np.lexsort((expected[1], expected[2]))
+        assert (age[order] == expected[0][expected_order]).all()
+        assert (weight[order] == expected[1][expected_order]).all()
+
+
+
+@pytest.mark.parametrize('engine', ['object', 'columnar'])
+def test_load_sim_continues_identically(engine):
+    sim = BioSim(seed=3, engine=engine)
+    sim.clean_simulation(6)
+    sim.save_sim(save_load_name)
+    sim.clean_simulation(4)
+    loaded = BioSim(island_save_name=save_load_name, engine=engine)
+    loaded.clean_simulation(4)
+    assert loaded.island.herbivore_tot_data == sim.island.herbivore_tot_data
+    assert (loaded.island.fodder == sim.island.fodder).all()
+    for species, columns in sim.island.animal_columns().items():
+        for column, loaded_column in zip(
+                columns, loaded.island.animal_columns()[species]):
+            assert np.array_equal(column, loaded_column)
+
+
+def test_load_sim_restores_random_state():
+    sim = BioSim(seed=1)
+    sim.clean_simulation(2)
+    sim.save_sim(save_load_name)
+    expected = np.random.random(3)
+    BioSim(island_save_name=save_load_name)
+    assert (np.random.random(3) == expected).all()
+
 class TestSimulation:
     def test_init(self):
         BioSim()
         assert True
 
     def test_set_animal_parameters(self):
-        BioSim.set_animal_parameters('Herbivore', {'mu': 3.9})
-        assert Herbivore.mu == 3.9
+        sim = BioSim()
+        sim.set_animal_parameters('Herbivore', {'mu': 3.9})
+        assert sim.island.parameters['Herbivore'].mu == 3.9
+        assert Herbivore.mu == 0.25
         with pytest.raises(KeyError):
-            BioSim.set_animal_parameters('Shark',
-                                         {'mu': 0.5, 'lambda_': 0.5})
+            sim.set_animal_parameters('Shark', {'mu': 0.5, 'lambda_': 0.5})
         with pytest.raises(ValueError):
-            BioSim.set_animal_parameters('Herbivore',
-                                         {'mu': 45, 'lambda_': -5})
+            sim.set_animal_parameters('Herbivore', {'mu': 45, 'lambda_': -5})
         with pytest.raises(TypeError):
-            BioSim.set_animal_parameters('Herbivore',
-                                         {'mu': 45, 'badabom': 0.5})
-        assert Herbivore.mu == 3.9
-        BioSim.set_animal_parameters('Herbivore', {'mu': 0.4})
-        assert Herbivore.mu == 0.4
+            sim.set_animal_parameters('Herbivore',
+                                      {'mu': 45, 'badabom': 0.5})
+        assert sim.island.parameters['Herbivore'].mu == 3.9
+        sim.set_animal_parameters('Herbivore', {'mu': 0.4})
+        assert sim.island.parameters['Herbivore'].mu == 0.4
 
     def test_set_landscape_parameters(self):
-        BioSim.set_landscape_parameters('S', {'alpha': 3.9})
-        assert Savanna.alpha == 3.9
+        sim = BioSim()
+        sim.set_landscape_parameters('S', {'alpha': 3.9})
+        assert sim.island.parameters['S'].alpha == 3.9
+        assert Savanna.alpha == 0.3
         with pytest.raises(KeyError):
-            BioSim.set_landscape_parameters('B',
-                                            {'alpha': 42, 'f_max': 42})
+            sim.set_landscape_parameters('B', {'alpha': 42, 'f_max': 42})
         with pytest.raises(ValueError):
-            BioSim.set_landscape_parameters('S',
-                                            {'alpha': 42, 'f_max': -5})
+            sim.set_landscape_parameters('S', {'alpha': 42, 'f_max': -5})
         with pytest.raises(TypeError):
-            BioSim.set_landscape_parameters('S',
-                                            {'alpha': 42, 'maximus': 42})
-        assert Savanna.alpha == 3.9
-        BioSim.set_landscape_parameters('S',
-                                            {'alpha': 0.3, 'f_max': 300})
-        assert Savanna.alpha == 0.3
+            sim.set_landscape_parameters('S', {'alpha': 42, 'maximus': 42})
+        assert sim.island.parameters['S'].alpha == 3.9
+        sim.set_landscape_parameters('S', {'alpha': 0.3, 'f_max': 300})
+        assert sim.island.parameters['S'].alpha == 0.3
+
+    def test_parameters_per_simulation(self):
+        sim1 = BioSim(seed=1)
+        sim2 = BioSim(seed=1)
+        sim1.set_animal_parameters('Herbivore', {'omega': 1})
+        sim1.set_landscape_parameters('J', {'f_max': 100})
+        assert sim2.island.parameters['Herbivore'].omega == 0.4
+        assert sim2.island.parameters['J'].f_max == 800
+        sim1.clean_simulation(1)
+        sim2.clean_simulation(1)
+        jungle = sim1.island.landscape.ravel() == list(
+            sim1.island.map_params).index('J')
+        assert sim1.island.fodder[jungle].max() <= 100
+        assert sim2.island.fodder[jungle].max() == 800
 
     def test_clean_simulation(self):
         sim = BioSim()
@@ -122,6 +182,35 @@ class TestSimulation:
         animal_distribution = sim.animal_distribution
         assert True
 
+    def test_island_stats(self, tmpdir):
+        sim = BioSim(seed=1, store_stats=True, stats_path=str(tmpdir))
+        sim.clean_simulation(3)
+        death_herb, death_carn, birth_herb, birth_carn = sim.island_stats()
+        assert list(death_herb) == [0, 1, 2]
+        assert all(0 <= rate <= 1 for rate in death_herb.values())
+        assert tmpdir.join('years.year.bin').size() == 3 * 8
+
+    def test_headless_simulate(self, tmpdir):
+        figures = plt.get_fignums()
+        sim = BioSim(seed=1, img_base=str(tmpdir.join('img')), headless=True)
+        sim.simulate(4, vis_years=1, img_years=2)
+        assert sim.year == 4
+        assert sorted(path.basename for path in tmpdir.listdir()) == [
+            'img_00000.png', 'img_00001.png', 'img_00002.png']
+        assert plt.get_fignums() == figures
+
+    @pytest.mark.skipif(shutil.which('ffmpeg') is None,
+                        reason='ffmpeg is not on PATH')
+    def test_stream_movie(self, tmpdir):
+        img_base = str(tmpdir.join('sim'))
+        sim = BioSim(seed=1, img_base=img_base, headless=True,
+                     stream_movie=True)
+        sim.simulate(3)
+        sim.simulate(2)
+        sim.make_movie()
+        assert [path.basename for path in tmpdir.listdir()] == ['sim.mp4']
+        assert tmpdir.join('sim.mp4').size() > 0
+
     def test_make_movie(self):
         sim = BioSim(img_base=r'test_sim')
         sim.simulate(10)
@@ -147,6 +236,37 @@ class TestSimulation:
 
 
 class TestSimulationSpecialCases:
+    def test_columnar_engine(self):
+        sim = BioSim(seed=1, engine='columnar')
+        assert sim.num_animals_per_species == {'Herbivore': 150,
+                                               'Carnivore': 40}
+        sim.clean_simulation(10)
+        assert sim.year == 10
+        distribution = sim.animal_distribution
+        assert distribution['Herbivore'].sum() == \
+            sim.num_animals_per_species['Herbivore']
+        with pytest.raises(ValueError):
+            BioSim(engine='spreadsheet')
+
+    def test_parallel_engine(self):
+        sim = BioSim(seed=1, engine='parallel', num_workers=2)
+        sim.clean_simulation(5)
+        assert sim.year == 5
+        assert not sim.island.running
+        distribution = sim.animal_distribution
+        assert distribution['Herbivore'].sum() == \
+            sim.num_animals_per_species['Herbivore']
+        assert len(sim.island.herbivores) == \
+            sim.num_animals_per_species['Herbivore']
+
+    def test_sim_owns_generator(self):
+        sim = BioSim(seed=1)
+        assert sim.island.rng is sim.rng
+        assert sim.island.map[(2, 7)].rng is sim.rng
+        state = sim.rng.bit_generator.state
+        sim.clean_simulation(1)
+        assert sim.rng.bit_generator.state != state
+
     def test_sim_with_seed(self):
         sim1 = BioSim(seed=1)
         sim1.clean_simulation(10)
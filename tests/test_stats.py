@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+"""
+"""
+
+__author__ = "Jon-Mikkel Korsvik & Petter Bøe Hørtvedt"
+__email__ = "jonkors@nmbu.no & petterho@nmbu.no"
+
+import pytest
+import numpy as np
+from biosim.stats import StatsFile, weight_age_sums, moments
+
+
+def test_weight_age_sums():
+    sums = weight_age_sums([1, 3], [2.0, 4.0])
+    assert sums.tolist() == [2, 6, 20, 4]
+    assert (weight_age_sums([1], [2.0]) + weight_age_sums([3], [4.0])
+            == sums).all()
+
+
+def test_moments():
+    assert moments(weight_age_sums([1, 3], [2.0, 4.0])) == (3, 1, 2)
+    assert all(np.isnan(moments(np.zeros(4))))
+
+
+class TestStatsFile:
+    @staticmethod
+    def append_year(stats_file, year):
+        birth = {'Herbivore': np.array([0, 2, 0, 0]),
+                 'Carnivore': np.array([0, 0, 0, 1])}
+        death = {'Herbivore': np.array([0, 1, 0, 0]),
+                 'Carnivore': np.zeros(4, dtype=int)}
+        sums = {'Herbivore': weight_age_sums([1, 3], [2.0, 4.0]),
+                'Carnivore': np.zeros(4)}
+        stats_file.append(year, {'Herbivore': 5, 'Carnivore': 0},
+                          birth, death, sums)
+
+    def test_append_and_read(self):
+        stats_file = StatsFile()
+        assert len(stats_file.years()['year']) == 0
+        self.append_year(stats_file, 0)
+        self.append_year(stats_file, 1)
+
+        years = stats_file.years()
+        assert years['year'].tolist() == [0, 1]
+        assert years['Herbivore_alive'].tolist() == [5, 5]
+        assert years['Herbivore_birth'].tolist() == [2, 2]
+        assert years['Carnivore_birth'].tolist() == [1, 1]
+        assert years['Herbivore_weight_mean'][0] == 3
+        assert np.isnan(years['Carnivore_age_mean'][0])
+
+        cells = stats_file.cells()
+        assert cells['year'].tolist() == [0, 0, 1, 1]
+        assert cells['cell'].tolist() == [1, 3, 1, 3]
+        assert cells['Herbivore_death'].tolist() == [1, 0, 1, 0]
+
+    def test_path(self, tmpdir):
+        path = str(tmpdir.join('stats'))
+        self.append_year(StatsFile(path), 0)
+        assert StatsFile(path, append=True).years()['year'].tolist() == [0]
+        assert len(StatsFile(path).years()['year']) == 0
@@ -7,7 +7,13 @@ __author__ = "Jon-Mikkel Korsvik & Petter Bøe Hørtvedt"
 __email__ = "jonkors@nmbu.no & petterho@nmbu.no"
 
 import pytest
-from biosim.visualization import Visuals
+import shutil
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from biosim.visualization import (
+    Visuals, YearSnapshot, Renderer, MovieWriter, ffmpeg_path
+)
 
 
 class TestVisualization:
@@ -18,15 +24,13 @@ class TestVisualization:
     def test_init(self):
         assert False
 
-    def test_empty_nested_list(self):
-        assert False
-
     def test_setup_graphics(self):
         assert False
 
     def test_make_color_pixels(self, test_island):
         class_ = Visuals(test_island, 10)
-        assert class_.pixel_colors[0][0] == (0.0, 1.0, 1.0)
+        assert class_.pixel_colors[0, 0].tolist() == [0, 255, 255]
+        assert Visuals(test_island, 10).pixel_colors is class_.pixel_colors
 
     def test_draw_geography(self, test_island):
         class_ = Visuals(test_island, 10)
@@ -61,3 +65,102 @@ class TestVisualization:
 
     def test_save_fig(self):
         assert False
+
+
+class TestHeadless:
+    def test_headless_figure_not_in_pyplot(self, test_island):
+        figures = plt.get_fignums()
+        visuals = Visuals(test_island, 10, headless=True)
+        assert plt.get_fignums() == figures
+        assert isinstance(visuals.figure.canvas, FigureCanvasAgg)
+
+    def test_update_fig(self, test_island):
+        visuals = Visuals(test_island, 10, headless=True)
+        test_island.simulate_one_year()
+        snapshot = YearSnapshot.from_island(test_island)
+        visuals.update_fig(snapshot)
+        assert visuals.herbivores_over_time_data[1] == \
+            test_island.herbivore_tot_data[-1]
+        assert (visuals.heat_map_herb_img_ax.get_array() ==
+                snapshot.herbivore_density).all()
+
+    def test_renderer_saves_every_frame(self, test_island, tmpdir):
+        visuals = Visuals(test_island, 5, img_base=str(tmpdir.join('img')),
+                          headless=True)
+        renderer = Renderer(visuals, max_queued=1)
+        for _ in range(5):
+            test_island.simulate_one_year()
+            renderer.submit(YearSnapshot.from_island(test_island, copy=True),
+                            save=True)
+        renderer.close()
+        assert len(tmpdir.listdir()) == 5
+        assert visuals.island_map_ax.get_title() == ' Year: 5'
+
+    def test_renderer_raises_error_on_close(self, test_island):
+        visuals = Visuals(test_island, 5, img_base='no_such_dir/img',
+                          headless=True)
+        renderer = Renderer(visuals, max_queued=1)
+        for _ in range(3):
+            renderer.submit(None, save=True)
+        with pytest.raises(OSError):
+            renderer.close()
+
+    def test_renderer_takes_headless_only(self, test_island):
+        with pytest.raises(ValueError):
+            Renderer(Visuals(test_island, 5))
+
+
+class TestMovieWriter:
+    def test_ffmpeg_not_found(self, monkeypatch):
+        monkeypatch.setitem(plt.rcParams, 'animation.ffmpeg_path',
+                            'no_such_ffmpeg')
+        with pytest.raises(RuntimeError):
+            ffmpeg_path()
+
+    @pytest.mark.skipif(shutil.which('ffmpeg') is None,
+                        reason='ffmpeg is not on PATH')
+    def test_write_frames(self, test_island, tmpdir):
+        visuals = Visuals(test_island, 3, headless=True)
+        visuals.movie = MovieWriter(str(tmpdir.join('movie.mp4')))
+        for _ in range(3):
+            test_island.simulate_one_year()
+            visuals.update_fig(YearSnapshot.from_island(test_island))
+            visuals.save_fig()
+        visuals.movie.close()
+        assert visuals.img_num == 0
+        assert [path.basename for path in tmpdir.listdir()] == ['movie.mp4']
+        assert tmpdir.join('movie.mp4').size() > 0
+
+
+class TestLineGraph:
+    def test_buffers_are_nan_padded(self, test_island):
+        visuals = Visuals(test_island, 10, headless=True)
+        assert visuals.herbivores_over_time_data.dtype == float
+        assert len(visuals.years) == 11
+        assert visuals.num_points == 1
+        assert np.isnan(visuals.herbivores_over_time_data[1:]).all()
+        assert len(visuals.line_herbivore.get_xdata()) == 1
+
+    def test_grows_past_num_years(self, test_island):
+        visuals = Visuals(test_island, 2, headless=True)
+        for _ in range(5):
+            test_island.simulate_one_year()
+            visuals.update_animals_over_time(
+                YearSnapshot.from_island(test_island))
+        assert visuals.num_points == 6
+        assert len(visuals.years) >= 6
+        assert visuals.line_carnivore.get_ydata().tolist() == \
+            test_island.carnivore_tot_data
+        assert visuals.animals_over_time_ax.get_xlim()[1] == \
+            len(visuals.years) - 1
+
+    def test_blit_keeps_background(self, test_island):
+        visuals = Visuals(test_island, 5)
+        snapshot = YearSnapshot.from_island(test_island)
+        visuals.update_fig(snapshot)
+        background = visuals._background
+        assert background is not None
+        assert visuals.line_herbivore.get_animated()
+        visuals.update_fig(snapshot)
+        assert visuals._background is background
+        plt.close(visuals.figure)